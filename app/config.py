@@ -0,0 +1,53 @@
+import os
+
+# Storage engine: "memory" (optionally with the write-ahead log below), "sqlite", or "server" to share
+# one storage server process between uvicorn workers
+STORAGE_ENGINE = os.environ.get("STREAMLY_STORAGE", "memory")
+
+# Database file for the sqlite engine; every worker pointing at it shares the same data
+SQLITE_PATH = os.environ.get("STREAMLY_SQLITE_PATH", "streamly.db")
+
+# Unix socket of the storage server (python -m app.storage.server) that the "server" engine connects to
+STORAGE_SOCKET = os.environ.get("STREAMLY_STORAGE_SOCKET", "streamly-storage.sock")
+
+# Shared secret workers authenticate to the storage server with. When unset, the server writes a random
+# key to the socket path plus ".key" (readable by its user only) and workers read it from there.
+STORAGE_AUTHKEY = os.environ.get("STREAMLY_STORAGE_AUTHKEY")
+
+# Directory holding the write-ahead log and snapshots. Persistence is off when unset.
+DATA_DIR = os.environ.get("STREAMLY_DATA_DIR")
+
+# Number of logged mutations between compacting snapshots
+SNAPSHOT_EVERY = int(os.environ.get("STREAMLY_SNAPSHOT_EVERY", "100000"))
+
+# Set to 0 to skip fsync on log writes (faster, but a crash can lose acknowledged writes)
+WAL_FSYNC = os.environ.get("STREAMLY_WAL_FSYNC", "1") != "0"
+
+# Password KDF: "scrypt" or "pbkdf2_sha256". Changing the scheme or cost rehashes passwords on next login.
+PASSWORD_SCHEME = os.environ.get("STREAMLY_PASSWORD_SCHEME", "scrypt")
+
+# scrypt: log2 of the work factor N (default 14); pbkdf2_sha256: iterations (default 600000)
+PASSWORD_COST = int(os.environ["STREAMLY_PASSWORD_COST"]) if "STREAMLY_PASSWORD_COST" in os.environ else None
+
+# Processes used for password hashing; defaults to the CPU count, 0 hashes in the request thread
+PASSWORD_WORKERS = int(os.environ["STREAMLY_PASSWORD_WORKERS"]) if "STREAMLY_PASSWORD_WORKERS" in os.environ else None
+
+# Set to 1 to serialize responses with orjson and encode model lists straight to JSON bytes (needs orjson)
+FAST_JSON = os.environ.get("STREAMLY_FAST_JSON", "0") == "1"
+
+# Memory budget in bytes for each in-memory store's cache of serialized records; 0 disables it
+JSON_CACHE_BYTES = int(os.environ.get("STREAMLY_JSON_CACHE_BYTES", str(64 * 1024 * 1024)))
+
+# Seconds a payment creation response is replayed to retries with the same Idempotency-Key
+IDEMPOTENCY_TTL = float(os.environ.get("STREAMLY_IDEMPOTENCY_TTL", str(24 * 60 * 60)))
+
+# Budget in bytes for the responses kept for Idempotency-Key replays, in the process, the storage
+# server or the SQLite database. With 0 nothing is replayed later, but concurrent retries in one
+# process still share one execution.
+IDEMPOTENCY_CACHE_BYTES = int(os.environ.get("STREAMLY_IDEMPOTENCY_CACHE_BYTES", str(16 * 1024 * 1024)))
+
+# Set to 0 to turn off request metrics and step timers; /metrics then only reports the store gauges
+METRICS = os.environ.get("STREAMLY_METRICS", "1") != "0"
+
+# Bearer token for the /admin endpoints (runtime profiling). They answer 404 while it is unset.
+ADMIN_TOKEN = os.environ.get("STREAMLY_ADMIN_TOKEN")
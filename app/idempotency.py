@@ -0,0 +1,229 @@
+import asyncio
+import itertools
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from fastapi.responses import Response
+
+from . import config
+from .responses import JSONResponse
+from .storage import AsyncRepository, ReplayRepository, replaysDB
+from .storage.base import CLAIM_SECONDS
+
+# Rough cost of one entry beyond its key and body bytes (dict slot, tuple, bytes and str headers)
+ENTRY_OVERHEAD = 200
+
+# Longest Idempotency-Key accepted
+MAX_KEY_LENGTH = 255
+
+# Seconds between checks on a key another worker's request is still running
+WAIT_INTERVAL = 0.01
+
+
+class IdempotencyCache(ReplayRepository):
+    """Responses of completed requests by Idempotency-Key, bounded by age and total size.
+
+    The first request with a key runs. Requests with the same key that arrive while
+    it runs wait for it and get its response instead of running again. A
+    successful (2xx) response is then kept for ttl seconds and replayed to retries
+    with the same key and payload. Failed responses are not kept, since they
+    changed nothing: a later retry runs again. A key sent again with a different
+    payload is refused. Entries are evicted oldest first, which is also expiry
+    order, once the cache grows past maxBytes. With maxBytes 0 nothing is kept,
+    but concurrent retries still share one execution. A claim held for more than
+    CLAIM_SECONDS is given up, so a request that died cannot hold its key. The
+    storage server keeps one of these for all of its workers.
+    """
+
+    # Every call only takes a short lock
+    readsBlock = False
+    writesBlock = False
+
+    def __init__(self, ttl: float, maxBytes: int, clock: Callable[[], float] = time.monotonic):
+        self.ttl = ttl
+        self.maxBytes = maxBytes
+        self._clock = clock
+        # key -> (expires at, payload fingerprint, status code, body)
+        self._entries: "OrderedDict[str, Tuple[float, Hashable, int, bytes]]" = OrderedDict()
+        # key -> (payload fingerprint, claim id, claim expires at, future of (status code, body), or None if the
+        # request raised)
+        self._running: Dict[str, Tuple[Hashable, int, float, Future]] = {}
+        self._claimIds = itertools.count(1)
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.waits = 0
+        self.conflicts = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    async def run(self, key: str, fingerprint: Hashable, execute: Callable[[], Awaitable[Response]]) -> Response:
+        """Return the response for key: replayed, shared with the request already running it, or from execute()"""
+        waited = False
+        while True:
+            with self._lock:
+                outcome, value = self._claim(key, fingerprint, waited)
+                running = self._running.get(key)
+            if outcome == "run":
+                break
+            if outcome == "conflict":
+                return _conflict()
+            if outcome == "replay":
+                return _replay(*value)
+            # Shielded so that a waiter whose client hangs up does not cancel the others' future
+            shared = await asyncio.shield(asyncio.wrap_future(running[3]))
+            if shared is not None:
+                return _replay(*shared)
+            # The request we waited on raised; take its place
+            waited = True
+
+        result = None
+        try:
+            response = await execute()
+            result = (response.status_code, bytes(response.body))
+            return response
+        finally:
+            self.finish(key, value, result)
+
+    def claim(self, key: str, fingerprint: Hashable, waited: bool = False) -> Tuple[str, object]:
+        with self._lock:
+            return self._claim(key, fingerprint, waited)
+
+    def _claim(self, key: str, fingerprint: Hashable, waited: bool) -> Tuple[str, object]:
+        self._expire()
+        entry = self._entries.get(key)
+        running = self._running.get(key)
+        if running is not None and running[2] <= self._clock():
+            # The claim outlived CLAIM_SECONDS; free the key and wake the requests waiting on it
+            del self._running[key]
+            running[3].set_result(None)
+            running = None
+        if entry is None and running is None:
+            self.misses += 1
+            claimId = next(self._claimIds)
+            self._running[key] = (fingerprint, claimId, self._clock() + CLAIM_SECONDS, Future())
+            return "run", claimId
+        if (entry[1] if entry is not None else running[0]) != fingerprint:
+            self.conflicts += 1
+            return "conflict", None
+        if entry is not None:
+            if not waited:
+                self.hits += 1
+            return "replay", (entry[2], entry[3])
+        if not waited:
+            self.waits += 1
+        return "wait", None
+
+    def finish(self, key: str, claimId, result: Optional[Tuple[int, bytes]]) -> None:
+        with self._lock:
+            running = self._running.get(key)
+            if running is None or running[1] != claimId:
+                # The claim ran out and the key was freed (or taken) in the meantime
+                return
+            del self._running[key]
+            if result is not None and 200 <= result[0] < 300:
+                self._put(key, running[0], *result)
+        running[3].set_result(result)
+
+    def _put(self, key: str, fingerprint: Hashable, status: int, body: bytes) -> None:
+        size = len(key) + len(body) + ENTRY_OVERHEAD
+        if size > self.maxBytes:
+            return
+        self._entries[key] = (self._clock() + self.ttl, fingerprint, status, body)
+        self._size += size
+        while self._size > self.maxBytes:
+            self._drop()
+            self.evictions += 1
+
+    def _expire(self) -> None:
+        now = self._clock()
+        while self._entries and next(iter(self._entries.values()))[0] <= now:
+            self._drop()
+            self.expirations += 1
+
+    def _drop(self) -> None:
+        key, entry = self._entries.popitem(last=False)
+        self._size -= len(key) + len(entry[3]) + ENTRY_OVERHEAD
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self) -> Dict[str, object]:
+        """Return entry count, approximate size, requests in flight and the replay counters"""
+        with self._lock:
+            self._expire()
+            answered = self.hits + self.waits + self.misses
+            return {"entries": len(self._entries), "bytes": self._size, "maxBytes": self.maxBytes,
+                    "inFlight": len(self._running), "hits": self.hits, "waits": self.waits, "misses": self.misses,
+                    "hitRate": round((self.hits + self.waits) / answered, 4) if answered else None,
+                    "conflicts": self.conflicts, "evictions": self.evictions, "expirations": self.expirations}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SharedIdempotencyCache:
+    """Idempotency-Key replays kept in the storage every worker shares: the storage server or SQLite.
+
+    Works like IdempotencyCache.run, but claims and kept responses live in a
+    ReplayRepository, so a retry that reaches another worker is still replayed
+    and never runs twice at once. A request whose key is claimed checks back
+    every WAIT_INTERVAL seconds: it replays the response the first request
+    kept, or runs in its place if that request failed or raised.
+    """
+
+    def __init__(self, store: ReplayRepository):
+        self.store = store
+        self._calls = AsyncRepository(store)
+
+    async def run(self, key: str, fingerprint: Hashable, execute: Callable[[], Awaitable[Response]]) -> Response:
+        """Return the response for key: replayed, or from execute() once this request holds the key"""
+        waited = False
+        while True:
+            outcome, value = await self._calls.write(self.store.claim, key, fingerprint, waited)
+            if outcome == "run":
+                break
+            if outcome == "conflict":
+                return _conflict()
+            if outcome == "replay":
+                return _replay(*value)
+            waited = True
+            await asyncio.sleep(WAIT_INTERVAL)
+
+        result = None
+        try:
+            response = await execute()
+            result = (response.status_code, bytes(response.body))
+            return response
+        finally:
+            # Shielded so that a client hanging up does not leave the key claimed until the claim runs out
+            await asyncio.shield(self._calls.write(self.store.finish, key, value, result))
+
+    def stats(self) -> Dict[str, object]:
+        return self.store.stats()
+
+    def clear(self) -> None:
+        self.store.clear()
+
+
+def _conflict() -> Response:
+    return JSONResponse(status_code=422,
+                        content={"message": "Idempotency-Key was already used with a different request"})
+
+def _replay(status: int, body: bytes) -> Response:
+    return Response(body, status_code=status, media_type="application/json", headers={"Idempotent-Replayed": "true"})
+
+def validKey(key: Optional[str]) -> bool:
+    """Check an Idempotency-Key header is present and between 1 and MAX_KEY_LENGTH characters"""
+    return key is not None and 0 < len(key) <= MAX_KEY_LENGTH
+
+
+# Shared by every worker on the storage server or SQLite engines; per process with the memory engine
+paymentReplays = (IdempotencyCache(config.IDEMPOTENCY_TTL, config.IDEMPOTENCY_CACHE_BYTES) if replaysDB is None
+                  else SharedIdempotencyCache(replaysDB))
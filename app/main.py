@@ -1,13 +1,57 @@
 from fastapi import FastAPI
-from .routes.users import router as usersRouter
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import Response
+from starlette.concurrency import run_in_threadpool
+from . import config
+from .idempotency import paymentReplays
+from .metrics import CONTENT_TYPE, Gauge, MetricsMiddleware, registry
+from .responses import JSONResponse
+from .routes.users import router as usersRouter, signupValidationHandler
 from .routes.payments import router as paymentsRouter
+from .routes.admin import router as adminRouter
+from .storage import paymentsDB, usersDB
 
-app = FastAPI()
+app = FastAPI(default_response_class=JSONResponse)
+
+# Signup rule failures keep their 400/403/409 codes instead of FastAPI's generic 422
+app.add_exception_handler(RequestValidationError, signupValidationHandler)
 
 # Include the users router
 app.include_router(usersRouter)
 app.include_router(paymentsRouter)
+app.include_router(adminRouter)
+
+if config.METRICS:
+    app.add_middleware(MetricsMiddleware)
+
+def _readStores() -> dict:
+    """Store sizes and replay cache counters; on SQLite or the storage server each read waits on I/O"""
+    return {"users": len(usersDB), "payments": len(paymentsDB), "idempotency": paymentReplays.stats()}
+
+# Read in a worker thread when /metrics is scraped rather than kept up to date by every write
+_readings = {"users": 0, "payments": 0, "idempotency": {"bytes": 0, "inFlight": 0}}
+
+registry.register(Gauge("streamly_store_records", "Records held by each store", ("store",),
+                        collect=lambda: {("users",): _readings["users"], ("payments",): _readings["payments"]}))
+registry.register(Gauge("streamly_idempotency_cache_bytes", "Approximate size of the kept Idempotency-Key responses",
+                        collect=lambda: {(): _readings["idempotency"]["bytes"]}))
+registry.register(Gauge("streamly_idempotency_requests_in_flight",
+                        "Requests with an Idempotency-Key still running (their retries wait for them)",
+                        collect=lambda: {(): _readings["idempotency"]["inFlight"]}))
 
 @app.get("/", tags=["Root"])
-def root():
-    return {"message": "Welcome to Streamly API", "docs": "/docs"}
\ No newline at end of file
+async def root():
+    return {"message": "Welcome to Streamly API", "docs": "/docs"}
+
+@app.get("/stats/cache", tags=["Root"])
+async def cache_stats():
+    """Report the record cache counters of each store (null when the engine has no cache) and the replay cache's"""
+    return await run_in_threadpool(lambda: {"users": usersDB.cacheStats(), "payments": paymentsDB.cacheStats(),
+                                            "idempotency": paymentReplays.stats()})
+
+@app.get("/metrics", tags=["Root"], response_class=Response, responses={200: {"content": {CONTENT_TYPE: {}}}})
+async def metrics():
+    """Request counts, latency histograms, step timers and store sizes in the Prometheus text format"""
+    _readings.update(await run_in_threadpool(_readStores))
+    # Rendered on the event loop thread, the only one that updates the metrics
+    return Response(registry.render(), media_type=CONTENT_TYPE)
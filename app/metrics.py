@@ -0,0 +1,218 @@
+from bisect import bisect_left
+from time import perf_counter
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from . import config
+
+# Latency histogram bucket bounds in seconds, from 100 µs to 10 s
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0)
+
+# Content type of the Prometheus text exposition format
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _labels(names: Tuple[str, ...], values: Tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic count per label set, counted with inc() or read from a callback at scrape time"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelNames: Tuple[str, ...] = (),
+                 collect: Optional[Callable[[], Dict[Tuple, float]]] = None):
+        self.name = name
+        self.help = help
+        self.labelNames = labelNames
+        self._collect = collect
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, *labels) -> None:
+        self._values[labels] = self._values.get(labels, 0) + 1
+
+    def value(self, *labels) -> float:
+        values = self._collect() if self._collect is not None else self._values
+        return values.get(labels, 0)
+
+    def samples(self) -> Iterable[Tuple[str, str, float]]:
+        values = self._collect() if self._collect is not None else dict(self._values)
+        for labels, value in sorted(values.items()):
+            yield self.name, _labels(self.labelNames, labels), value
+
+
+class Gauge(Counter):
+    """Current value per label set, read from a callback at scrape time"""
+
+    kind = "gauge"
+
+
+class Histogram:
+    """Distribution of observed values per label set, over fixed bucket bounds.
+
+    Each label set keeps per-bucket counts (not cumulative, so an observation
+    touches one slot) followed by the sum and the count. The cumulative
+    counts Prometheus expects are only added up when the metrics are scraped.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelNames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelNames = labelNames
+        self.buckets = buckets
+        self._series: Dict[Tuple, List[float]] = {}
+
+    def observe(self, value: float, *labels) -> None:
+        try:
+            series = self._series[labels]
+        except KeyError:
+            series = self._series.setdefault(labels, [0] * (len(self.buckets) + 3))
+        series[bisect_left(self.buckets, value)] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def count(self, *labels) -> int:
+        series = self._series.get(labels)
+        return series[-1] if series else 0
+
+    def counts(self) -> Dict[Tuple, int]:
+        """Number of observations per label set"""
+        return {labels: values[-1] for labels, values in list(self._series.items())}
+
+    def samples(self) -> Iterable[Tuple[str, str, float]]:
+        series = sorted((labels, list(values)) for labels, values in list(self._series.items()))
+        for labels, values in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), values):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                yield self.name + "_bucket", _labels(self.labelNames, labels, f'le="{le}"'), cumulative
+            yield self.name + "_sum", _labels(self.labelNames, labels), values[-2]
+            yield self.name + "_count", _labels(self.labelNames, labels), values[-1]
+
+
+class Registry:
+    """The metric families exposed at /metrics, rendered in the Prometheus text format"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> bytes:
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(f"{name}{labels} {_number(value)}" for name, labels, value in metric.samples())
+        return ("\n".join(lines) + "\n").encode()
+
+
+class _Timer:
+    __slots__ = ("step", "began")
+
+    def __init__(self, step: str):
+        self.step = step
+
+    def __enter__(self):
+        self.began = perf_counter()
+
+    def __exit__(self, *exc):
+        stepSeconds.observe(perf_counter() - self.began, self.step)
+
+
+class _NoTimer:
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc):
+        pass
+
+_noTimer = _NoTimer()
+
+def timed(step: str):
+    """Context manager recording how long a hot step of a request took, under streamly_step_duration_seconds.
+
+    Only use it on the event loop thread, never inside code handed to a worker
+    thread: the metrics take no locks.
+    """
+    return _Timer(step) if config.METRICS else _noTimer
+
+
+class MetricsMiddleware:
+    """ASGI middleware counting and timing every HTTP request by route template, method and status.
+
+    A plain ASGI wrapper rather than BaseHTTPMiddleware, which would add a task
+    and a stream per request. Requests that match no route share the
+    "unmatched" label, so unknown paths cannot grow the label sets. The latency
+    histogram is also the request counter: streamly_http_requests_total is
+    read from its per-status counts at scrape time, so a request costs one
+    observation.
+    """
+
+    # Requests being handled, across every instance
+    inFlight = 0
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status = 500
+
+        async def sendWithStatus(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        began = perf_counter()
+        MetricsMiddleware.inFlight += 1
+        try:
+            await self.app(scope, receive, sendWithStatus)
+        except Exception:
+            route = scope.get("route")
+            requestExceptions.inc(route.path if route is not None else "unmatched")
+            raise
+        finally:
+            MetricsMiddleware.inFlight -= 1
+            route = scope.get("route")
+            requestSeconds.observe(perf_counter() - began, scope["method"],
+                                   route.path if route is not None else "unmatched", status)
+
+
+# Every metric is updated from the event loop thread only (the middleware and
+# the async route handlers), so none of them needs a lock
+registry = Registry()
+
+requestSeconds = registry.register(Histogram(
+    "streamly_http_request_duration_seconds", "Time from receiving a request to sending its last byte",
+    ("method", "route", "status")))
+requests = registry.register(Counter(
+    "streamly_http_requests_total", "HTTP requests answered, by method, route and status code",
+    ("method", "route", "status"), collect=requestSeconds.counts))
+requestExceptions = registry.register(Counter(
+    "streamly_http_request_exceptions_total", "HTTP requests that raised an unhandled exception, by route",
+    ("route",)))
+requestsInFlight = registry.register(Gauge(
+    "streamly_http_requests_in_flight", "HTTP requests being handled",
+    collect=lambda: {(): MetricsMiddleware.inFlight}))
+stepSeconds = registry.register(Histogram(
+    "streamly_step_duration_seconds", "Time spent in individual steps of request handling", ("step",)))
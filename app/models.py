@@ -1,5 +1,15 @@
-from pydantic import BaseModel, ConfigDict
-from typing import Optional
+from pydantic import BaseModel, ConfigDict, ValidationInfo, field_validator
+from pydantic_core import PydanticCustomError
+from typing import Dict, List, Optional
+
+# SIGNUP_ERRORS is re-exported for the signup routes
+from .validation import SIGNUP_ERRORS, SIGNUP_RULES, SignupRule
+
+# The signup rules UserCreate checks for each field; uniqueness is left to the route, which has the store
+_FIELD_RULES: Dict[str, List[SignupRule]] = {
+    field: [rule for rule in SIGNUP_RULES if rule.field == field and rule.check is not None]
+    for field in ("username", "password", "email", "birthdate", "ccNumber")
+}
 
 class User(BaseModel):
     username: str
@@ -22,6 +32,26 @@ class User(BaseModel):
         }
     )
 
+class UserCreate(User):
+    """Signup body: the create_user rules run as field validators, so every failing field is reported in one pass.
+
+    The rules come from SIGNUP_RULES, which the bulk endpoint checks too, so both accept the same input.
+    Stored users keep using User, since their password field holds a hash.
+    """
+
+    @field_validator("username", "password", "email", "birthdate", "ccNumber")
+    @classmethod
+    def signupRules(cls, value, info: ValidationInfo):
+        # The first failing rule of each field is reported, as in create_user's order
+        for rule in _FIELD_RULES[info.field_name]:
+            if not rule.check(value):
+                raise PydanticCustomError(rule.error, rule.message)
+        return value
+
+class LoginRequest(BaseModel):
+    username: str
+    password: str
+
 class Payment(BaseModel):
     id: Optional[int] = 0
     ccNumber: str
@@ -0,0 +1,199 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from . import config
+
+SALT_BYTES = 16
+SCRYPT_R = 8
+SCRYPT_P = 1
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.b64encode(data).decode().rstrip("=")
+
+def _b64decode(text: str) -> bytes:
+    return base64.b64decode(text + "=" * (-len(text) % 4))
+
+def _derive(scheme: str, password: str, salt: bytes, params: Dict[str, int]) -> bytes:
+    """Run the KDF; module-level so it can be sent to pool worker processes"""
+    if scheme == "scrypt":
+        n, r, p = 1 << params["ln"], params["r"], params["p"]
+        # scrypt needs about 128 * r * n bytes; allow twice that
+        return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p,
+                              maxmem=256 * r * n + (1 << 20), dklen=32)
+    if scheme == "pbkdf2_sha256":
+        return hashlib.pbkdf2_hmac("sha256", password.encode(), salt, params["i"])
+    raise ValueError(f"Unknown password hashing scheme {scheme!r}")
+
+def _deriveMany(scheme: str, passwords: List[str], salts: List[bytes], params: Dict[str, int]) -> List[bytes]:
+    """Run the KDF over a chunk of passwords in one pool job"""
+    return [_derive(scheme, password, salt, params) for password, salt in zip(passwords, salts)]
+
+def _encode(scheme: str, params: Dict[str, int], salt: bytes, digest: bytes) -> str:
+    paramText = ",".join(f"{key}={value}" for key, value in params.items())
+    return f"{scheme}${paramText}${_b64encode(salt)}${_b64encode(digest)}"
+
+def _decode(stored: str) -> Optional[Tuple[str, Dict[str, int], bytes, bytes]]:
+    """Split a stored hash into scheme, params, salt and digest, or None if it is not in that format"""
+    parts = stored.split("$")
+    if len(parts) != 4:
+        return None
+    scheme, paramText, salt, digest = parts
+    try:
+        params = {key: int(value) for key, value in (item.split("=") for item in paramText.split(","))}
+        return scheme, params, _b64decode(salt), _b64decode(digest)
+    except ValueError:
+        return None
+
+def _isLegacySha256(stored: str) -> bool:
+    """Check for the unsalted SHA-256 hex digests stored before KDF hashing"""
+    return len(stored) == 64 and all(c in "0123456789abcdef" for c in stored)
+
+
+class PasswordHasher:
+    """Salted, tunable password hashing run on a bounded process pool.
+
+    Stored hashes look like scheme$params$salt$digest, so every hash carries the
+    parameters it was made with and can be verified after the defaults change.
+    With workers=0 the KDF runs in the calling thread instead of a pool.
+    """
+
+    def __init__(self, scheme: str = "scrypt", cost: Optional[int] = None, workers: Optional[int] = None):
+        if scheme == "scrypt":
+            self.params = {"ln": cost or 14, "r": SCRYPT_R, "p": SCRYPT_P}
+        elif scheme == "pbkdf2_sha256":
+            self.params = {"i": cost or 600_000}
+        else:
+            raise ValueError(f"Unknown password hashing scheme {scheme!r}; use 'scrypt' or 'pbkdf2_sha256'")
+        self.scheme = scheme
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._poolLock = threading.Lock()
+        # Bound the number of queued jobs so a signup burst blocks callers instead of piling up
+        self._slots = threading.BoundedSemaphore(max(1, self.workers) * 4)
+
+    def _run(self, scheme: str, password: str, salt: bytes, params: Dict[str, int]) -> Future:
+        return self._call(_derive, scheme, password, salt, params)
+
+    def _call(self, fn, *args) -> Future:
+        if self.workers == 0:
+            future: Future = Future()
+            try:
+                future.set_result(fn(*args))
+            except BaseException as e:
+                future.set_exception(e)
+            return future
+
+        self._slots.acquire()
+        return self._submit(fn, *args)
+
+    def _submit(self, fn, *args) -> Future:
+        """Send a job to the pool; the caller holds one of the queue slots, which the job releases when done"""
+        if self._pool is None:
+            with self._poolLock:
+                if self._pool is None:
+                    self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        try:
+            future = self._pool.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    async def _callAsync(self, fn, *args):
+        """Run a job from async code, waiting for it on the event loop instead of holding a thread"""
+        if self.workers == 0:
+            return await asyncio.to_thread(fn, *args)
+        # Only a backed-up pool makes us wait for a slot, and that wait must not block the loop
+        if not self._slots.acquire(blocking=False):
+            acquiring = asyncio.ensure_future(asyncio.to_thread(self._slots.acquire))
+            try:
+                await asyncio.shield(acquiring)
+            except asyncio.CancelledError:
+                # The thread still gets the slot; hand it back once it does
+                acquiring.add_done_callback(lambda _: self._slots.release())
+                raise
+        return await asyncio.wrap_future(self._submit(fn, *args))
+
+    def submit(self, password: str) -> "Future[str]":
+        """Start hashing a password with the current parameters; the future resolves to the stored form"""
+        salt = os.urandom(SALT_BYTES)
+        result: Future = Future()
+
+        def done(derived: Future) -> None:
+            try:
+                result.set_result(_encode(self.scheme, self.params, salt, derived.result()))
+            except BaseException as e:
+                result.set_exception(e)
+
+        self._run(self.scheme, password, salt, self.params).add_done_callback(done)
+        return result
+
+    def hash(self, password: str) -> str:
+        """Hash a password with the current parameters"""
+        return self.submit(password).result()
+
+    async def hashAsync(self, password: str) -> str:
+        """hash for async callers: the KDF runs on the pool (or a worker thread with workers=0)"""
+        salt = os.urandom(SALT_BYTES)
+        digest = await self._callAsync(_derive, self.scheme, password, salt, self.params)
+        return _encode(self.scheme, self.params, salt, digest)
+
+    def hashMany(self, passwords: List[str]) -> List[str]:
+        """Hash a batch of passwords, sending them to the pool in a few large chunks instead of one job each"""
+        salts = [os.urandom(SALT_BYTES) for _ in passwords]
+        size = max(1, -(-len(passwords) // (max(1, self.workers) * 4)))
+        chunks = [
+            self._call(_deriveMany, self.scheme, passwords[start:start + size], salts[start:start + size], self.params)
+            for start in range(0, len(passwords), size)
+        ]
+        digests = [digest for chunk in chunks for digest in chunk.result()]
+        return [_encode(self.scheme, self.params, salt, digest) for salt, digest in zip(salts, digests)]
+
+    def verify(self, password: str, stored: str) -> bool:
+        """Check a password against a stored hash made with any supported scheme or parameters"""
+        if _isLegacySha256(stored):
+            return hmac.compare_digest(hashlib.sha256(password.encode()).hexdigest(), stored)
+        decoded = _decode(stored)
+        if decoded is None:
+            return False
+        scheme, params, salt, digest = decoded
+        try:
+            derived = self._run(scheme, password, salt, params).result()
+        except (ValueError, KeyError):
+            return False
+        return hmac.compare_digest(derived, digest)
+
+    async def verifyAsync(self, password: str, stored: str) -> bool:
+        """verify for async callers, with the KDF off the event loop"""
+        if _isLegacySha256(stored):
+            return hmac.compare_digest(hashlib.sha256(password.encode()).hexdigest(), stored)
+        decoded = _decode(stored)
+        if decoded is None:
+            return False
+        scheme, params, salt, digest = decoded
+        try:
+            derived = await self._callAsync(_derive, scheme, password, salt, params)
+        except (ValueError, KeyError):
+            return False
+        return hmac.compare_digest(derived, digest)
+
+    def needsRehash(self, stored: str) -> bool:
+        """Check if a stored hash was made with a different scheme or parameters than the current ones"""
+        decoded = _decode(stored)
+        return decoded is None or decoded[0] != self.scheme or decoded[1] != self.params
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+
+hasher = PasswordHasher(config.PASSWORD_SCHEME, config.PASSWORD_COST, config.PASSWORD_WORKERS)
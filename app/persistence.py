@@ -0,0 +1,236 @@
+import json
+import os
+import threading
+from typing import List, Optional
+
+from .models import Payment, User
+
+
+class Journal:
+    """Receives every store mutation. The base class keeps nothing and is used when persistence is off."""
+
+    # Stores skip building records entirely when this is False
+    enabled = False
+
+    def append(self, record: dict) -> int:
+        """Queue a mutation record and return a ticket to pass to commit"""
+        return 0
+
+    def commit(self, ticket: int) -> None:
+        """Block until the record behind the ticket is durable"""
+
+    def close(self) -> None:
+        """Flush outstanding records and release resources"""
+
+
+class WriteAheadLog(Journal):
+    """Append-only mutation log with group-committed fsyncs and periodic compacting snapshots.
+
+    Records are JSON lines. Writers append to a shared buffer and wait in commit
+    while a single flusher thread writes and fsyncs whatever has accumulated, so
+    concurrent writers share one fsync. Every SNAPSHOT_EVERY records the log is
+    rotated to a new segment and the stores are written to a snapshot in the
+    background, after which older segments are deleted. Replaying a record is
+    idempotent, so segments written while a snapshot was taken can be replayed
+    on top of it.
+    """
+
+    SNAPSHOT = "snapshot.jsonl"
+    enabled = True
+
+    def __init__(self, directory: str, snapshotEvery: int = 100_000, fsync: bool = True):
+        self.directory = directory
+        self.snapshotEvery = snapshotEvery
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._hasWork = threading.Condition(self._lock)
+        self._durable = threading.Condition(self._lock)
+        self._buffer: List[str] = []
+        self._appended = 0
+        self._written = 0
+        self._sinceSnapshot = 0
+        self._error: Optional[BaseException] = None
+        self._closed = False
+        # Number of write+fsync rounds, for measuring how well commits are grouped
+        self.flushCount = 0
+        self._segment = 0
+        self._file = None
+        self._users = None
+        self._payments = None
+        self._snapshotThread: Optional[threading.Thread] = None
+        self._flusher = threading.Thread(target=self._flushLoop, name="wal-flusher", daemon=True)
+
+    # Startup
+
+    def open(self, users, payments) -> None:
+        """Rebuild the stores from the snapshot and log, then start journaling their mutations"""
+        os.makedirs(self.directory, exist_ok=True)
+        self._users = users
+        self._payments = payments
+
+        firstSegment = 0
+        snapshotPath = os.path.join(self.directory, self.SNAPSHOT)
+        if os.path.exists(snapshotPath):
+            header = self._replayFile(snapshotPath)
+            firstSegment = header["segment"]
+            payments.advanceNextId(header["nextPaymentId"])
+
+        segments = self._segments()
+        for segment in segments:
+            if segment >= firstSegment:
+                self._replayFile(self._segmentPath(segment))
+
+        # Always start a fresh segment so a torn tail from a crash is never appended to
+        self._segment = max(segments + [firstSegment - 1, 0]) + 1
+        self._file = open(self._segmentPath(self._segment), "a", encoding="utf-8")
+        users.attachJournal(self)
+        payments.attachJournal(self)
+        self._flusher.start()
+
+    def _segmentPath(self, segment: int) -> str:
+        return os.path.join(self.directory, f"wal-{segment:08d}.log")
+
+    def _segments(self) -> List[int]:
+        segments = []
+        for name in os.listdir(self.directory):
+            if name.startswith("wal-") and name.endswith(".log"):
+                segments.append(int(name[4:-4]))
+        return sorted(segments)
+
+    def _replayFile(self, path: str) -> Optional[dict]:
+        """Apply every record in a log or snapshot file, returning the snapshot header if present"""
+        header = None
+        users, payments = self._users, self._payments
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Torn write at the tail of the last segment before a crash
+                    break
+                op = record["op"]
+                if op == "addUser":
+                    users.add(User.model_validate(record["user"]))
+                elif op == "addUsers":
+                    for user in record["users"]:
+                        users.add(User.model_validate(user))
+                elif op == "updateUser":
+                    users.update(User.model_validate(record["user"]))
+                elif op == "removeUser":
+                    users.remove(record["username"])
+                elif op == "clearUsers":
+                    users.clear()
+                elif op == "addPayment":
+                    payments.add(Payment.model_validate(record["payment"]))
+                elif op == "addPayments":
+                    payments.addMany([Payment.model_validate(payment) for payment in record["payments"]])
+                elif op == "removePayment":
+                    payments.remove(record["id"])
+                elif op == "clearPayments":
+                    payments.clear()
+                elif op == "snapshot":
+                    header = record
+        return header
+
+    # Journal interface
+
+    def append(self, record: dict) -> int:
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Write-ahead log is closed")
+            self._buffer.append(line)
+            self._appended += 1
+            self._hasWork.notify()
+            return self._appended
+
+    def commit(self, ticket: int) -> None:
+        with self._lock:
+            while self._written < ticket and self._error is None:
+                self._durable.wait()
+            if self._error is not None:
+                raise RuntimeError("Write-ahead log failed") from self._error
+
+    def close(self) -> None:
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._hasWork.notify()
+        if self._flusher.is_alive():
+            self._flusher.join()
+        if self._snapshotThread is not None:
+            self._snapshotThread.join()
+        if self._file is not None:
+            self._file.close()
+
+    # Background work
+
+    def _flushLoop(self) -> None:
+        while True:
+            with self._lock:
+                while not self._buffer and not self._closed:
+                    self._hasWork.wait()
+                if not self._buffer and self._closed:
+                    return
+                lines, self._buffer = self._buffer, []
+                target = self._appended
+                f = self._file
+            try:
+                f.write("".join(lines))
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+            except BaseException as e:
+                with self._lock:
+                    self._error = e
+                    self._durable.notify_all()
+                return
+            with self._lock:
+                self._written = target
+                self.flushCount += 1
+                self._durable.notify_all()
+                self._sinceSnapshot += len(lines)
+                if self._sinceSnapshot >= self.snapshotEvery and not self._snapshotRunning():
+                    self._rotate()
+
+    def _snapshotRunning(self) -> bool:
+        return self._snapshotThread is not None and self._snapshotThread.is_alive()
+
+    def _rotate(self) -> None:
+        """Switch to a new segment and snapshot the stores in the background (called with the lock held)"""
+        # Anything still buffered goes to the new segment and is replayed on top of the snapshot
+        self._file.close()
+        self._segment += 1
+        self._file = open(self._segmentPath(self._segment), "a", encoding="utf-8")
+        self._sinceSnapshot = 0
+        self._snapshotThread = threading.Thread(
+            target=self.snapshot, args=(self._segment,), name="wal-snapshot", daemon=True
+        )
+        self._snapshotThread.start()
+
+    def snapshot(self, segment: int) -> None:
+        """Write the current store contents to the snapshot file and drop segments before the given one"""
+        path = os.path.join(self.directory, self.SNAPSHOT)
+        tmpPath = path + ".tmp"
+        with open(tmpPath, "w", encoding="utf-8") as f:
+            header = {"op": "snapshot", "segment": segment, "nextPaymentId": self._payments.nextId()}
+            f.write(json.dumps(header) + "\n")
+            for user in self._users:
+                f.write(json.dumps({"op": "addUser", "user": user.model_dump()}, separators=(",", ":")) + "\n")
+            for payment in self._payments:
+                f.write(json.dumps({"op": "addPayment", "payment": payment.model_dump()}, separators=(",", ":")) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmpPath, path)
+        self._fsyncDirectory()
+        for old in self._segments():
+            if old < segment:
+                os.remove(self._segmentPath(old))
+
+    def _fsyncDirectory(self) -> None:
+        fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
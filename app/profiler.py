@@ -0,0 +1,176 @@
+import asyncio
+import inspect
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, Optional
+
+from starlette.routing import Route
+
+# Longest profile one request can ask for, in seconds
+MAX_SECONDS = 300.0
+
+# Default time between two samples of the event loop thread, in seconds
+DEFAULT_INTERVAL = 0.01
+
+# Lowest GIL switch interval a profile sets while it runs, in seconds, so the sampler gets the GIL from
+# a busy loop without making every thread in the process trade it much more often
+SWITCH_INTERVAL = 1e-4
+
+# The frame of Starlette's route dispatch, whose `self` says which route a stack is serving
+_ROUTE_HANDLE = Route.handle.__code__
+
+
+def _shortPath(filename: str) -> str:
+    """File name relative to the sys.path entry it was imported from"""
+    best = ""
+    for entry in sys.path:
+        if entry and filename.startswith(entry.rstrip(os.sep) + os.sep) and len(entry) > len(best):
+            best = entry
+    return filename[len(best.rstrip(os.sep)) + 1:] if best else filename
+
+
+class ProfileSession:
+    """One sampling run over the event loop thread, for a time limit or a number of requests.
+
+    A background thread reads the loop thread's stack every `interval` seconds
+    with sys._current_frames(), so the profiled code runs unmodified. Samples
+    taken while the loop waits for events are dropped, as are the loop's own
+    frames at the base of each stack. With a route, only stacks running that
+    route's request (from body parsing to sending the response) are counted.
+    Work handed to worker threads or the password pool is not sampled. While
+    the session runs, the process-wide GIL switch interval is lowered to at
+    most SWITCH_INTERVAL, and the value used is kept in switchInterval.
+    """
+
+    def __init__(self, app, seconds: float, requests: Optional[int] = None, route: Optional[Route] = None,
+                 interval: float = DEFAULT_INTERVAL):
+        self.app = app
+        self.seconds = seconds
+        self.requests = requests
+        self.route = route
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.idle = 0
+        self.completed = 0
+        self.elapsed = 0.0
+        self.switchInterval = sys.getswitchinterval()
+        self._labels: Dict = {}
+        self._stop = threading.Event()
+
+    def _loopFrames(self):
+        """Code objects of the frames below the running task, which make up the event loop itself"""
+        frame, base = sys._getframe(), None
+        while frame is not None:
+            if frame.f_code.co_flags & inspect.CO_COROUTINE:
+                base = frame.f_back
+            frame = frame.f_back
+        codes = set()
+        while base is not None:
+            codes.add(base.f_code)
+            base = base.f_back
+        return codes
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            label = self._labels[code] = f"{code.co_qualname} ({_shortPath(code.co_filename)}:{code.co_firstlineno})"
+        return label
+
+    def _sample(self, thread: int, loopCodes) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(thread)
+            codes = []
+            inRoute = self.route is None
+            while frame is not None:
+                code = frame.f_code
+                if code is _ROUTE_HANDLE and not inRoute:
+                    inRoute = frame.f_locals.get("self") is self.route
+                codes.append(code)
+                frame = frame.f_back
+            self.samples += 1
+            # Drop the event loop's frames, leaving the work it was running
+            while codes and codes[-1] in loopCodes:
+                codes.pop()
+            if not codes or (len(codes) == 1 and codes[0].co_filename.endswith("selectors.py")):
+                self.idle += 1
+            elif inRoute:
+                self.stacks[tuple(codes)] += 1
+
+    def _counts(self, scope) -> bool:
+        """Whether a finished request counts towards the request limit"""
+        route = scope.get("route")
+        if self.route is not None:
+            return route is self.route
+        return not (route is not None and route.path.startswith("/admin/"))
+
+    async def run(self) -> None:
+        """Sample until the time or request limit is reached, then restore the unprofiled app"""
+        loop = asyncio.get_running_loop()
+        finished = loop.create_future()
+        stack = self.app.middleware_stack or self.app.build_middleware_stack()
+
+        async def counted(scope, receive, send):
+            try:
+                await stack(scope, receive, send)
+            finally:
+                if scope["type"] == "http" and self._counts(scope):
+                    self.completed += 1
+                    if self.requests is not None and self.completed >= self.requests and not finished.done():
+                        finished.set_result(None)
+
+        # Requests are only counted while a session runs; otherwise the app's stack is left untouched
+        self.app.middleware_stack = counted
+        sampler = threading.Thread(target=self._sample, args=(threading.get_ident(), self._loopFrames()),
+                                   name="streamly-profiler", daemon=True)
+        # The sampler needs the GIL to read a stack. With the default 5 ms switch interval the loop thread
+        # mostly hands it over when it goes idle, so short busy stretches would hardly be sampled. The
+        # interval is process-wide, so worker threads trade the GIL this often too until the profile ends.
+        restore = sys.getswitchinterval()
+        self.switchInterval = min(restore, SWITCH_INTERVAL)
+        sys.setswitchinterval(self.switchInterval)
+        began = time.perf_counter()
+        sampler.start()
+        try:
+            await asyncio.wait([finished], timeout=self.seconds)
+        finally:
+            self._stop.set()
+            self.elapsed = time.perf_counter() - began
+            sys.setswitchinterval(restore)
+            if self.app.middleware_stack is counted:
+                self.app.middleware_stack = stack
+            await asyncio.to_thread(sampler.join)
+
+    def collapsed(self) -> str:
+        """Counted stacks in the collapsed format read by flamegraph.pl and speedscope, hottest first"""
+        # Stacks are counted as code objects, leaf first, and only turned into text here
+        folded = Counter()
+        for codes, count in self.stacks.items():
+            folded[";".join(self._label(code) for code in reversed(codes))] += count
+        return "".join(f"{stack} {count}\n" for stack, count in folded.most_common())
+
+
+class Profiler:
+    """Runs at most one ProfileSession at a time for an app"""
+
+    def __init__(self):
+        self.session: Optional[ProfileSession] = None
+
+    @property
+    def running(self) -> bool:
+        return self.session is not None
+
+    async def profile(self, session: ProfileSession) -> ProfileSession:
+        if self.session is not None:
+            raise RuntimeError("A profile is already running")
+        self.session = session
+        try:
+            await session.run()
+        finally:
+            self.session = None
+        return session
+
+profiler = Profiler()
@@ -0,0 +1,32 @@
+from typing import Iterable, Optional
+
+from fastapi.responses import JSONResponse as StandardJSONResponse, Response
+
+from . import config
+
+if config.FAST_JSON:
+    try:
+        import orjson  # noqa: F401  (ORJSONResponse imports it lazily; fail at startup instead)
+    except ImportError as e:
+        raise ImportError("STREAMLY_FAST_JSON=1 needs the orjson package: pip install orjson") from e
+    from fastapi.responses import ORJSONResponse as JSONResponse
+else:
+    JSONResponse = StandardJSONResponse
+
+
+def recordResponse(key: str, fragment: bytes, status_code: int = 200) -> Response:
+    """Wrap one record's cached JSON bytes as {key: record} without decoding them"""
+    return Response(b'{"' + key.encode() + b'":' + fragment + b"}", status_code=status_code,
+                    media_type="application/json")
+
+def listResponse(key: str, fragments: Iterable[bytes], nextCursor: Optional[str] = None,
+                 paginated: bool = False) -> Response:
+    """Join records' cached JSON bytes into {key: [...]} (plus nextCursor when paginated).
+
+    The body matches what returning the equivalent dict would produce, but skips
+    model_dump(), jsonable_encoder and the response_model pass.
+    """
+    body = b'{"' + key.encode() + b'":[' + b",".join(fragments) + b"]"
+    if paginated:
+        body += b',"nextCursor":' + (b'"' + nextCursor.encode() + b'"' if nextCursor is not None else b"null")
+    return Response(body + b"}", media_type="application/json")
@@ -0,0 +1,53 @@
+import hmac
+from fastapi import APIRouter, Header, Query, Request
+from fastapi.responses import PlainTextResponse
+from typing import Annotated, Optional
+from .. import config
+from ..profiler import DEFAULT_INTERVAL, MAX_SECONDS, ProfileSession, profiler
+from ..responses import JSONResponse
+
+router = APIRouter(
+    prefix="/admin"
+)
+
+def _adminError(authorization: Optional[str]) -> Optional[JSONResponse]:
+    """Refuse the request unless it carries the admin token; the endpoints do not exist without one configured"""
+    if not config.ADMIN_TOKEN:
+        return JSONResponse(status_code=404, content={"message": "Not found"})
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(token.encode(), config.ADMIN_TOKEN.encode()):
+        return JSONResponse(status_code=401, content={"message": "Invalid admin token"},
+                            headers={"WWW-Authenticate": "Bearer"})
+    return None
+
+@router.post("/profile", tags=["Admin"], response_class=PlainTextResponse,
+             responses={200: {"content": {"text/plain": {}}}})
+async def profile(
+        request: Request,
+        authorization: Annotated[Optional[str], Header(description="Bearer followed by STREAMLY_ADMIN_TOKEN")] = None,
+        seconds: float = Query(10, gt=0, le=MAX_SECONDS, description="Stop after this many seconds"),
+        requests: Optional[int] = Query(None, ge=1, description="Stop earlier, once this many requests have finished"),
+        route: Optional[str] = Query(None, description="Only profile this route template, e.g. /payments/create"),
+        interval: float = Query(DEFAULT_INTERVAL, ge=0.001, le=1, description="Seconds between two samples")
+    ):
+    """Sample the event loop's stacks for a while and return them in the collapsed flamegraph format"""
+    error = _adminError(authorization)
+    if error is not None:
+        return error
+
+    target = None
+    if route is not None:
+        target = next((candidate for candidate in request.app.routes if getattr(candidate, "path", None) == route), None)
+        if target is None:
+            return JSONResponse(status_code=400, content={"message": "Unknown route. Use a path template such as /payments/create"})
+    if profiler.running:
+        return JSONResponse(status_code=409, content={"message": "A profile is already running"})
+
+    session = await profiler.profile(ProfileSession(request.app, seconds, requests, target, interval))
+    return PlainTextResponse(session.collapsed(), headers={
+        "X-Profile-Seconds": f"{session.elapsed:.3f}",
+        "X-Profile-Requests": str(session.completed),
+        "X-Profile-Samples": str(session.samples),
+        "X-Profile-Idle-Samples": str(session.idle),
+        "X-Profile-Switch-Interval": f"{session.switchInterval:g}",
+    })
@@ -1,18 +1,140 @@
 import datetime
-from fastapi import APIRouter, Query
-from fastapi.responses import JSONResponse
+import json
+from fastapi import APIRouter, Header, Query, Request
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from starlette.concurrency import run_in_threadpool
+from typing import Annotated, Dict, List, Optional
+from ..idempotency import MAX_KEY_LENGTH, paymentReplays, validKey
+from ..metrics import timed
 from ..models import Payment
-from ..storage import paymentsDB
-from ..utils import checkCardRegistered, validateCreditCard, validateAmount
+from ..responses import JSONResponse, listResponse, recordResponse
+from ..storage import CardSummary, PaymentFilter, asyncPaymentsDB, asyncUsersDB, hasCreditCard, paymentsDB
+from ..utils import (validateNewPayment, validateNewPayments, encodeCursor, decodeCursor, DEFAULT_PAGE_SIZE,
+                     streamNDJSON, parseRecords, BULK_MAX_ROWS, parseTimestamp)
 
 router = APIRouter(
     prefix="/payments"
 )
 
+# Groupings accepted by /payments/aggregate; "user" is built from the per-card groups
+AGGREGATE_GROUPS = ("card", "user", "day")
+
+def _paymentFilter(ccNumber: Optional[str], start: Optional[str], end: Optional[str],
+                   minAmount: Optional[int], maxAmount: Optional[int]):
+    """Build the listing filter from query parameters; returns (filter or None, error response or None)"""
+    startAt = parseTimestamp(start) if start is not None else None
+    endAt = parseTimestamp(end) if end is not None else None
+    if (start is not None and startAt is None) or (end is not None and endAt is None):
+        return None, JSONResponse(status_code=400, content={"message": "Invalid date range. Use ISO dates without a time zone"})
+    filters = PaymentFilter(ccNumber or None, startAt, endAt, minAmount, maxAmount)
+    return (filters if filters != PaymentFilter() else None), None
+
 @router.get("/getAll", tags=["Payments"])
-def get_payments():
-    """Get all payments"""
-    return {"payments": [payment.model_dump() for payment in paymentsDB]}
+async def get_payments(
+        limit: Optional[int] = Query(None, ge=1, le=1000, description="Page size; enables cursor pagination"),
+        cursor: Optional[str] = Query(None, description="Opaque cursor returned as nextCursor by the previous page"),
+        ccNumber: Optional[str] = Query(None, description="Only payments made with this credit card number"),
+        start: Optional[str] = Query(None, alias="from", description="Only payments at or after this ISO date/time"),
+        end: Optional[str] = Query(None, alias="to", description="Only payments before this ISO date/time"),
+        minAmount: Optional[int] = Query(None, description="Only payments of at least this amount"),
+        maxAmount: Optional[int] = Query(None, description="Only payments of at most this amount")
+    ):
+    """Get all payments, optionally filtered and one page at a time in payment id order"""
+    filters, error = _paymentFilter(ccNumber, start, end, minAmount, maxAmount)
+    if error is not None:
+        return error
+
+    # Without pagination parameters, return the whole table (or every match) as before
+    if limit is None and cursor is None:
+        with timed("get_payments.serialize"):
+            payments = await asyncPaymentsDB.listJSON(filters)
+            return listResponse("payments", payments)
+
+    after = None
+    if cursor is not None:
+        after = decodeCursor("p", cursor)
+        if after is None:
+            return JSONResponse(status_code=400, content={"message": "Invalid cursor"})
+
+    with timed("get_payments.serialize"):
+        payments, nextKey = await asyncPaymentsDB.pageJSON(after, limit or DEFAULT_PAGE_SIZE, filters)
+        nextCursor = encodeCursor("p", nextKey) if nextKey is not None else None
+        return listResponse("payments", payments, nextCursor, paginated=True)
+
+@router.get("/export", tags=["Payments"], responses={200: {"content": {"application/x-ndjson": {}}}})
+async def export_payments(
+        ccNumber: Optional[str] = Query(None, description="Only payments made with this credit card number"),
+        start: Optional[str] = Query(None, alias="from", description="Only payments at or after this ISO date/time"),
+        end: Optional[str] = Query(None, alias="to", description="Only payments before this ISO date/time"),
+        minAmount: Optional[int] = Query(None, description="Only payments of at least this amount"),
+        maxAmount: Optional[int] = Query(None, description="Only payments of at most this amount")
+    ):
+    """Stream all payments as newline-delimited JSON in payment id order, with the same filters as getAll"""
+    filters, error = _paymentFilter(ccNumber, start, end, minAmount, maxAmount)
+    if error is not None:
+        return error
+    # StreamingResponse pulls from a plain iterator in a worker thread
+    return StreamingResponse(streamNDJSON(paymentsDB.iterate(filters)), media_type="application/x-ndjson")
+
+@router.get("/aggregate", tags=["Payments"])
+async def aggregate_payments(
+        groupBy: str = Query("card", description="Group by 'card', 'user' or 'day'"),
+        start: Optional[str] = Query(None, alias="from", description="Only payments at or after this ISO date/time"),
+        end: Optional[str] = Query(None, alias="to", description="Only payments before this ISO date/time")
+    ):
+    """Count, total and average payment amounts per card, owning user or day"""
+    if groupBy not in AGGREGATE_GROUPS:
+        return JSONResponse(status_code=400, content={"message": "Invalid groupBy. Use 'card', 'user' or 'day'"})
+    startAt = parseTimestamp(start) if start is not None else None
+    endAt = parseTimestamp(end) if end is not None else None
+    if (start is not None and startAt is None) or (end is not None and endAt is None):
+        return JSONResponse(status_code=400, content={"message": "Invalid date range. Use ISO dates without a time zone"})
+
+    groups = await asyncPaymentsDB.aggregate("card" if groupBy == "user" else groupBy, startAt, endAt)
+    if groupBy == "user":
+        groups = _groupByOwner(groups, await asyncUsersDB.ownersByCard(group[0] for group in groups))
+    # Sorted by key, with the None group (no owner or no date) last
+    groups.sort(key=lambda group: (group[0] is None, group[0] or ""))
+    # Plain ints and strings, so the response skips jsonable_encoder
+    return JSONResponse(content={"groupBy": groupBy, "groups": [
+        {"key": key, "count": count, "total": total, "average": round(total / count, 2)}
+        for key, count, total in groups
+    ]})
+
+def _groupByOwner(cardGroups: List[tuple], owners: Dict[str, List[str]]) -> List[tuple]:
+    """Fold per-card groups into per-user groups; a card shared by several users counts for each of them"""
+    byUser = {}
+    for ccNumber, count, total in cardGroups:
+        for username in owners.get(ccNumber, (None,)):
+            seen = byUser.get(username, (0, 0))
+            byUser[username] = (seen[0] + count, seen[1] + total)
+    return [(username, count, total) for username, (count, total) in byUser.items()]
+
+@router.get("/summaryByCard/{ccNumber}", tags=["Payments"])
+async def get_card_summary(ccNumber: str):
+    """Get a card's payment count, total, amount range and latest payment date from the running rollups"""
+    summary = await asyncPaymentsDB.cardSummary(ccNumber)
+    return JSONResponse(content={"ccNumber": ccNumber, **_summaryFields(summary)})
+
+@router.get("/summaryByUser/{username}", tags=["Payments"], responses={404: {"description": "User Not Found"}})
+async def get_user_summary(username: str):
+    """Get a user's running spend on their registered card without scanning their payments"""
+    user = await asyncUsersDB.get(username)
+    if user is None:
+        return JSONResponse(status_code=404, content={"message": "User not found"})
+    summary = await asyncPaymentsDB.cardSummary(user.ccNumber) if hasCreditCard(user) else CardSummary()
+    return JSONResponse(content={"username": username, "ccNumber": user.ccNumber or None, **_summaryFields(summary)})
+
+def _summaryFields(summary: CardSummary) -> dict:
+    return {
+        "count": summary.count,
+        "total": summary.total,
+        "average": round(summary.total / summary.count, 2) if summary.count else None,
+        "minAmount": summary.minAmount,
+        "maxAmount": summary.maxAmount,
+        "lastPaymentDate": summary.lastDate,
+    }
 
 @router.get("/getPaymentById/{payment_id}", tags=["Payments"], response_model=dict,
              responses=
@@ -20,11 +142,11 @@ def get_payments():
                 200: {"description": "Payment Found Successfully"},
                 404: {"description": "Payment Not Found"}
              })
-def get_payment_by_id(payment_id: int):
+async def get_payment_by_id(payment_id: int):
     """Get a payment by ID"""
-    for payment in paymentsDB:
-        if payment.id == payment_id:
-            return JSONResponse(status_code=200, content={"payment": payment.model_dump()})
+    payment = await asyncPaymentsDB.getJSON(payment_id)
+    if payment is not None:
+        return recordResponse("payment", payment)
     return JSONResponse(status_code=404, content={"message": "Payment not found"})
 
 @router.post(
@@ -33,28 +155,91 @@ def get_payment_by_id(payment_id: int):
             {
             201: {"description": "Created Successfully"}, 
             400: {"description": "Validation Checks Failed"}, 
-            404: {"description": "Card Number Not Registered"}
+            404: {"description": "Card Number Not Registered"},
+            422: {"description": "Idempotency-Key Reused For A Different Payment"}
         }
     )
-def createPayment(payment: Payment):
+async def createPayment(
+        payment: Payment,
+        # Annotated keeps the default a plain None when the handler is called directly
+        idempotencyKey: Annotated[Optional[str], Header(
+            alias="Idempotency-Key", description="Client-chosen key; retries with the same key replay the first response")] = None
+    ):
     """Create a new payment after completing all validation checks"""
-    # check if card number is numeric and 16 digits
-    if not validateCreditCard(payment.ccNumber):
-        return JSONResponse(status_code=400, content={"message": "Card number must be numeric and 16 digits long"})
+    if idempotencyKey is None:
+        return await _createPayment(payment)
+    if not validKey(idempotencyKey):
+        return JSONResponse(status_code=400, content={"message": f"Idempotency-Key must be 1 to {MAX_KEY_LENGTH} characters"})
+    return await paymentReplays.run(idempotencyKey, (payment.ccNumber, payment.amount), lambda: _createPayment(payment))
 
-    # Check if card number is registered to any user
-    elif not checkCardRegistered(payment.ccNumber):
-        return JSONResponse(status_code=404, content={"message": "Card number is not registered to any user"})
+async def _createPayment(payment: Payment):
+    # The format, card registration and amount checks; the registration lookup is the one touching the store
+    with timed("createPayment.card_lookup"):
+        error = await asyncUsersDB.read(validateNewPayment, payment)
+    if error is not None:
+        status_code, message = error
+        return JSONResponse(status_code=status_code, content={"message": message})
 
-    # Check if amount is exactly 3 digits (100-999)
-    elif not validateAmount(payment.amount):
-        return JSONResponse(status_code=400, content={"message": "Amount must be exactly 3 digits (100-999)"})
-
-    last_id = paymentsDB[-1].id if paymentsDB and paymentsDB[-1].id is not None else 0
-    new_payment = Payment(ccNumber=payment.ccNumber, amount=payment.amount, date=datetime.datetime.now().isoformat(), id=last_id + 1)
-    paymentsDB.append(new_payment)
+    new_payment = Payment(ccNumber=payment.ccNumber, amount=payment.amount, date=datetime.datetime.now().isoformat(), id=await asyncPaymentsDB.allocateId())
+    await asyncPaymentsDB.add(new_payment)
     return JSONResponse(status_code=201, content={"message": "Payment created successfully", "payment": new_payment.model_dump()})
 
+@router.post(
+        "/bulkCreate", tags=["Payments"],
+        responses=
+            {
+            200: {"description": "Batch Processed, Per-Row Results Streamed", "content": {"application/x-ndjson": {}}},
+            400: {"description": "Malformed Request Body"},
+            413: {"description": "Too Many Rows"}
+        }
+    )
+async def bulk_create_payments(request: Request):
+    """Create many payments from a JSON array or NDJSON body, streaming back one result line per row"""
+    try:
+        # Parsing a large batch is CPU work; keep it off the event loop
+        rows = await run_in_threadpool(parseRecords, await request.body(), request.headers.get("content-type", ""))
+    except ValueError:
+        return JSONResponse(status_code=400, content={"message": "Request body must be a JSON array or NDJSON"})
+    if len(rows) > BULK_MAX_ROWS:
+        return JSONResponse(status_code=413, content={"message": f"A batch can contain at most {BULK_MAX_ROWS} rows"})
+
+    results = await run_in_threadpool(bulkCreatePayments, rows)
+    created = sum(1 for result in results if result["status"] == 201)
+    # Every row is stored before the first result line is sent
+    return StreamingResponse(streamNDJSON(results, encode=_dumpResult), media_type="application/x-ndjson",
+                             headers={"X-Created-Count": str(created), "X-Failed-Count": str(len(results) - created)})
+
+def _dumpResult(result: dict) -> str:
+    return json.dumps(result, separators=(",", ":"))
+
+def bulkCreatePayments(rows: list) -> List[dict]:
+    """Validate a batch of payments and store the valid ones under one contiguous block of ids"""
+    results: List[Optional[dict]] = [None] * len(rows)
+    candidates = []
+    for i, row in enumerate(rows):
+        try:
+            candidates.append((i, Payment.model_validate(row)))
+        except ValidationError:
+            results[i] = {"index": i, "status": 400, "message": "Invalid payment record"}
+
+    accepted = []
+    for (i, payment), error in zip(candidates, validateNewPayments([payment for _, payment in candidates])):
+        if error is not None:
+            results[i] = {"index": i, "status": error[0], "message": error[1]}
+        else:
+            accepted.append((i, payment))
+
+    firstId = paymentsDB.allocateIds(len(accepted))
+    date = datetime.datetime.now().isoformat()
+    newPayments = [
+        Payment(id=firstId + n, ccNumber=payment.ccNumber, amount=payment.amount, date=date)
+        for n, (_, payment) in enumerate(accepted)
+    ]
+    paymentsDB.addMany(newPayments)
+    for (i, _), newPayment in zip(accepted, newPayments):
+        results[i] = {"index": i, "status": 201, "message": "Payment created successfully", "id": newPayment.id}
+    return results
+
 @router.delete("/delete/{payment_id}", tags=["Payments"], response_model=dict,
                 responses=
                 {
@@ -62,10 +247,8 @@ def createPayment(payment: Payment):
                     404: {"description": "Payment Not Found"}
                 }
             )
-def delete_payment(payment_id: int):
+async def delete_payment(payment_id: int):
     """Delete a payment by ID"""
-    for payment in paymentsDB:
-        if payment.id == payment_id:
-            paymentsDB.remove(payment)
-            return JSONResponse(status_code=200, content={"message": "Payment deleted successfully"})
+    if await asyncPaymentsDB.remove(payment_id) is not None:
+        return JSONResponse(status_code=200, content={"message": "Payment deleted successfully"})
     return JSONResponse(status_code=404, content={"message": "Payment not found"})
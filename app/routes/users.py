@@ -1,37 +1,82 @@
-from fastapi import APIRouter, Query
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, Query, Request
+from fastapi.exception_handlers import request_validation_exception_handler
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from starlette.concurrency import run_in_threadpool
 from ..utils import *
-from ..models import User
-from ..storage import usersDB
-from typing import Optional
+from ..metrics import timed
+from ..models import LoginRequest, SIGNUP_ERRORS, User, UserCreate
+from ..responses import JSONResponse, listResponse, recordResponse
+from ..storage import asyncUsersDB, usersDB
+from typing import List, Optional, Set, Tuple
 
 router = APIRouter(
     prefix="/users"
 )
 
+# Values accepted by the creditcard query parameter, mapped to the store's card partitions
+CREDITCARD_FILTERS = {
+    "yes": True,
+    "no": False,
+}
+
 @router.get("/getAll", tags=["Users"])
-def get_users(creditcard: Optional[str] = Query(None, description="Filter by credit card: 'yes' or 'no'")):
-    """Get all users with optional credit card filter"""
-    filtered_users = usersDB
+async def get_users(
+        creditcard: Optional[str] = Query(None, description="Filter by credit card: 'yes' or 'no'"),
+        limit: Optional[int] = Query(None, ge=1, le=1000, description="Page size; enables cursor pagination"),
+        cursor: Optional[str] = Query(None, description="Opaque cursor returned as nextCursor by the previous page")
+    ):
+    """Get all users with optional credit card filter and cursor pagination"""
+    hasCard = None
     
     if creditcard:
-        creditcard_lower = creditcard.lower()
-        if creditcard_lower == "yes":
-            # Filter users who have a credit card (ccNumber is not None and not empty)
-            filtered_users = [user for user in usersDB if user.ccNumber is not None and user.ccNumber.strip() != ""]
-        elif creditcard_lower == "no":
-            # Filter users who don't have a credit card (ccNumber is None or empty)
-            filtered_users = [user for user in usersDB if user.ccNumber is None or user.ccNumber.strip() == ""]
-        else:
+        hasCard = CREDITCARD_FILTERS.get(creditcard.lower())
+        if hasCard is None:
+            return JSONResponse(status_code=400, content={"message": "Invalid creditcard filter. Use 'yes' or 'no'"})
+
+    # Without pagination parameters, return the whole table as before
+    if limit is None and cursor is None:
+        with timed("get_users.serialize"):
+            users = await asyncUsersDB.listJSON(hasCard)
+            return listResponse("users", users)
+
+    after = None
+    if cursor is not None:
+        after = decodeCursor("u", cursor)
+        if after is None:
+            return JSONResponse(status_code=400, content={"message": "Invalid cursor"})
+
+    with timed("get_users.serialize"):
+        users, nextKey = await asyncUsersDB.pageJSON(after, limit or DEFAULT_PAGE_SIZE, hasCard)
+        nextCursor = encodeCursor("u", nextKey) if nextKey is not None else None
+        return listResponse("users", users, nextCursor, paginated=True)
+
+@router.get("/export", tags=["Users"], responses={200: {"content": {"application/x-ndjson": {}}}})
+async def export_users(creditcard: Optional[str] = Query(None, description="Filter by credit card: 'yes' or 'no'")):
+    """Stream all users as newline-delimited JSON with optional credit card filter"""
+    hasCard = None
+
+    if creditcard:
+        hasCard = CREDITCARD_FILTERS.get(creditcard.lower())
+        if hasCard is None:
             return JSONResponse(status_code=400, content={"message": "Invalid creditcard filter. Use 'yes' or 'no'"})
-    return {"users": [user.model_dump() for user in filtered_users]}
+
+    # StreamingResponse pulls from a plain iterator in a worker thread
+    return StreamingResponse(streamNDJSON(usersDB.iterate(hasCard)), media_type="application/x-ndjson")
+
+@router.get("/count", tags=["Users"])
+async def count_users():
+    """Count users with and without a credit card without listing them"""
+    withCard, withoutCard = await asyncUsersDB.countByCard()
+    return {"total": withCard + withoutCard, "withCreditCard": withCard, "withoutCreditCard": withoutCard}
 
 @router.get("/getByUsername/{username}", tags=["Users"], response_model=dict, responses={404: {"description": "User Not Found"}})
-def get_user_by_username(username: str):
+async def get_user_by_username(username: str):
     """Get a user by username"""
-    for user in usersDB:
-        if user.username == username:
-            return {"user": user.model_dump()}
+    user = await asyncUsersDB.getJSON(username)
+    if user is not None:
+        return recordResponse("user", user)
     return JSONResponse(status_code=404, content={"message": "User not found"})
 
 @router.post(
@@ -44,59 +89,139 @@ def get_user_by_username(username: str):
             409: {"description": "Username Conflict"}
         }
     )
-def create_user(user: User):
+async def create_user(user: UserCreate):
     """Create a new user after completing all validation checks"""
-    # check if username is alphanumeric
-    if not validateUsernameAlphanumeric(user.username):
-        return JSONResponse(status_code=400, content={"message": "Username must be alphanumeric"})
+    # Field rules already ran while the body was parsed; only uniqueness needs the store
+    with timed("create_user.validate"):
+        unique = await asyncUsersDB.read(checkUsernameUnique, user.username)
+    if not unique:
+        return signupErrorResponse({("username", "username_taken")})
+
+    # All validations passed, create and store the user
+    with timed("create_user.hash_password"):
+        password = await hashPasswordAsync(user.password)
+    newUser = User(
+        username=user.username,
+        password=password,
+        email=user.email,
+        birthdate=user.birthdate,
+        ccNumber=user.ccNumber
+    )
 
-    # Check if username already exists
-    elif not checkUsernameUnique(user.username):
+    # The earlier uniqueness check is only a fast path; the insert itself is atomic
+    if not await asyncUsersDB.addIfAbsent(newUser):
         return JSONResponse(status_code=409, content={"message": "Username already exists"})
 
-    # check if password length is at least 8 characters
-    elif not validatePasswordLength(user.password):
-        return JSONResponse(status_code=400, content={"message": "Password must be at least 8 characters long"})
+    return JSONResponse(status_code=201, content={"message": "User created successfully", "user": newUser.model_dump()})
 
-    # check if password contains at least one uppercase letter and one number
-    elif not validatePasswordChars(user.password):
-        return JSONResponse(status_code=400, content={"message": "Password must include at least 1 uppercase letter and 1 number"})
-    
-    # Validate email format
-    elif not validateEmail(user.email):
-        return JSONResponse(status_code=400, content={"message": "Invalid email format"})
-    
-    # Validate that DOB is in ISO 8691 format
-    elif not validateDateFormat(user.birthdate):
-        return JSONResponse(status_code=400, content={"message": "Birthdate must be in YYYY-MM-DD format"})
-    
-    # Validate that user is at least 18 years old
-    elif not checkAgeEligibility(user.birthdate):
-        return JSONResponse(status_code=403, content={"message": "User must be at least 18 years old to register"})
-    
-    # If credit card number is provided, validate its format (simple check for digits and length)
-    elif user.ccNumber and not validateCreditCard(user.ccNumber):
-        return JSONResponse(status_code=400, content={"message": "Invalid credit card number format"})
-    
-    # All validations passed, create and store the user
-    else:
-        newUser = User(
-            username=user.username,
-            password=hashPassword(user.password),
-            email=user.email,
-            birthdate=user.birthdate,
-            ccNumber=user.ccNumber
-        )
+def signupErrorResponse(failed: Set[Tuple[str, str]]) -> JSONResponse:
+    """List every failed signup rule, answering with the status and message of the first in create_user's order"""
+    rules = [SIGNUP_ERRORS[key] + (key[0],) for key in SIGNUP_ERRORS if key in failed]
+    status_code, message, _ = rules[0]
+    return JSONResponse(status_code=status_code, content={
+        "message": message,
+        "errors": [{"field": field, "message": ruleMessage} for _, ruleMessage, field in rules]
+    })
 
-        usersDB.append(newUser)
+async def signupValidationHandler(request: Request, exc: RequestValidationError) -> JSONResponse:
+    """Report signup rule failures with their own status codes; any other validation error keeps the default 422"""
+    if request.scope.get("endpoint") is create_user:
+        failed = {(error["loc"][-1], error["type"]) for error in exc.errors() if len(error["loc"]) == 2}
+        if len(failed) == len(exc.errors()) and failed <= SIGNUP_ERRORS.keys():
+            username = exc.body.get("username") if isinstance(exc.body, dict) else None
+            fields = {field for field, _ in failed}
+            if ("username" not in fields and isinstance(username, str)
+                    and not await asyncUsersDB.read(checkUsernameUnique, username)):
+                failed.add(("username", "username_taken"))
+            return signupErrorResponse(failed)
+    return await request_validation_exception_handler(request, exc)
 
-    return JSONResponse(status_code=201, content={"message": "User created successfully", "user": newUser.model_dump()})
+@router.post(
+        "/users/bulkCreate", tags=["Users"], response_model=dict,
+        responses=
+            {
+            200: {"description": "Batch Processed, See Per-Row Results"},
+            400: {"description": "Malformed Request Body"},
+            413: {"description": "Too Many Rows"}
+        }
+    )
+async def bulk_create_users(request: Request):
+    """Create many users from a JSON array or NDJSON body, reporting a result for every row"""
+    try:
+        # Parsing a large batch is CPU work; keep it off the event loop
+        rows = await run_in_threadpool(parseRecords, await request.body(), request.headers.get("content-type", ""))
+    except ValueError:
+        return JSONResponse(status_code=400, content={"message": "Request body must be a JSON array or NDJSON"})
+    if len(rows) > BULK_MAX_ROWS:
+        return JSONResponse(status_code=413, content={"message": f"A batch can contain at most {BULK_MAX_ROWS} rows"})
+
+    # Validation and hashing are CPU work; keep them off the event loop
+    results = await run_in_threadpool(bulkCreateUsers, rows)
+    created = sum(1 for result in results if result["status"] == 201)
+    return {"created": created, "failed": len(results) - created, "results": results}
+
+def bulkCreateUsers(rows: list) -> List[dict]:
+    """Validate, hash and insert a batch of signups with one store mutation"""
+    results: List[Optional[dict]] = [None] * len(rows)
+    candidates = []
+    for i, row in enumerate(rows):
+        try:
+            candidates.append((i, User.model_validate(row)))
+        except ValidationError:
+            results[i] = {"index": i, "username": row.get("username") if isinstance(row, dict) else None,
+                          "status": 400, "message": "Invalid user record"}
+
+    # One set-based lookup against the store, plus a running set for duplicates inside the batch
+    taken = usersDB.existingUsernames([user.username for _, user in candidates])
+    errors = validateNewUsers([user for _, user in candidates], taken)
+    seen = set()
+    accepted = []
+    for (i, user), error in zip(candidates, errors):
+        if error is None and user.username in seen:
+            error = 409, "Duplicate username in batch"
+        if error is not None:
+            results[i] = {"index": i, "username": user.username, "status": error[0], "message": error[1]}
+            continue
+        seen.add(user.username)
+        accepted.append((i, user))
+
+    # Hash in chunks spread over the pool, then insert the whole batch in one store mutation
+    hashes = hasher.hashMany([user.password for _, user in accepted])
+    newUsers = [
+        User(username=user.username, password=hashed, email=user.email,
+             birthdate=user.birthdate, ccNumber=user.ccNumber)
+        for (_, user), hashed in zip(accepted, hashes)
+    ]
+    inserted = usersDB.addManyIfAbsent(newUsers)
+    for (i, user), ok in zip(accepted, inserted):
+        if ok:
+            results[i] = {"index": i, "username": user.username, "status": 201, "message": "User created successfully"}
+        else:
+            results[i] = {"index": i, "username": user.username, "status": 409, "message": "Username already exists"}
+    return results
+
+@router.post("/login", tags=["Users"], response_model=dict,
+             responses=
+             {
+                200: {"description": "Login Successful"},
+                401: {"description": "Invalid Credentials"}
+             })
+async def login(credentials: LoginRequest):
+    """Check a username and password, upgrading the stored hash if the hashing parameters have changed"""
+    user = await asyncUsersDB.get(credentials.username)
+    if user is None or not await verifyPasswordAsync(credentials.password, user.password):
+        return JSONResponse(status_code=401, content={"message": "Invalid username or password"})
+
+    # The plain password is only available here, so this is where old hashes get upgraded
+    if hasher.needsRehash(user.password):
+        rehashed = await hashPasswordAsync(credentials.password)
+        await asyncUsersDB.update(user.model_copy(update={"password": rehashed}))
+
+    return JSONResponse(status_code=200, content={"message": "Login successful"})
 
 @router.delete("/delete/{username}", tags=["Users"], response_model=dict, responses={404: {"description": "User Not Found"}})
-def delete_user(username: str):
+async def delete_user(username: str):
     """Delete a user by username"""
-    for i, user in enumerate(usersDB):
-        if user.username == username:
-            del usersDB[i]
-            return {"message": "User deleted successfully"}
+    if await asyncUsersDB.remove(username) is not None:
+        return {"message": "User deleted successfully"}
     return JSONResponse(status_code=404, content={"message": "User not found"})
\ No newline at end of file
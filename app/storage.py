@@ -1,5 +0,0 @@
-from .models import Payment, User
-from typing import Dict, List
-
-usersDB: List[User] = []
-paymentsDB: List[Payment] = []
\ No newline at end of file
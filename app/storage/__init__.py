@@ -0,0 +1,47 @@
+import atexit
+from typing import Optional
+
+from .. import config
+from ..persistence import WriteAheadLog
+from .aio import AsyncPaymentRepository, AsyncRepository, AsyncUserRepository
+from .base import CardSummary, PaymentFilter, PaymentRepository, ReplayRepository, UserRepository, hasCreditCard
+from .cache import RecordCache
+from .memory import OrderedIndex, PaymentStore, UserStore
+
+# The engine is chosen once at import time; routes and utils only use the repository interfaces
+if config.STORAGE_ENGINE == "sqlite":
+    from .sqlite import SqliteDatabase, SqlitePaymentStore, SqliteReplayStore, SqliteUserStore
+
+    database = SqliteDatabase(config.SQLITE_PATH)
+    usersDB: UserRepository = SqliteUserStore(database)
+    paymentsDB: PaymentRepository = SqlitePaymentStore(database)
+    replaysDB: Optional[ReplayRepository] = SqliteReplayStore(database, config.IDEMPOTENCY_TTL,
+                                                               config.IDEMPOTENCY_CACHE_BYTES)
+    atexit.register(database.close)
+
+elif config.STORAGE_ENGINE == "memory":
+    usersDB: UserRepository = UserStore(config.JSON_CACHE_BYTES)
+    paymentsDB: PaymentRepository = PaymentStore(config.JSON_CACHE_BYTES)
+    # The data lives in this process, so Idempotency-Key replays stay in it too (app/idempotency.py)
+    replaysDB: Optional[ReplayRepository] = None
+
+    if config.DATA_DIR:
+        journal = WriteAheadLog(config.DATA_DIR, snapshotEvery=config.SNAPSHOT_EVERY, fsync=config.WAL_FSYNC)
+        journal.open(usersDB, paymentsDB)
+        atexit.register(journal.close)
+
+elif config.STORAGE_ENGINE == "server":
+    from .remote import RemotePaymentStore, RemoteReplayStore, RemoteUserStore, StorageClient
+
+    client = StorageClient(config.STORAGE_SOCKET, config.STORAGE_AUTHKEY.encode() if config.STORAGE_AUTHKEY else None)
+    usersDB: UserRepository = RemoteUserStore(client)
+    paymentsDB: PaymentRepository = RemotePaymentStore(client)
+    replaysDB: Optional[ReplayRepository] = RemoteReplayStore(client)
+    atexit.register(client.close)
+
+else:
+    raise ValueError(f"Unknown storage engine {config.STORAGE_ENGINE!r}; use 'memory', 'sqlite' or 'server'")
+
+# Awaitable views of the same stores, used by the async route handlers
+asyncUsersDB = AsyncUserRepository(usersDB)
+asyncPaymentsDB = AsyncPaymentRepository(paymentsDB)
@@ -0,0 +1,118 @@
+import asyncio
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+from ..models import Payment, User
+from .base import CardSummary, PaymentFilter, PaymentRepository, UserRepository
+
+
+class AsyncRepository:
+    """Awaitable access to a synchronous repository, for async route handlers.
+
+    Calls that can wait on disk or on a lock held by a bulk write (any call on
+    an engine whose reads block, and writes on one whose writes do) run in
+    Starlette's worker threads. The rest run inline on the event loop, where a
+    thread hop would cost more than the call itself. Whole-table work always goes to a thread. Stores served by the
+    storage server are awaited on their pending reply instead of holding a thread.
+    """
+
+    def __init__(self, repository):
+        self.repository = repository
+
+    async def read(self, fn, *args):
+        """Run fn, which only reads the store, in a worker thread if the engine's reads can block"""
+        if self.repository.readsBlock:
+            return await self._offload(fn, *args)
+        return fn(*args)
+
+    async def write(self, fn, *args):
+        """Run fn, which writes to the store, in a worker thread if the engine's writes can block"""
+        if self.repository.writesBlock:
+            return await self._offload(fn, *args)
+        return fn(*args)
+
+    async def _offload(self, fn, *args):
+        # A store that can start its own calls (the storage server's) is awaited without a thread
+        if getattr(fn, "__self__", None) is self.repository and hasattr(self.repository, "submit"):
+            return await asyncio.wrap_future(self.repository.submit(fn.__name__, *args))
+        return await run_in_threadpool(fn, *args)
+
+    async def scan(self, fn, *args):
+        """Run fn, which walks the whole table, in a worker thread whatever the engine"""
+        return await run_in_threadpool(fn, *args)
+
+
+class AsyncUserRepository(AsyncRepository):
+    """The UserRepository operations the route handlers use, as coroutines"""
+
+    repository: UserRepository
+
+    async def get(self, username: str) -> Optional[User]:
+        return await self.read(self.repository.get, username)
+
+    async def getJSON(self, username: str) -> Optional[bytes]:
+        return await self.read(self.repository.getJSON, username)
+
+    async def contains(self, username: str) -> bool:
+        return await self.read(self.repository.__contains__, username)
+
+    async def hasCard(self, ccNumber: str) -> bool:
+        return await self.read(self.repository.hasCard, ccNumber)
+
+    async def ownersByCard(self, ccNumbers: Iterable[str]) -> Dict[str, List[str]]:
+        return await self.read(self.repository.ownersByCard, list(ccNumbers))
+
+    async def countByCard(self) -> Tuple[int, int]:
+        return await self.read(self.repository.countByCard)
+
+    async def pageJSON(self, after: Optional[int], limit: int,
+                       hasCard: Optional[bool] = None) -> Tuple[List[bytes], Optional[int]]:
+        return await self.read(self.repository.pageJSON, after, limit, hasCard)
+
+    async def listJSON(self, hasCard: Optional[bool] = None) -> List[bytes]:
+        """Every matching user's JSON bytes, collected in a worker thread"""
+        return await self.scan(lambda: list(self.repository.iterateJSON(hasCard)))
+
+    async def addIfAbsent(self, user: User) -> bool:
+        return await self.write(self.repository.addIfAbsent, user)
+
+    async def update(self, user: User) -> bool:
+        return await self.write(self.repository.update, user)
+
+    async def remove(self, username: str) -> Optional[User]:
+        return await self.write(self.repository.remove, username)
+
+
+class AsyncPaymentRepository(AsyncRepository):
+    """The PaymentRepository operations the route handlers use, as coroutines"""
+
+    repository: PaymentRepository
+
+    async def getJSON(self, paymentId: int) -> Optional[bytes]:
+        return await self.read(self.repository.getJSON, paymentId)
+
+    async def pageJSON(self, after: Optional[int], limit: int,
+                       filters: Optional[PaymentFilter] = None) -> Tuple[List[bytes], Optional[int]]:
+        return await self.read(self.repository.pageJSON, after, limit, filters)
+
+    async def listJSON(self, filters: Optional[PaymentFilter] = None) -> List[bytes]:
+        """Every matching payment's JSON bytes, collected in a worker thread"""
+        return await self.scan(lambda: list(self.repository.iterateJSON(filters)))
+
+    async def aggregate(self, groupBy: str, start: Optional[datetime] = None,
+                        end: Optional[datetime] = None) -> List[Tuple[Optional[str], int, int]]:
+        return await self.scan(self.repository.aggregate, groupBy, start, end)
+
+    async def cardSummary(self, ccNumber: str) -> CardSummary:
+        return await self.read(self.repository.cardSummary, ccNumber)
+
+    async def allocateId(self) -> int:
+        return await self.write(self.repository.allocateId)
+
+    async def add(self, payment: Payment) -> None:
+        await self.write(self.repository.add, payment)
+
+    async def remove(self, paymentId: int) -> Optional[Payment]:
+        return await self.write(self.repository.remove, paymentId)
@@ -0,0 +1,291 @@
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Dict, Hashable, Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple
+
+from ..models import Payment, User
+from .cache import encodeRecord
+
+# Seconds a request keeps its claim on an Idempotency-Key; a claim held longer is taken to be from a request that died
+CLAIM_SECONDS = 60.0
+
+
+def hasCreditCard(user: User) -> bool:
+    """Check if the user has a non-empty credit card number on file"""
+    return user.ccNumber is not None and user.ccNumber.strip() != ""
+
+
+class CardSummary(NamedTuple):
+    """Running totals of one card's payments, kept up to date by every payment write"""
+    count: int = 0
+    total: int = 0
+    minAmount: Optional[int] = None
+    maxAmount: Optional[int] = None
+    lastDate: Optional[str] = None
+
+
+class PaymentFilter(NamedTuple):
+    """Conditions a listed payment must meet; None leaves a field unchecked.
+
+    The date must fall in [start, end), and payments without a date never match
+    a date bound. The amount bounds are inclusive.
+    """
+    ccNumber: Optional[str] = None
+    start: Optional[datetime] = None
+    end: Optional[datetime] = None
+    minAmount: Optional[int] = None
+    maxAmount: Optional[int] = None
+
+
+class UserRepository(ABC):
+    """Operations the routes and utils need from a user table, implemented by every storage engine"""
+
+    # Whether reads and writes can wait on disk or on a lock a bulk write holds; async callers run blocking
+    # calls in a worker thread
+    readsBlock = True
+    writesBlock = True
+
+    @abstractmethod
+    def add(self, user: User) -> None:
+        """Insert a user, replacing any existing user with the same username"""
+
+    @abstractmethod
+    def addIfAbsent(self, user: User) -> bool:
+        """Atomically insert a user unless the username is taken, returning whether it was inserted"""
+
+    @abstractmethod
+    def addManyIfAbsent(self, users: List[User]) -> List[bool]:
+        """Insert every user whose username is free in one store mutation, returning which were inserted"""
+
+    @abstractmethod
+    def existingUsernames(self, usernames: Iterable[str]) -> Set[str]:
+        """Return the subset of the given usernames that are already taken"""
+
+    @abstractmethod
+    def update(self, user: User) -> bool:
+        """Replace an existing user in place, keeping its signup position; returns False if absent"""
+
+    @abstractmethod
+    def get(self, username: str) -> Optional[User]:
+        """Return the user with the given username, or None"""
+
+    @abstractmethod
+    def remove(self, username: str) -> Optional[User]:
+        """Remove and return the user with the given username, or None if absent"""
+
+    @abstractmethod
+    def hasCard(self, ccNumber: str) -> bool:
+        """Check if the credit card number is registered to any user"""
+
+    @abstractmethod
+    def getByCard(self, ccNumber: str) -> List[User]:
+        """Return the users registered with the given credit card number"""
+
+    @abstractmethod
+    def ownersByCard(self, ccNumbers: Iterable[str]) -> Dict[str, List[str]]:
+        """Return the usernames registered with each of the given cards, leaving out cards nobody has"""
+
+    @abstractmethod
+    def countByCard(self) -> Tuple[int, int]:
+        """Return the number of users with and without a credit card"""
+
+    @abstractmethod
+    def iterate(self, hasCard: Optional[bool] = None) -> Iterator[User]:
+        """Yield users in signup order, optionally only those with (True) or without (False) a card"""
+
+    @abstractmethod
+    def page(self, after: Optional[int], limit: int,
+             hasCard: Optional[bool] = None) -> Tuple[List[User], Optional[int]]:
+        """Return up to limit users inserted after the given cursor, and the cursor for the next page"""
+
+    @abstractmethod
+    def clear(self) -> None:
+        """Remove all users"""
+
+    @abstractmethod
+    def __contains__(self, username: str) -> bool: ...
+
+    @abstractmethod
+    def __len__(self) -> int: ...
+
+    # Serialized reads; engines with a record cache override _encode
+
+    def _encode(self, user: User) -> bytes:
+        return encodeRecord(user)
+
+    def getJSON(self, username: str) -> Optional[bytes]:
+        """Return the user's JSON bytes, or None"""
+        user = self.get(username)
+        return self._encode(user) if user is not None else None
+
+    def iterateJSON(self, hasCard: Optional[bool] = None) -> Iterator[bytes]:
+        """Yield the JSON bytes of each user in signup order, with the same filter as iterate"""
+        return map(self._encode, self.iterate(hasCard))
+
+    def pageJSON(self, after: Optional[int], limit: int,
+                 hasCard: Optional[bool] = None) -> Tuple[List[bytes], Optional[int]]:
+        """Like page, but returning each user's JSON bytes"""
+        users, nextKey = self.page(after, limit, hasCard)
+        return [self._encode(user) for user in users], nextKey
+
+    def cacheStats(self) -> Optional[Dict[str, int]]:
+        """Return the record cache counters, or None if the engine does not cache"""
+        return None
+
+    # List-style helpers so callers can keep treating usersDB like the old list
+
+    def append(self, user: User) -> None:
+        self.add(user)
+
+    def extend(self, users: Iterable[User]) -> None:
+        for user in users:
+            self.add(user)
+
+    def __iter__(self) -> Iterator[User]:
+        return self.iterate()
+
+    def __getitem__(self, index: int) -> User:
+        return list(self)[index]
+
+
+class PaymentRepository(ABC):
+    """Operations the routes and utils need from a payment table, implemented by every storage engine"""
+
+    # Whether reads and writes can wait on disk or on a lock a bulk write holds; async callers run blocking
+    # calls in a worker thread
+    readsBlock = True
+    writesBlock = True
+
+    @abstractmethod
+    def allocateId(self) -> int:
+        """Reserve and return the next payment id; ids are never handed out twice"""
+
+    @abstractmethod
+    def nextId(self) -> int:
+        """Return the id the next allocateId call will hand out"""
+
+    @abstractmethod
+    def advanceNextId(self, nextId: int) -> None:
+        """Make sure no id below nextId is handed out again"""
+
+    @abstractmethod
+    def allocateIds(self, count: int) -> int:
+        """Reserve count consecutive ids and return the first one"""
+
+    @abstractmethod
+    def add(self, payment: Payment) -> None:
+        """Insert a payment, replacing any existing payment with the same id"""
+
+    @abstractmethod
+    def addMany(self, payments: List[Payment]) -> None:
+        """Insert a batch of payments in one store mutation, replacing any with the same ids"""
+
+    @abstractmethod
+    def get(self, paymentId: int) -> Optional[Payment]:
+        """Return the payment with the given id, or None"""
+
+    @abstractmethod
+    def remove(self, paymentId: int) -> Optional[Payment]:
+        """Remove and return the payment with the given id, or None if absent"""
+
+    @abstractmethod
+    def iterate(self, filters: Optional[PaymentFilter] = None) -> Iterator[Payment]:
+        """Yield payments in id order, optionally only those matching filters"""
+
+    @abstractmethod
+    def page(self, after: Optional[int], limit: int,
+             filters: Optional[PaymentFilter] = None) -> Tuple[List[Payment], Optional[int]]:
+        """Return up to limit matching payments with ids above the given cursor, and the cursor for the next page"""
+
+    @abstractmethod
+    def aggregate(self, groupBy: str, start: Optional[datetime] = None,
+                  end: Optional[datetime] = None) -> List[Tuple[Optional[str], int, int]]:
+        """Return (key, count, total amount) for payments dated in [start, end), grouped by "card" or "day".
+
+        Day keys are the YYYY-MM-DD part of the payment date. Payments without a
+        date are grouped under None, and left out when a bound is given.
+        """
+
+    @abstractmethod
+    def cardSummary(self, ccNumber: str) -> CardSummary:
+        """Return the running count, total, amount range and latest date of the card's payments, without scanning them"""
+
+    @abstractmethod
+    def clear(self) -> None:
+        """Remove all payments and restart id allocation"""
+
+    @abstractmethod
+    def __contains__(self, paymentId: int) -> bool: ...
+
+    @abstractmethod
+    def __len__(self) -> int: ...
+
+    # Serialized reads; engines with a record cache override _encode
+
+    def _encode(self, payment: Payment) -> bytes:
+        return encodeRecord(payment)
+
+    def getJSON(self, paymentId: int) -> Optional[bytes]:
+        """Return the payment's JSON bytes, or None"""
+        payment = self.get(paymentId)
+        return self._encode(payment) if payment is not None else None
+
+    def iterateJSON(self, filters: Optional[PaymentFilter] = None) -> Iterator[bytes]:
+        """Yield the JSON bytes of each payment in id order, with the same filter as iterate"""
+        return map(self._encode, self.iterate(filters))
+
+    def pageJSON(self, after: Optional[int], limit: int,
+                 filters: Optional[PaymentFilter] = None) -> Tuple[List[bytes], Optional[int]]:
+        """Like page, but returning each payment's JSON bytes"""
+        payments, nextKey = self.page(after, limit, filters)
+        return [self._encode(payment) for payment in payments], nextKey
+
+    def cacheStats(self) -> Optional[Dict[str, int]]:
+        """Return the record cache counters, or None if the engine does not cache"""
+        return None
+
+    # List-style helpers so callers can keep treating paymentsDB like the old list
+
+    def append(self, payment: Payment) -> None:
+        self.add(payment)
+
+    def extend(self, payments: Iterable[Payment]) -> None:
+        self.addMany(list(payments))
+
+    def __iter__(self) -> Iterator[Payment]:
+        return self.iterate()
+
+    def __getitem__(self, index: int) -> Payment:
+        return list(self)[index]
+
+
+class ReplayRepository(ABC):
+    """Idempotency-Key claims and the responses kept for replays, shared by every worker on the same storage.
+
+    claim() gives a key to the first request that sends it, or says what a
+    request with a taken key should do instead. The request holding the claim
+    hands its result to finish(), which keeps a 2xx response for replays and
+    frees the key. A claim not finished within CLAIM_SECONDS is given up.
+    """
+
+    readsBlock = True
+    writesBlock = True
+
+    @abstractmethod
+    def claim(self, key: str, fingerprint: Hashable, waited: bool = False) -> Tuple[str, object]:
+        """Return ("run", claim id), ("replay", (status, body)), ("conflict", None) or ("wait", None).
+
+        waited marks a request checking back after a "wait", which the counters
+        have already seen.
+        """
+
+    @abstractmethod
+    def finish(self, key: str, claimId, result: Optional[Tuple[int, bytes]]) -> None:
+        """Release a claim with the request's (status, body), or None if it raised, keeping a 2xx response"""
+
+    @abstractmethod
+    def stats(self) -> Dict[str, object]:
+        """Return entry count, approximate size, requests in flight and the replay counters"""
+
+    @abstractmethod
+    def clear(self) -> None:
+        """Forget every kept response"""
@@ -0,0 +1,109 @@
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+
+# Default budget for a store's cached JSON
+DEFAULT_CACHE_BYTES = 64 * 1024 * 1024
+
+# Rough cost of one entry beyond its JSON bytes (dict slot, tuple and bytes object headers)
+ENTRY_OVERHEAD = 160
+
+
+def encodeRecord(record) -> bytes:
+    """Serialize a stored record to the JSON bytes used in responses"""
+    return record.model_dump_json().encode()
+
+
+class RecordCache:
+    """Bounded LRU of each stored record's JSON bytes.
+
+    Callers pass the stored row (any immutable value describing the record) along
+    with its key, and an entry only counts as a hit while it was made from an equal
+    row. A reader that races a writer can at worst cache bytes nobody will match
+    again. encode turns a row into JSON bytes. The cold end is evicted once the
+    cache grows past maxBytes; 0 disables caching.
+    """
+
+    def __init__(self, maxBytes: int = DEFAULT_CACHE_BYTES, encode: Callable[[object], bytes] = encodeRecord):
+        self.maxBytes = maxBytes
+        self._encode = encode
+        self._entries: "OrderedDict[Hashable, Tuple[object, bytes]]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, row) -> bytes:
+        """Return the row's JSON bytes, encoding and caching them on a miss"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == row:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        return self.put(key, row)
+
+    def getMany(self, items: Sequence[Tuple[Hashable, object]]) -> List[bytes]:
+        """Batch form of get for (key, row) pairs, taking the lock once for all the lookups"""
+        results: List[bytes] = []
+        missed = []
+        entries = self._entries
+        with self._lock:
+            for i, (key, row) in enumerate(items):
+                entry = entries.get(key)
+                if entry is not None and entry[0] == row:
+                    entries.move_to_end(key)
+                    results.append(entry[1])
+                else:
+                    results.append(b"")
+                    missed.append(i)
+            self.hits += len(items) - len(missed)
+            self.misses += len(missed)
+        for i in missed:
+            results[i] = self.put(*items[i])
+        return results
+
+    @property
+    def enabled(self) -> bool:
+        return self.maxBytes > 0
+
+    def put(self, key: Hashable, row, data: Optional[bytes] = None) -> bytes:
+        """Cache a row that was just written as the most recently used entry, encoding it unless data is given"""
+        if data is None:
+            data = self._encode(row)
+        if self.maxBytes <= 0:
+            return data
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= len(old[1]) + ENTRY_OVERHEAD
+            self._entries[key] = (row, data)
+            self._size += len(data) + ENTRY_OVERHEAD
+            while self._size > self.maxBytes and self._entries:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._size -= len(evicted) + ENTRY_OVERHEAD
+                self.evictions += 1
+        return data
+
+    def discard(self, key: Hashable) -> None:
+        """Drop a deleted or replaced record's bytes"""
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= len(old[1]) + ENTRY_OVERHEAD
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self) -> Dict[str, int]:
+        """Return entry count, approximate size and hit/miss/eviction counters"""
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._size, "maxBytes": self.maxBytes,
+                    "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,605 @@
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from bisect import bisect_left, bisect_right
+from ..models import Payment, User
+from ..persistence import Journal
+from .base import CardSummary, PaymentFilter, PaymentRepository, UserRepository, hasCreditCard
+from .cache import DEFAULT_CACHE_BYTES, RecordCache, encodeRecord
+from .rows import (NO_DATE, PaymentColumns, PaymentRow, UserRow, decodeDate, encodeDate, toPayment, toUser,
+                   toUserRow)
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+
+class OrderedIndex:
+    """Sorted set of integer keys with O(1) add/discard and O(log n) cursor seeks.
+
+    Keys normally arrive in increasing order and are appended to a log. Discarding
+    a key only drops it from the live set; the stale log entry is skipped while
+    iterating, and the log is rebuilt once stale entries outnumber live ones.
+    """
+
+    def __init__(self):
+        self._log: List[int] = []
+        self._live: Set[int] = set()
+
+    def add(self, key: int) -> None:
+        if key in self._live:
+            return
+        self._live.add(key)
+        log = self._log
+        if not log or key > log[-1]:
+            log.append(key)
+            return
+        # Out-of-order key: keep the log sorted, reusing a stale entry if there is one
+        i = bisect_left(log, key)
+        if i == len(log) or log[i] != key:
+            log.insert(i, key)
+
+    def discard(self, key: int) -> None:
+        if key not in self._live:
+            return
+        self._live.discard(key)
+        if len(self._log) > 2 * len(self._live) + 64:
+            # Build a new list so iterators over the old log are unaffected
+            live = self._live
+            self._log = [k for k in self._log if k in live]
+
+    def after(self, key: Optional[int] = None) -> Iterator[int]:
+        """Yield live keys greater than key (or all keys if key is None) in ascending order"""
+        log = self._log
+        live = self._live
+        i = 0 if key is None else bisect_right(log, key)
+        while i < len(log):
+            k = log[i]
+            i += 1
+            if k in live:
+                yield k
+
+    def clear(self) -> None:
+        self._log = []
+        self._live = set()
+
+    def __contains__(self, key: int) -> bool:
+        return key in self._live
+
+    def __len__(self) -> int:
+        return len(self._live)
+
+    def __iter__(self) -> Iterator[int]:
+        return self.after()
+
+
+def _page(keys: Iterator[int], lookup: Callable[[int], Optional[object]], limit: int,
+          predicate: Optional[Callable[[object], bool]] = None) -> Tuple[list, Optional[int]]:
+    """Collect up to limit records from keys, returning them with the cursor key for the next page"""
+    records = []
+    lastKey = None
+    for key in keys:
+        record = lookup(key)
+        if record is None or (predicate is not None and not predicate(record)):
+            continue
+        if len(records) == limit:
+            # There is at least one more matching record after this page
+            return records, lastKey
+        records.append(record)
+        lastKey = key
+    return records, None
+
+
+def _encodeUser(row: UserRow) -> bytes:
+    return encodeRecord(toUser(row))
+
+def _encodePayment(row: PaymentRow) -> bytes:
+    return encodeRecord(toPayment(row))
+
+
+def _encodeAhead(cache: RecordCache, record) -> Optional[bytes]:
+    """JSON bytes for a record about to be written, encoded before any lock is taken; None when the cache is off"""
+    return encodeRecord(record) if cache.enabled else None
+
+
+def _batched(records: Iterator, size: int = 1000) -> Iterator[list]:
+    """Group an iterator into lists of up to size items"""
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class StripedLock:
+    """Fixed pool of locks chosen by key hash, so writers to different keys rarely contend"""
+
+    def __init__(self, stripes: int = 64):
+        self._locks = [threading.Lock() for _ in range(stripes)]
+
+    def __call__(self, key) -> threading.Lock:
+        return self._locks[hash(key) % len(self._locks)]
+
+
+class UserStore(UserRepository):
+    """In-memory user table with a hash index on username and a secondary index on ccNumber.
+
+    Reads take no locks. Writes to the same username are serialized by a striped
+    per-key lock, held until the mutation is durable in the journal, so
+    check-then-insert sequences such as addIfAbsent are atomic. The shared
+    indexes are updated under a short index lock, which covers nothing but the
+    index changes: rows are built and JSON is encoded before it is taken.
+    Users are stored as UserRow tuples and only turned back into User models
+    when read. Each user's JSON is cached when it is written and dropped when
+    it is replaced or removed.
+    """
+
+    def __init__(self, cacheBytes: int = DEFAULT_CACHE_BYTES):
+        # Every insert gets a sequence number; the order index keeps them in signup order
+        self._rows: Dict[int, UserRow] = {}
+        self._seqByUsername: Dict[str, int] = {}
+        self._byCard: Dict[str, Set[str]] = {}
+        self._order = OrderedIndex()
+        # Users split by whether they have a card, so the creditcard filter never scans
+        self._withCard = OrderedIndex()
+        self._withoutCard = OrderedIndex()
+        self._nextSeq = 1
+        self._keyLocks = StripedLock()
+        self._indexLock = threading.Lock()
+        self._journal = Journal()
+        self._cache = RecordCache(cacheBytes, encode=_encodeUser)
+
+    def attachJournal(self, journal: Journal) -> None:
+        """Report every later mutation to the given journal"""
+        self._journal = journal
+
+    # Reads take no locks. Writes can wait on the index lock, which addManyIfAbsent holds for a whole
+    # batch, and on the journal's fsync when there is one.
+    readsBlock = False
+    writesBlock = True
+
+    def getJSON(self, username: str) -> Optional[bytes]:
+        seq = self._seqByUsername.get(username)
+        row = self._rows.get(seq) if seq is not None else None
+        return self._cache.get(username, row) if row is not None else None
+
+    def _encodeMany(self, rows: List[UserRow]) -> List[bytes]:
+        return self._cache.getMany([(row.username, row) for row in rows])
+
+    def iterateJSON(self, hasCard: Optional[bool] = None) -> Iterator[bytes]:
+        # Rows go straight to the cache; models are only built for misses
+        for batch in _batched(self._iterateRows(hasCard)):
+            yield from self._encodeMany(batch)
+
+    def pageJSON(self, after: Optional[int], limit: int,
+                 hasCard: Optional[bool] = None) -> Tuple[List[bytes], Optional[int]]:
+        rows, nextKey = _page(self._partition(hasCard).after(after), self._rows.get, limit)
+        return self._encodeMany(rows), nextKey
+
+    def cacheStats(self) -> Dict[str, int]:
+        return self._cache.stats()
+
+    def _partition(self, hasCard: Optional[bool]) -> OrderedIndex:
+        if hasCard is None:
+            return self._order
+        return self._withCard if hasCard else self._withoutCard
+
+    def add(self, user: User) -> None:
+        """Insert a user, replacing any existing user with the same username"""
+        record = {"op": "addUser", "user": user.model_dump()} if self._journal.enabled else None
+        row, data = toUserRow(user), _encodeAhead(self._cache, user)
+        with self._keyLocks(user.username):
+            with self._indexLock:
+                self._delete(user.username)
+                self._place(user, row)
+                ticket = self._journal.append(record) if record is not None else None
+            if data is not None:
+                self._cache.put(user.username, row, data)
+            self._commit(ticket)
+
+    def addIfAbsent(self, user: User) -> bool:
+        """Insert a user unless the username is taken, returning whether it was inserted"""
+        record = {"op": "addUser", "user": user.model_dump()} if self._journal.enabled else None
+        row, data = toUserRow(user), _encodeAhead(self._cache, user)
+        with self._keyLocks(user.username):
+            # Checked under the index lock so batch inserts, which skip the key locks, cannot slip in between
+            with self._indexLock:
+                if user.username in self._seqByUsername:
+                    return False
+                self._place(user, row)
+                ticket = self._journal.append(record) if record is not None else None
+            if data is not None:
+                self._cache.put(user.username, row, data)
+            self._commit(ticket)
+        return True
+
+    def addManyIfAbsent(self, users: List[User]) -> List[bool]:
+        """Insert every user whose username is free in one index update and one journal record"""
+        rows = [toUserRow(user) for user in users]
+        encoded = [_encodeAhead(self._cache, user) for user in users]
+        records = [user.model_dump() for user in users] if self._journal.enabled else None
+        inserted = []
+        with self._indexLock:
+            for user, row in zip(users, rows):
+                ok = user.username not in self._seqByUsername
+                if ok:
+                    self._place(user, row)
+                inserted.append(ok)
+            ticket = None
+            if records is not None and any(inserted):
+                ticket = self._journal.append({"op": "addUsers", "users": [
+                    record for record, ok in zip(records, inserted) if ok]})
+        for user, row, data, ok in zip(users, rows, encoded, inserted):
+            if ok and data is not None:
+                self._cache.put(user.username, row, data)
+        self._commit(ticket)
+        return inserted
+
+    def existingUsernames(self, usernames: Iterable[str]) -> Set[str]:
+        """Return the subset of the given usernames that are already taken"""
+        return {username for username in usernames if username in self._seqByUsername}
+
+    def update(self, user: User) -> bool:
+        """Replace an existing user in place, keeping its signup position; returns False if absent"""
+        record = {"op": "updateUser", "user": user.model_dump()} if self._journal.enabled else None
+        row, data = toUserRow(user), _encodeAhead(self._cache, user)
+        with self._keyLocks(user.username):
+            with self._indexLock:
+                seq = self._seqByUsername.get(user.username)
+                if seq is None:
+                    return False
+                old = self._rows[seq]
+                if (old.ccNumber, hasCreditCard(old)) != (user.ccNumber, hasCreditCard(user)):
+                    # Card changed: re-file the user under the new card and partition
+                    self._delete(user.username)
+                    self._rows[seq] = row
+                    self._seqByUsername[user.username] = seq
+                    self._order.add(seq)
+                    self._partition(hasCreditCard(user)).add(seq)
+                    if user.ccNumber:
+                        self._byCard.setdefault(user.ccNumber, set()).add(user.username)
+                else:
+                    self._rows[seq] = row
+                ticket = self._journal.append(record) if record is not None else None
+            if data is not None:
+                self._cache.put(user.username, row, data)
+            self._commit(ticket)
+        return True
+
+    def _place(self, user: User, row: UserRow) -> None:
+        """Add a user whose username is free to every index (called with the index lock held)"""
+        seq = self._nextSeq
+        self._nextSeq += 1
+        self._rows[seq] = row
+        self._seqByUsername[user.username] = seq
+        self._order.add(seq)
+        self._partition(hasCreditCard(user)).add(seq)
+        if user.ccNumber:
+            self._byCard.setdefault(user.ccNumber, set()).add(user.username)
+
+    def _commit(self, ticket: Optional[int]) -> None:
+        if ticket is not None:
+            self._journal.commit(ticket)
+
+    def get(self, username: str) -> Optional[User]:
+        """Return the user with the given username, or None"""
+        seq = self._seqByUsername.get(username)
+        row = self._rows.get(seq) if seq is not None else None
+        return toUser(row) if row is not None else None
+
+    def remove(self, username: str) -> Optional[User]:
+        """Remove and return the user with the given username, or None if absent"""
+        with self._keyLocks(username):
+            with self._indexLock:
+                row = self._delete(username)
+                ticket = None
+                if row is not None and self._journal.enabled:
+                    ticket = self._journal.append({"op": "removeUser", "username": username})
+            self._commit(ticket)
+        return toUser(row) if row is not None else None
+
+    def _delete(self, username: str) -> Optional[UserRow]:
+        """Drop a user from every index and return its row (called with the index lock held)"""
+        seq = self._seqByUsername.pop(username, None)
+        if seq is None:
+            return None
+        user = self._rows.pop(seq)
+        self._cache.discard(username)
+        self._order.discard(seq)
+        self._partition(hasCreditCard(user)).discard(seq)
+        if user.ccNumber:
+            owners = self._byCard.get(user.ccNumber)
+            if owners is not None:
+                owners.discard(username)
+                if not owners:
+                    del self._byCard[user.ccNumber]
+        return user
+
+    def hasCard(self, ccNumber: str) -> bool:
+        """Check if the credit card number is registered to any user"""
+        return ccNumber in self._byCard
+
+    def getByCard(self, ccNumber: str) -> List[User]:
+        """Return the users registered with the given credit card number"""
+        # tuple() copies the owner set in one step, so concurrent writers cannot resize it mid-iteration
+        users = (self.get(username) for username in tuple(self._byCard.get(ccNumber, ())))
+        return [user for user in users if user is not None]
+
+    def ownersByCard(self, ccNumbers: Iterable[str]) -> Dict[str, List[str]]:
+        """Return the usernames registered with each of the given cards, leaving out cards nobody has"""
+        byCard = self._byCard
+        owners = {}
+        for ccNumber in ccNumbers:
+            usernames = byCard.get(ccNumber)
+            if usernames:
+                owners[ccNumber] = sorted(usernames)
+        return owners
+
+    def countByCard(self) -> Tuple[int, int]:
+        """Return the number of users with and without a credit card"""
+        return len(self._withCard), len(self._withoutCard)
+
+    def _iterateRows(self, hasCard: Optional[bool] = None) -> Iterator[UserRow]:
+        rows = self._rows
+        for seq in self._partition(hasCard):
+            row = rows.get(seq)
+            if row is not None:
+                yield row
+
+    def iterate(self, hasCard: Optional[bool] = None) -> Iterator[User]:
+        """Yield users in signup order, optionally only those with (True) or without (False) a card"""
+        return map(toUser, self._iterateRows(hasCard))
+
+    def page(self, after: Optional[int], limit: int,
+             hasCard: Optional[bool] = None) -> Tuple[List[User], Optional[int]]:
+        """Return up to limit users inserted after the given cursor, and the cursor for the next page"""
+        rows, nextKey = _page(self._partition(hasCard).after(after), self._rows.get, limit)
+        return [toUser(row) for row in rows], nextKey
+
+    def clear(self) -> None:
+        with self._indexLock:
+            self._rows.clear()
+            self._seqByUsername.clear()
+            self._byCard.clear()
+            self._order.clear()
+            self._withCard.clear()
+            self._withoutCard.clear()
+            self._cache.clear()
+            ticket = self._journal.append({"op": "clearUsers"}) if self._journal.enabled else None
+        self._commit(ticket)
+
+    def __contains__(self, username: str) -> bool:
+        return username in self._seqByUsername
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+
+class PaymentStore(PaymentRepository):
+    """In-memory payment table keyed by id, with a monotonic id counter that never reuses ids.
+
+    Payments are kept in PaymentColumns and only turned back into Payment models
+    when read. Locking follows UserStore: a striped per-id lock for each write, and
+    a short index lock around the column changes and id counter, with JSON encoded
+    before it is taken. Lookups by id read the columns without the lock and check
+    a version counter that writers bump before and after each change (odd while
+    one is under way); a lookup that overlapped a write is retried under the lock.
+    Listings and aggregations, which can rebuild the date index, hold the lock one
+    chunk at a time. JSON is cached per payment as in UserStore.
+    """
+
+    def __init__(self, cacheBytes: int = DEFAULT_CACHE_BYTES):
+        self._columns = PaymentColumns()
+        self._nextId = 1
+        self._keyLocks = StripedLock()
+        self._indexLock = threading.Lock()
+        self._version = 0
+        self._journal = Journal()
+        self._cache = RecordCache(cacheBytes, encode=_encodePayment)
+
+    def attachJournal(self, journal: Journal) -> None:
+        """Report every later mutation to the given journal"""
+        self._journal = journal
+
+    # Scans, card summaries and lookups that overlap a write wait on the index lock, which addMany holds
+    # for a whole batch; writes take it too
+    readsBlock = True
+    writesBlock = True
+
+    @contextmanager
+    def _changing(self):
+        """Hold the index lock around a change to the columns, marking it for lock-free lookups"""
+        with self._indexLock:
+            self._version += 1
+            try:
+                yield
+            finally:
+                self._version += 1
+
+    def _row(self, paymentId: int) -> Optional[PaymentRow]:
+        version = self._version
+        if not version & 1:
+            try:
+                row = self._columns.get(paymentId)
+            except IndexError:
+                # A write resized the columns under the lookup; look again under the lock
+                pass
+            else:
+                if self._version == version:
+                    return row
+        with self._indexLock:
+            return self._columns.get(paymentId)
+
+    def getJSON(self, paymentId: int) -> Optional[bytes]:
+        row = self._row(paymentId)
+        return self._cache.get(paymentId, row) if row is not None else None
+
+    def _encodeMany(self, rows: List[PaymentRow]) -> List[bytes]:
+        return self._cache.getMany([(row[0], row) for row in rows])
+
+    def iterateJSON(self, filters: Optional[PaymentFilter] = None) -> Iterator[bytes]:
+        for rows in self._iterateRows(filters):
+            yield from self._encodeMany(rows)
+
+    def pageJSON(self, after: Optional[int], limit: int,
+                 filters: Optional[PaymentFilter] = None) -> Tuple[List[bytes], Optional[int]]:
+        rows, nextKey = self._pageRows(after, limit, filters)
+        return self._encodeMany(rows), nextKey
+
+    def cacheStats(self) -> Dict[str, int]:
+        return self._cache.stats()
+
+    def _commit(self, ticket: Optional[int]) -> None:
+        if ticket is not None:
+            self._journal.commit(ticket)
+
+    def nextId(self) -> int:
+        """Return the id the next allocateId call will hand out"""
+        return self._nextId
+
+    def advanceNextId(self, nextId: int) -> None:
+        """Make sure no id below nextId is handed out again"""
+        with self._indexLock:
+            if nextId > self._nextId:
+                self._nextId = nextId
+
+    def allocateId(self) -> int:
+        """Reserve and return the next payment id"""
+        with self._indexLock:
+            paymentId = self._nextId
+            self._nextId += 1
+        return paymentId
+
+    def add(self, payment: Payment) -> None:
+        """Insert a payment, replacing any existing payment with the same id"""
+        if payment.id is None:
+            raise ValueError("Payment id is required")
+        record = {"op": "addPayment", "payment": payment.model_dump()} if self._journal.enabled else None
+        # The payment in hand encodes to the same bytes as its row, without building a model from it
+        data = _encodeAhead(self._cache, payment)
+        with self._keyLocks(payment.id):
+            with self._changing():
+                # Keep the counter ahead of ids that were assigned elsewhere
+                if payment.id >= self._nextId:
+                    self._nextId = payment.id + 1
+                row = self._columns.put(payment)
+                ticket = self._journal.append(record) if record is not None else None
+            if data is not None:
+                self._cache.put(payment.id, row, data)
+            self._commit(ticket)
+
+    def allocateIds(self, count: int) -> int:
+        """Reserve count consecutive ids and return the first one"""
+        with self._indexLock:
+            firstId = self._nextId
+            self._nextId += count
+        return firstId
+
+    def addMany(self, payments: List[Payment]) -> None:
+        """Insert a batch of payments under one index lock and one journal record"""
+        if any(payment.id is None for payment in payments):
+            raise ValueError("Payment id is required")
+        if not payments:
+            return
+        record = {"op": "addPayments", "payments": [p.model_dump() for p in payments]} if self._journal.enabled else None
+        encoded = [_encodeAhead(self._cache, payment) for payment in payments]
+        highest = max(payment.id for payment in payments)
+        with self._changing():
+            if highest >= self._nextId:
+                self._nextId = highest + 1
+            rows = self._columns.putMany(payments)
+            ticket = self._journal.append(record) if record is not None else None
+        cache = self._cache
+        for payment, row, data in zip(payments, rows, encoded):
+            if data is not None:
+                cache.put(payment.id, row, data)
+        self._commit(ticket)
+
+    def get(self, paymentId: int) -> Optional[Payment]:
+        """Return the payment with the given id, or None"""
+        row = self._row(paymentId)
+        return toPayment(row) if row is not None else None
+
+    def remove(self, paymentId: int) -> Optional[Payment]:
+        """Remove and return the payment with the given id, or None if absent"""
+        with self._keyLocks(paymentId):
+            with self._changing():
+                row = self._columns.remove(paymentId)
+                ticket = None
+                if row is not None:
+                    self._cache.discard(paymentId)
+                    if self._journal.enabled:
+                        ticket = self._journal.append({"op": "removePayment", "id": paymentId})
+            self._commit(ticket)
+        return toPayment(row) if row is not None else None
+
+    def _select(self, after: Optional[int], limit: int, filters: Optional[PaymentFilter]) -> List[PaymentRow]:
+        """Read matching rows from the columns under the index lock"""
+        if filters is None:
+            with self._indexLock:
+                return self._columns.select(after, limit)
+        start = encodeDate(filters.start.isoformat()) if filters.start is not None else None
+        end = encodeDate(filters.end.isoformat()) if filters.end is not None else None
+        with self._indexLock:
+            return self._columns.select(after, limit, filters.ccNumber, start, end,
+                                        filters.minAmount, filters.maxAmount)
+
+    def _pageRows(self, after: Optional[int], limit: int,
+                  filters: Optional[PaymentFilter] = None) -> Tuple[List[PaymentRow], Optional[int]]:
+        rows = self._select(after, limit + 1, filters)
+        if len(rows) > limit:
+            # There is at least one more payment after this page
+            rows = rows[:limit]
+            return rows, rows[-1][0] if rows else after
+        return rows, None
+
+    def _iterateRows(self, filters: Optional[PaymentFilter] = None,
+                     size: int = 1000) -> Iterator[List[PaymentRow]]:
+        """Yield matching rows in id order, size at a time, releasing the lock between chunks"""
+        after = None
+        while True:
+            rows = self._select(after, size, filters)
+            if not rows:
+                return
+            yield rows
+            after = rows[-1][0]
+
+    def page(self, after: Optional[int], limit: int,
+             filters: Optional[PaymentFilter] = None) -> Tuple[List[Payment], Optional[int]]:
+        """Return up to limit matching payments with ids above the given cursor, and the cursor for the next page"""
+        rows, nextKey = self._pageRows(after, limit, filters)
+        return [toPayment(row) for row in rows], nextKey
+
+    def iterate(self, filters: Optional[PaymentFilter] = None) -> Iterator[Payment]:
+        for rows in self._iterateRows(filters):
+            yield from map(toPayment, rows)
+
+    def aggregate(self, groupBy: str, start: Optional[datetime] = None,
+                  end: Optional[datetime] = None) -> List[Tuple[Optional[str], int, int]]:
+        # Vectorized over the columns; writers wait for the scan
+        with self._indexLock:
+            return self._columns.aggregate(groupBy, encodeDate(start.isoformat()) if start is not None else None,
+                                           encodeDate(end.isoformat()) if end is not None else None)
+
+    def cardSummary(self, ccNumber: str) -> CardSummary:
+        with self._indexLock:
+            rollup = self._columns.rollup(ccNumber)
+            if rollup is None or rollup.count == 0:
+                return CardSummary()
+            lastDate = decodeDate(rollup.lastDate) if rollup.lastDate != NO_DATE else None
+            return CardSummary(rollup.count, rollup.total, rollup.minAmount, rollup.maxAmount, lastDate)
+
+    def clear(self) -> None:
+        """Remove all payments and restart id allocation"""
+        with self._changing():
+            self._columns.clear()
+            self._cache.clear()
+            self._nextId = 1
+            ticket = self._journal.append({"op": "clearPayments"}) if self._journal.enabled else None
+        self._commit(ticket)
+
+    def __contains__(self, paymentId: int) -> bool:
+        return self._row(paymentId) is not None
+
+    def __len__(self) -> int:
+        return len(self._columns)
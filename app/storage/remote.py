@@ -0,0 +1,334 @@
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime
+from multiprocessing.connection import Client, Connection
+from typing import Dict, Hashable, Iterable, Iterator, List, Optional, Set, Tuple
+
+from ..models import Payment, User
+from .base import CardSummary, PaymentFilter, PaymentRepository, ReplayRepository, UserRepository
+
+# Which store a call is for; the server keeps its stores in this order
+USERS, PAYMENTS, REPLAYS = 0, 1, 2
+
+# Rows fetched per round trip when iterating a whole table
+ITERATE_BATCH_SIZE = 1000
+
+
+def keyPath(address: str) -> str:
+    """Where the storage server writes its generated authkey"""
+    return address + ".key"
+
+
+class StorageClient:
+    """Pipelined connection from one worker process to the storage server.
+
+    Calls from any thread are queued. A sender thread writes everything queued
+    so far as one batch, without waiting for the replies to earlier batches, and
+    a receiver thread resolves each call's future as its reply arrives. So N
+    threads calling at once cost one message each way, not N round trips.
+    Connects on first use, waiting up to connectTimeout seconds for the server
+    to start, and reconnects on the next call after losing the server. Calls in
+    flight when the connection drops fail with ConnectionError.
+    """
+
+    def __init__(self, address: str, authkey: Optional[bytes] = None, connectTimeout: float = 10.0):
+        self.address = address
+        self.connectTimeout = connectTimeout
+        self._authkey = authkey
+        self._lock = threading.Lock()
+        self._queued = threading.Condition(self._lock)
+        self._queue: List[tuple] = []
+        self._pending: Dict[int, Future] = {}
+        self._nextCall = 0
+        self._conn: Optional[Connection] = None
+        # Number of batches sent, for measuring how well calls are batched
+        self.batches = 0
+
+    def call(self, target: int, method: str, *args):
+        """Run a store method on the server and return its result, re-raising its exception"""
+        return self.submit(target, method, *args).result()
+
+    def submit(self, target: int, method: str, *args) -> Future:
+        """Queue a store method call and return a future for its result"""
+        future: Future = Future()
+        with self._lock:
+            if self._conn is None:
+                self._connect()
+            callId = self._nextCall
+            self._nextCall += 1
+            self._pending[callId] = future
+            self._queue.append((callId, target, method, args))
+            self._queued.notify()
+        return future
+
+    def _connect(self) -> None:
+        deadline = time.monotonic() + self.connectTimeout
+        while True:
+            try:
+                authkey = self._authkey
+                if authkey is None:
+                    with open(keyPath(self.address), "rb") as f:
+                        authkey = f.read()
+                conn = Client(self.address, family="AF_UNIX", authkey=authkey)
+                break
+            except (FileNotFoundError, ConnectionRefusedError):
+                # The server is not up yet (or is restarting)
+                if time.monotonic() >= deadline:
+                    raise
+                time.sleep(0.05)
+        self._conn = conn
+        threading.Thread(target=self._send, args=(conn,), name="storage-send", daemon=True).start()
+        threading.Thread(target=self._receive, args=(conn,), name="storage-receive", daemon=True).start()
+
+    def _send(self, conn: Connection) -> None:
+        while True:
+            with self._lock:
+                while not self._queue and self._conn is conn:
+                    self._queued.wait()
+                if self._conn is not conn:
+                    return
+                batch, self._queue = self._queue, []
+            try:
+                conn.send(batch)
+            except (OSError, ValueError) as e:
+                self._fail(conn, ConnectionError(f"Lost the storage server: {e}"))
+                return
+            self.batches += 1
+
+    def _receive(self, conn: Connection) -> None:
+        while True:
+            try:
+                replies = conn.recv()
+            except (EOFError, OSError) as e:
+                self._fail(conn, ConnectionError(f"Lost the storage server: {e or 'connection closed'}"))
+                return
+            with self._lock:
+                done = [(self._pending.pop(callId, None), error, result) for callId, error, result in replies]
+            for future, error, result in done:
+                if future is None:
+                    # Already failed by close()
+                    continue
+                if error is None:
+                    future.set_result(result)
+                else:
+                    future.set_exception(error)
+
+    def _fail(self, conn: Connection, error: Exception) -> None:
+        """Drop the connection and fail every call still waiting on it"""
+        with self._lock:
+            if self._conn is not conn:
+                return
+            self._conn = None
+            pending, self._pending = self._pending, {}
+            self._queue = []
+            self._queued.notify_all()
+        conn.close()
+        for future in pending.values():
+            future.set_exception(error)
+
+    def close(self) -> None:
+        with self._lock:
+            conn = self._conn
+        if conn is not None:
+            self._fail(conn, ConnectionError("Storage client closed"))
+
+
+class RemoteUserStore(UserRepository):
+    """UserRepository whose calls run on the storage server's user store"""
+
+    def __init__(self, client: StorageClient):
+        self._client = client
+
+    def _call(self, method: str, *args):
+        return self._client.call(USERS, method, *args)
+
+    def submit(self, method: str, *args) -> Future:
+        """Start a call on the server's store without waiting, for the async facade"""
+        return self._client.submit(USERS, method, *args)
+
+    def add(self, user: User) -> None:
+        self._call("add", user)
+
+    def addIfAbsent(self, user: User) -> bool:
+        return self._call("addIfAbsent", user)
+
+    def addManyIfAbsent(self, users: List[User]) -> List[bool]:
+        return self._call("addManyIfAbsent", list(users))
+
+    def existingUsernames(self, usernames: Iterable[str]) -> Set[str]:
+        return self._call("existingUsernames", list(usernames))
+
+    def update(self, user: User) -> bool:
+        return self._call("update", user)
+
+    def get(self, username: str) -> Optional[User]:
+        return self._call("get", username)
+
+    def remove(self, username: str) -> Optional[User]:
+        return self._call("remove", username)
+
+    def hasCard(self, ccNumber: str) -> bool:
+        return self._call("hasCard", ccNumber)
+
+    def getByCard(self, ccNumber: str) -> List[User]:
+        return self._call("getByCard", ccNumber)
+
+    def ownersByCard(self, ccNumbers: Iterable[str]) -> Dict[str, List[str]]:
+        return self._call("ownersByCard", list(ccNumbers))
+
+    def countByCard(self) -> Tuple[int, int]:
+        return self._call("countByCard")
+
+    def iterate(self, hasCard: Optional[bool] = None) -> Iterator[User]:
+        # Generators cannot cross the socket, so whole-table reads go page by page
+        after = None
+        while True:
+            users, after = self.page(after, ITERATE_BATCH_SIZE, hasCard)
+            yield from users
+            if after is None:
+                return
+
+    def page(self, after: Optional[int], limit: int,
+             hasCard: Optional[bool] = None) -> Tuple[List[User], Optional[int]]:
+        return self._call("page", after, limit, hasCard)
+
+    def clear(self) -> None:
+        self._call("clear")
+
+    def __contains__(self, username: str) -> bool:
+        return self._call("__contains__", username)
+
+    def __len__(self) -> int:
+        return self._call("__len__")
+
+    def getJSON(self, username: str) -> Optional[bytes]:
+        return self._call("getJSON", username)
+
+    def iterateJSON(self, hasCard: Optional[bool] = None) -> Iterator[bytes]:
+        after = None
+        while True:
+            users, after = self.pageJSON(after, ITERATE_BATCH_SIZE, hasCard)
+            yield from users
+            if after is None:
+                return
+
+    def pageJSON(self, after: Optional[int], limit: int,
+                 hasCard: Optional[bool] = None) -> Tuple[List[bytes], Optional[int]]:
+        return self._call("pageJSON", after, limit, hasCard)
+
+    def cacheStats(self) -> Optional[Dict[str, int]]:
+        return self._call("cacheStats")
+
+    def extend(self, users: Iterable[User]) -> None:
+        self._call("extend", list(users))
+
+
+class RemotePaymentStore(PaymentRepository):
+    """PaymentRepository whose calls run on the storage server's payment store, so ids come from one counter"""
+
+    def __init__(self, client: StorageClient):
+        self._client = client
+
+    def _call(self, method: str, *args):
+        return self._client.call(PAYMENTS, method, *args)
+
+    def submit(self, method: str, *args) -> Future:
+        """Start a call on the server's store without waiting, for the async facade"""
+        return self._client.submit(PAYMENTS, method, *args)
+
+    def allocateId(self) -> int:
+        return self._call("allocateId")
+
+    def nextId(self) -> int:
+        return self._call("nextId")
+
+    def advanceNextId(self, nextId: int) -> None:
+        self._call("advanceNextId", nextId)
+
+    def allocateIds(self, count: int) -> int:
+        return self._call("allocateIds", count)
+
+    def add(self, payment: Payment) -> None:
+        self._call("add", payment)
+
+    def addMany(self, payments: List[Payment]) -> None:
+        self._call("addMany", list(payments))
+
+    def get(self, paymentId: int) -> Optional[Payment]:
+        return self._call("get", paymentId)
+
+    def remove(self, paymentId: int) -> Optional[Payment]:
+        return self._call("remove", paymentId)
+
+    def iterate(self, filters: Optional[PaymentFilter] = None) -> Iterator[Payment]:
+        after = None
+        while True:
+            payments, after = self.page(after, ITERATE_BATCH_SIZE, filters)
+            yield from payments
+            if after is None:
+                return
+
+    def page(self, after: Optional[int], limit: int,
+             filters: Optional[PaymentFilter] = None) -> Tuple[List[Payment], Optional[int]]:
+        return self._call("page", after, limit, filters)
+
+    def aggregate(self, groupBy: str, start: Optional[datetime] = None,
+                  end: Optional[datetime] = None) -> List[Tuple[Optional[str], int, int]]:
+        return self._call("aggregate", groupBy, start, end)
+
+    def cardSummary(self, ccNumber: str) -> CardSummary:
+        return self._call("cardSummary", ccNumber)
+
+    def clear(self) -> None:
+        self._call("clear")
+
+    def __contains__(self, paymentId: int) -> bool:
+        return self._call("__contains__", paymentId)
+
+    def __len__(self) -> int:
+        return self._call("__len__")
+
+    def getJSON(self, paymentId: int) -> Optional[bytes]:
+        return self._call("getJSON", paymentId)
+
+    def iterateJSON(self, filters: Optional[PaymentFilter] = None) -> Iterator[bytes]:
+        after = None
+        while True:
+            payments, after = self.pageJSON(after, ITERATE_BATCH_SIZE, filters)
+            yield from payments
+            if after is None:
+                return
+
+    def pageJSON(self, after: Optional[int], limit: int,
+                 filters: Optional[PaymentFilter] = None) -> Tuple[List[bytes], Optional[int]]:
+        return self._call("pageJSON", after, limit, filters)
+
+    def cacheStats(self) -> Optional[Dict[str, int]]:
+        return self._call("cacheStats")
+
+
+class RemoteReplayStore(ReplayRepository):
+    """ReplayRepository whose calls run on the storage server, so every worker sees the same Idempotency-Keys"""
+
+    def __init__(self, client: StorageClient):
+        self._client = client
+
+    def _call(self, method: str, *args):
+        return self._client.call(REPLAYS, method, *args)
+
+    def submit(self, method: str, *args) -> Future:
+        """Start a call on the server's store without waiting, for the async facade"""
+        return self._client.submit(REPLAYS, method, *args)
+
+    def claim(self, key: str, fingerprint: Hashable, waited: bool = False) -> Tuple[str, object]:
+        return self._call("claim", key, fingerprint, waited)
+
+    def finish(self, key: str, claimId, result: Optional[Tuple[int, bytes]]) -> None:
+        self._call("finish", key, claimId, result)
+
+    def stats(self) -> Dict[str, object]:
+        return self._call("stats")
+
+    def clear(self) -> None:
+        self._call("clear")
@@ -0,0 +1,571 @@
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from ..models import Payment, User
+
+
+class UserRow(NamedTuple):
+    """Stored form of a user: a plain tuple instead of a model instance with its own __dict__"""
+    username: str
+    password: str
+    email: str
+    birthdate: str
+    ccNumber: Optional[str]
+
+
+def toUserRow(user: User) -> UserRow:
+    # Many users share a birthdate; interning keeps one copy of each
+    return UserRow(user.username, user.password, user.email, sys.intern(user.birthdate), user.ccNumber)
+
+def toUser(row: UserRow) -> User:
+    return User(username=row.username, password=row.password, email=row.email,
+                birthdate=row.birthdate, ccNumber=row.ccNumber)
+
+
+# Payment dates are kept as microseconds since 1970-01-01 (naive, like datetime.now().isoformat()).
+# Dates that would not round-trip through that form are kept as strings on the side.
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+NO_DATE = -(1 << 63)
+OTHER_DATE = NO_DATE + 1
+
+def encodeDate(date: Optional[str]) -> int:
+    """Return a payment date as epoch microseconds, NO_DATE for None or OTHER_DATE if it is not canonical ISO"""
+    if date is None:
+        return NO_DATE
+    try:
+        parsed = datetime.fromisoformat(date)
+    except ValueError:
+        return OTHER_DATE
+    if parsed.tzinfo is not None or parsed.isoformat() != date:
+        return OTHER_DATE
+    return (parsed - _EPOCH) // _MICROSECOND
+
+def decodeDate(value: int) -> str:
+    return (_EPOCH + timedelta(microseconds=value)).isoformat()
+
+
+# A payment as read from the columns: (id, card number, amount, date value, non-canonical date or None).
+# Cheap to build and compare, so it doubles as the record cache's row.
+PaymentRow = Tuple[int, str, int, int, Optional[str]]
+
+def toPayment(row: PaymentRow) -> Payment:
+    paymentId, ccNumber, amount, date, otherDate = row
+    if date == NO_DATE:
+        text = None
+    elif date == OTHER_DATE:
+        text = otherDate
+    else:
+        text = decodeDate(date)
+    return Payment(id=paymentId, ccNumber=ccNumber, amount=amount, date=text)
+
+
+# Slots allocated when a PaymentColumns is created or emptied; columns double when full
+INITIAL_CAPACITY = 1024
+
+MICROSECONDS_PER_DAY = 86_400_000_000
+
+
+class CardRollup:
+    """Running count, total, smallest and largest amount, and latest date of one card's live payments.
+
+    Adding a payment updates every field in O(1). Removing one updates count and
+    total; if it held the smallest or largest amount or the latest date, those
+    are marked stale and recomputed from the columns when next read.
+    """
+    __slots__ = ("count", "total", "minAmount", "maxAmount", "lastDate", "stale")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.minAmount = 0
+        self.maxAmount = 0
+        self.lastDate = NO_DATE
+        self.stale = False
+
+    def add(self, amount: int, date: int) -> None:
+        if self.count == 0:
+            self.minAmount = self.maxAmount = amount
+        elif amount < self.minAmount:
+            self.minAmount = amount
+        elif amount > self.maxAmount:
+            self.maxAmount = amount
+        # Only canonical dates count towards the latest one
+        if date > self.lastDate and date != OTHER_DATE:
+            self.lastDate = date
+        self.count += 1
+        self.total += amount
+
+    def discard(self, amount: int, date: int) -> None:
+        self.count -= 1
+        self.total -= amount
+        if self.count == 0:
+            self.lastDate = NO_DATE
+            self.stale = False
+        elif amount == self.minAmount or amount == self.maxAmount or date == self.lastDate:
+            self.stale = True
+
+
+def _dayLabel(day: int) -> str:
+    return (_EPOCH + timedelta(days=day)).date().isoformat()
+
+
+class PaymentColumns:
+    """Payments stored column by column in id order: about 40 bytes per payment instead of a model each.
+
+    ids, amounts and dates are int64 NumPy arrays, card numbers are interned into
+    a table and stored as int32 indexes, and a bool per slot marks deleted
+    payments. Ids normally arrive in increasing order and are appended; an
+    out-of-order id is inserted in place. Deleted slots are dropped once they
+    outnumber live ones. Since the columns are plain arrays, aggregations run
+    vectorized over them. Not thread-safe: callers hold the store's lock.
+
+    Two secondary indexes serve filtered listings. Each card has a posting list
+    of its payment ids in increasing order. While dates never decrease in slot
+    order (payments stamped on creation), the date column itself is bisected;
+    otherwise a date-sorted copy of the ids is built on demand and topped up
+    with the ids written since.
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self) -> None:
+        self._ids = np.empty(INITIAL_CAPACITY, np.int64)
+        self._amounts = np.empty(INITIAL_CAPACITY, np.int64)
+        self._cards = np.empty(INITIAL_CAPACITY, np.int32)
+        self._dates = np.empty(INITIAL_CAPACITY, np.int64)
+        self._alive = np.zeros(INITIAL_CAPACITY, np.bool_)
+        self._cardNumbers: List[str] = []
+        self._cardIndex: Dict[str, int] = {}
+        # Per card number, at the card's index: its rollup and its posting list of ids.
+        # Posting lists keep ids of deleted or re-carded payments until the next compaction; readers check the slot.
+        self._rollups: List[CardRollup] = []
+        self._postings: List[array] = []
+        self._otherDates: Dict[int, str] = {}
+        self._size = 0
+        self._live = 0
+        # Highest id ever put, as a Python int so the append check skips NumPy scalars
+        self._lastId = 0
+        # Whether dates never decrease in id order, as when payments are stamped on creation;
+        # range queries then bisect the date column instead of scanning it
+        self._datesOrdered = True
+        # Date index for when dates are out of order: sorted dates with their ids, plus ids written since
+        self._indexDates: Optional[np.ndarray] = None
+        self._indexIds: Optional[np.ndarray] = None
+        self._indexPending: List[int] = []
+
+    def _reallocate(self, capacity: int, keep: Optional[np.ndarray] = None) -> None:
+        """Move the used slots (or only the keep slots) into columns with room for capacity payments"""
+        size = self._size if keep is None else len(keep)
+
+        def move(column: np.ndarray) -> np.ndarray:
+            moved = np.empty(capacity, column.dtype)
+            moved[:size] = column[:size] if keep is None else column[keep]
+            return moved
+
+        self._ids = move(self._ids)
+        self._amounts = move(self._amounts)
+        self._cards = move(self._cards)
+        self._dates = move(self._dates)
+        self._alive = move(self._alive)
+        self._size = size
+        if keep is not None:
+            self._reindex()
+
+    def _reindex(self) -> None:
+        """Rebuild the posting lists from the live slots and drop the date index (after compacting)"""
+        size = self._size
+        order = np.argsort(self._cards[:size], kind="stable")
+        ids = self._ids[:size][order]
+        bounds = np.searchsorted(self._cards[:size][order], np.arange(len(self._cardNumbers) + 1)).tolist()
+        self._postings = [array("q", ids[lo:hi].tobytes()) for lo, hi in zip(bounds, bounds[1:])]
+        self._indexDates = self._indexIds = None
+        self._indexPending = []
+
+    def _card(self, ccNumber: str) -> int:
+        index = self._cardIndex.get(ccNumber)
+        if index is None:
+            index = self._cardIndex[ccNumber] = len(self._cardNumbers)
+            self._cardNumbers.append(ccNumber)
+            self._rollups.append(CardRollup())
+            self._postings.append(array("q"))
+        return index
+
+    def _post(self, card: int, paymentId: int) -> None:
+        """Add an id to a card's posting list unless it is already there"""
+        posting = self._postings[card]
+        if not posting or paymentId > posting[-1]:
+            posting.append(paymentId)
+            return
+        i = bisect_left(posting, paymentId)
+        if i == len(posting) or posting[i] != paymentId:
+            posting.insert(i, paymentId)
+
+    def _find(self, paymentId: int) -> int:
+        """Return the slot holding paymentId, or -1"""
+        size = self._size
+        i = int(np.searchsorted(self._ids[:size], paymentId))
+        return i if i < size and self._ids[i] == paymentId else -1
+
+    def _keepsOrder(self, before: int, date: int, after: int) -> bool:
+        """Check that date fits between the dates in slots before and after (either may be out of range)"""
+        return (before < 0 or self._dates[before] <= date) and (after >= self._size or date <= self._dates[after])
+
+    def _dated(self, paymentId: int, ordered: bool) -> None:
+        """Record a write's effect on the date index"""
+        if not ordered:
+            self._datesOrdered = False
+        if not self._datesOrdered and self._indexIds is not None:
+            self._indexPending.append(paymentId)
+
+    def put(self, payment: Payment) -> PaymentRow:
+        """Insert a payment, replacing a live or deleted slot with the same id, and return its row"""
+        paymentId = payment.id
+        card = self._card(payment.ccNumber)
+        date = encodeDate(payment.date)
+        otherDate = None
+        if date == OTHER_DATE:
+            otherDate = self._otherDates[paymentId] = payment.date
+        elif self._otherDates:
+            self._otherDates.pop(paymentId, None)
+        row = (paymentId, self._cardNumbers[card], payment.amount, date, otherDate)
+        self._post(card, paymentId)
+
+        size = self._size
+        if size and paymentId <= self._lastId:
+            i = int(np.searchsorted(self._ids[:size], paymentId))
+            # i can be size when the highest id was deleted and compacted away
+            if i < size and self._ids[i] == paymentId:
+                if self._alive[i]:
+                    self._rollups[self._cards[i]].discard(int(self._amounts[i]), int(self._dates[i]))
+                else:
+                    self._alive[i] = True
+                    self._live += 1
+                self._dated(paymentId, self._keepsOrder(i - 1, date, i + 1))
+                self._amounts[i] = payment.amount
+                self._cards[i] = card
+                self._dates[i] = date
+                self._rollups[card].add(payment.amount, date)
+                return row
+            self._dated(paymentId, self._keepsOrder(i - 1, date, i))
+        else:
+            i = size
+            self._lastId = paymentId
+            self._dated(paymentId, self._keepsOrder(i - 1, date, i))
+        if size == len(self._ids):
+            self._reallocate(2 * size)
+        if i < size:
+            # Out-of-order id: shift the later slots up by one
+            for column in (self._ids, self._amounts, self._cards, self._dates, self._alive):
+                column[i + 1:size + 1] = column[i:size]
+        self._ids[i] = paymentId
+        self._amounts[i] = payment.amount
+        self._cards[i] = card
+        self._dates[i] = date
+        self._alive[i] = True
+        self._size += 1
+        self._live += 1
+        self._rollups[card].add(payment.amount, date)
+        return row
+
+    def putMany(self, payments: List[Payment]) -> List[PaymentRow]:
+        """put each payment, appending whole columns at once when the ids are new and increasing"""
+        ids = [payment.id for payment in payments]
+        size = self._size
+        if not ids or (size and ids[0] <= self._lastId) or any(a >= b for a, b in zip(ids, ids[1:])):
+            return [self.put(payment) for payment in payments]
+
+        count = len(ids)
+        if size + count > len(self._ids):
+            self._reallocate(max(2 * len(self._ids), size + count))
+        # A batch usually shares one date, so each distinct string is parsed once
+        dateValues: Dict[Optional[str], int] = {}
+        cards, amounts, dates, rows = [], [], [], []
+        names = self._cardNumbers
+        postings = self._postings
+        for payment in payments:
+            date = dateValues.get(payment.date)
+            if date is None:
+                date = dateValues[payment.date] = encodeDate(payment.date)
+            card = self._card(payment.ccNumber)
+            otherDate = None
+            if date == OTHER_DATE:
+                otherDate = self._otherDates[payment.id] = payment.date
+            self._rollups[card].add(payment.amount, date)
+            # Every id is above the card's last one, so the posting list stays sorted
+            postings[card].append(payment.id)
+            cards.append(card)
+            amounts.append(payment.amount)
+            dates.append(date)
+            rows.append((payment.id, names[card], payment.amount, date, otherDate))
+        ordered = self._keepsOrder(size - 1, dates[0], size) and all(a <= b for a, b in zip(dates, dates[1:]))
+        if not ordered:
+            self._datesOrdered = False
+        if not self._datesOrdered and self._indexIds is not None:
+            self._indexPending.extend(ids)
+        end = size + count
+        self._ids[size:end] = ids
+        self._amounts[size:end] = amounts
+        self._cards[size:end] = cards
+        self._dates[size:end] = dates
+        self._alive[size:end] = True
+        self._size = end
+        self._live += count
+        self._lastId = ids[-1]
+        return rows
+
+    def _row(self, i: int) -> PaymentRow:
+        paymentId = int(self._ids[i])
+        date = int(self._dates[i])
+        return (paymentId, self._cardNumbers[self._cards[i]], int(self._amounts[i]), date,
+                self._otherDates.get(paymentId) if date == OTHER_DATE else None)
+
+    def _rows(self, slots: np.ndarray) -> List[PaymentRow]:
+        names = self._cardNumbers
+        otherDates = self._otherDates
+        return [(paymentId, names[card], amount, date, otherDates.get(paymentId) if date == OTHER_DATE else None)
+                for paymentId, card, amount, date in zip(self._ids[slots].tolist(), self._cards[slots].tolist(),
+                                                         self._amounts[slots].tolist(), self._dates[slots].tolist())]
+
+    def get(self, paymentId: int) -> Optional[PaymentRow]:
+        i = self._find(paymentId)
+        return self._row(i) if i >= 0 and self._alive[i] else None
+
+    def remove(self, paymentId: int) -> Optional[PaymentRow]:
+        i = self._find(paymentId)
+        if i < 0 or not self._alive[i]:
+            return None
+        row = self._row(i)
+        self._alive[i] = False
+        self._live -= 1
+        self._rollups[self._cards[i]].discard(row[2], row[3])
+        self._otherDates.pop(paymentId, None)
+        if self._size > 2 * self._live + 64:
+            keep = np.flatnonzero(self._alive[:self._size])
+            self._reallocate(max(INITIAL_CAPACITY, 2 * len(keep)), keep)
+        return row
+
+    def _slotsOf(self, ids: np.ndarray) -> np.ndarray:
+        """Return the slots holding the given sorted ids, leaving out ids that are no longer stored"""
+        size = self._size
+        slots = np.searchsorted(self._ids[:size], ids)
+        slots = slots[slots < size]
+        return slots[self._ids[slots] == ids[:len(slots)]]
+
+    def _candidates(self, after: Optional[int], window: int, ccNumber: Optional[str],
+                    start: Optional[int], end: Optional[int]) -> Iterator[np.ndarray]:
+        """Yield slots that may match, in id order, from the narrowest index that applies"""
+        size = self._size
+        if ccNumber is not None:
+            card = self._cardIndex.get(ccNumber)
+            if card is None:
+                return
+            posting = self._postings[card]
+            i = 0 if after is None else bisect_right(posting, after)
+            while i < len(posting):
+                slots = self._slotsOf(np.array(posting[i:i + window], np.int64))
+                i += window
+                yield slots[self._cards[slots] == card]
+            return
+
+        if (start is not None or end is not None) and not self._datesOrdered:
+            ids = self._datedIds(start, end)
+            if after is not None:
+                ids = ids[np.searchsorted(ids, after, side="right"):]
+            for i in range(0, len(ids), window):
+                yield self._slotsOf(ids[i:i + window])
+            return
+
+        lo, hi = 0, size
+        if self._datesOrdered:
+            # NO_DATE and OTHER_DATE sort below every real date, so undated slots can only come first
+            dates = self._dates[:size]
+            if end is not None:
+                hi = int(np.searchsorted(dates, end))
+            if start is not None:
+                lo = int(np.searchsorted(dates[:hi], start))
+        if after is not None:
+            lo = max(lo, int(np.searchsorted(self._ids[:size], after, side="right")))
+        for i in range(lo, hi, window):
+            yield np.arange(i, min(hi, i + window))
+
+    def _datedIds(self, start: Optional[int], end: Optional[int]) -> np.ndarray:
+        """Return the sorted ids that may be dated in [start, end) when the date column is out of order.
+
+        The date-sorted index is rebuilt once the ids written since it was built
+        pass a sixteenth of the table; until then they are all returned as
+        candidates, and callers check each slot's date.
+        """
+        size = self._size
+        if self._indexIds is None or len(self._indexPending) > max(1024, size // 16):
+            order = np.argsort(self._dates[:size], kind="stable")
+            self._indexDates = self._dates[:size][order]
+            self._indexIds = self._ids[:size][order]
+            self._indexPending = []
+        dates = self._indexDates
+        lo = int(np.searchsorted(dates, start)) if start is not None else 0
+        hi = int(np.searchsorted(dates, end)) if end is not None else len(dates)
+        ids = self._indexIds[lo:hi]
+        if self._indexPending:
+            ids = np.concatenate([ids, np.array(self._indexPending, np.int64)])
+        return np.unique(ids)
+
+    def select(self, after: Optional[int], limit: int, ccNumber: Optional[str] = None,
+               start: Optional[int] = None, end: Optional[int] = None, minAmount: Optional[int] = None,
+               maxAmount: Optional[int] = None) -> List[PaymentRow]:
+        """Return up to limit live rows with ids above after (or from the start) that match every given condition.
+
+        start and end bound the date to [start, end) in epoch microseconds; payments
+        without a canonical date never match a date bound. Candidates come from the
+        card's posting list or the date index, so the cost is O(log n + k) in the
+        number of candidates k rather than the table size.
+        """
+        # Windows cover the rest of the page, but stay large enough that selective filters do not loop per row
+        window = max(limit, 256)
+        found, matched = 0, []
+        for slots in self._candidates(after, window, ccNumber, start, end):
+            keep = self._alive[slots]
+            if start is not None:
+                keep &= self._dates[slots] >= start
+            if end is not None:
+                dates = self._dates[slots]
+                keep &= (dates < end) & (dates > OTHER_DATE)
+            if minAmount is not None:
+                keep &= self._amounts[slots] >= minAmount
+            if maxAmount is not None:
+                keep &= self._amounts[slots] <= maxAmount
+            slots = slots[keep][:limit - found]
+            matched.append(slots)
+            found += len(slots)
+            if found == limit:
+                break
+        if not found:
+            return []
+        return self._rows(np.concatenate(matched))
+
+    def aggregate(self, groupBy: str, start: Optional[int] = None,
+                  end: Optional[int] = None) -> List[Tuple[Optional[str], int, int]]:
+        """Return (key, count, total amount) per card number or per day for live payments dated in [start, end).
+
+        start and end are epoch microseconds. Payments without a canonical date are
+        left out when either bound is given, and grouped under a None day otherwise.
+        """
+        if groupBy not in ("card", "day"):
+            raise ValueError(f"Unknown groupBy {groupBy!r}")
+        if groupBy == "card" and start is None and end is None:
+            # The running rollups already hold every card's totals
+            return [(ccNumber, rollup.count, rollup.total)
+                    for ccNumber, rollup in zip(self._cardNumbers, self._rollups) if rollup.count]
+        lo, hi = 0, self._size
+        dates = self._dates[:hi]
+        if self._datesOrdered:
+            # NO_DATE and OTHER_DATE sort below every real date, so undated slots can only come first
+            if end is not None:
+                hi = int(np.searchsorted(dates, end))
+            if start is not None:
+                lo = int(np.searchsorted(dates[:hi], start))
+            elif end is not None:
+                lo = int(np.searchsorted(dates[:hi], OTHER_DATE, side="right"))
+            if groupBy == "day":
+                return self._aggregateOrderedDays(lo, hi)
+            mask = None if self._live == self._size else self._alive[lo:hi]
+        else:
+            mask = None if self._live == hi else self._alive[:hi]
+            if start is not None:
+                mask = dates >= start if mask is None else mask & (dates >= start)
+            if end is not None:
+                bounded = (dates < end) & (dates > OTHER_DATE)
+                mask = bounded if mask is None else mask & bounded
+
+        def pick(column: np.ndarray) -> np.ndarray:
+            return column[lo:hi] if mask is None else column[lo:hi][mask]
+
+        amounts = pick(self._amounts)
+        undated = None
+        if groupBy == "card":
+            keys = pick(self._cards)
+            offset = 0
+        else:
+            days = pick(self._dates)
+            if len(days) and days.min() <= OTHER_DATE:
+                dated = days > OTHER_DATE
+                undated = (int(len(days) - np.count_nonzero(dated)), int(amounts[~dated].sum()))
+                days, amounts = days[dated], amounts[dated]
+            days = days // MICROSECONDS_PER_DAY
+            offset = int(days.min()) if len(days) else 0
+            keys = days - offset
+
+        # bincount sums amounts as float64, which is exact below 2**53
+        counts = np.bincount(keys)
+        totals = np.bincount(keys, weights=amounts, minlength=len(counts))
+        used = np.flatnonzero(counts)
+        names = self._cardNumbers
+        groups = [(names[key] if groupBy == "card" else _dayLabel(key + offset), count, int(total))
+                  for key, count, total in zip(used.tolist(), counts[used].tolist(), totals[used].tolist())]
+        if undated is not None and undated[0]:
+            groups.append((None, *undated))
+        return groups
+
+    def rollup(self, ccNumber: str) -> Optional[CardRollup]:
+        """Return the card's running totals, or None if it never had a payment"""
+        card = self._cardIndex.get(ccNumber)
+        if card is None:
+            return None
+        rollup = self._rollups[card]
+        if rollup.stale:
+            self._refresh(card, rollup)
+        return rollup
+
+    def _refresh(self, card: int, rollup: CardRollup) -> None:
+        """Recompute a stale rollup's extremes from the slots in the card's posting list"""
+        slots = self._slotsOf(np.array(self._postings[card], np.int64))
+        slots = slots[(self._cards[slots] == card) & self._alive[slots]]
+        amounts = self._amounts[slots]
+        dates = self._dates[slots]
+        dates = dates[dates > OTHER_DATE]
+        rollup.minAmount = int(amounts.min())
+        rollup.maxAmount = int(amounts.max())
+        rollup.lastDate = int(dates.max()) if len(dates) else NO_DATE
+        rollup.stale = False
+
+    def _aggregateOrderedDays(self, lo: int, hi: int) -> List[Tuple[Optional[str], int, int]]:
+        """Per-day groups for slots lo:hi when dates are in order: each day is a run found by bisecting"""
+        dates = self._dates[lo:hi]
+        amounts = self._amounts[lo:hi]
+        alive = None if self._live == self._size else self._alive[lo:hi]
+        first = int(np.searchsorted(dates, OTHER_DATE, side="right"))
+        groups = []
+        if first < len(dates):
+            firstDay = int(dates[first]) // MICROSECONDS_PER_DAY
+            lastDay = int(dates[-1]) // MICROSECONDS_PER_DAY
+            # edges[k]:edges[k + 1] holds the slots dated on day firstDay + k
+            edges = first + np.searchsorted(dates[first:], np.arange(firstDay, lastDay + 2) * MICROSECONDS_PER_DAY)
+            days = np.flatnonzero(np.diff(edges))
+            starts = edges[days]
+            # reduceat sums from each start up to the next one, which ends with that day's run
+            if alive is None:
+                counts = np.diff(np.append(starts, len(dates)))
+                totals = np.add.reduceat(amounts, starts)
+            else:
+                counts = np.add.reduceat(alive.astype(np.int64), starts)
+                totals = np.add.reduceat(np.where(alive, amounts, 0), starts)
+            groups = [(_dayLabel(firstDay + day), count, total)
+                      for day, count, total in zip(days.tolist(), counts.tolist(), totals.tolist()) if count]
+        if first:
+            undated = amounts[:first] if alive is None else amounts[:first][alive[:first]]
+            if len(undated):
+                groups.append((None, len(undated), int(undated.sum())))
+        return groups
+
+    def __contains__(self, paymentId: int) -> bool:
+        i = self._find(paymentId)
+        return i >= 0 and bool(self._alive[i])
+
+    def __len__(self) -> int:
+        return self._live
@@ -0,0 +1,147 @@
+"""Storage server shared by uvicorn workers running with STREAMLY_STORAGE=server.
+
+Run it with the engine it should hold (memory by default, with the write-ahead
+log when STREAMLY_DATA_DIR is set), then start the workers against its socket:
+
+    python -m app.storage.server
+    STREAMLY_STORAGE=server uvicorn app.main:app --workers 8
+"""
+import os
+import pickle
+import signal
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.connection import Connection, Listener
+from typing import List, Optional, Set
+
+from .. import config
+from .base import PaymentRepository, ReplayRepository, UserRepository
+from .remote import keyPath
+
+# Threads that run a batch's calls side by side when calls can block
+CALL_WORKERS = 32
+
+
+def _exposed(repository: type) -> Set[str]:
+    """Names a client may call: the repository's public methods, minus the ones returning generators"""
+    names = {name for name in dir(repository) if not name.startswith("_") and callable(getattr(repository, name))}
+    return (names | {"__contains__", "__len__"}) - {"iterate", "iterateJSON"}
+
+def _portable(error: Exception) -> Exception:
+    """Return the exception itself if it can be sent to the client, else a RuntimeError describing it"""
+    try:
+        pickle.dumps(error)
+        return error
+    except Exception:
+        return RuntimeError(f"{type(error).__name__}: {error}")
+
+
+class StorageServer:
+    """Serves one process's stores and Idempotency-Key replays to worker processes over a Unix socket.
+
+    Each worker connection gets a thread that receives a batch of calls, runs them
+    against the stores and sends back one batch of replies. The stores' own
+    locking keeps the connections consistent with each other: usernames are
+    unique and payment ids come from one counter across every worker. When a
+    store's calls can block (on the journal, or on a lock a bulk write holds),
+    the calls of a batch run side by side on a thread pool, so that one waiting
+    call does not hold up the rest and journal fsyncs are grouped.
+    """
+
+    def __init__(self, users: UserRepository, payments: PaymentRepository, address: str,
+                 authkey: Optional[bytes] = None, replays: Optional[ReplayRepository] = None):
+        self.address = address
+        self._stores = (users, payments, replays)
+        self._methods = (_exposed(UserRepository), _exposed(PaymentRepository),
+                         _exposed(ReplayRepository) if replays is not None else set())
+        self._authkey = authkey
+        self._listener: Optional[Listener] = None
+        blocking = any(store.readsBlock or store.writesBlock for store in self._stores if store is not None)
+        self._pool = ThreadPoolExecutor(CALL_WORKERS, thread_name_prefix="storage-call") if blocking else None
+
+    def start(self) -> None:
+        """Listen on the socket, replacing a stale one, and write a generated key if none was given"""
+        if os.path.exists(self.address):
+            os.unlink(self.address)
+        authkey = self._authkey
+        if authkey is None:
+            authkey = os.urandom(32).hex().encode()
+            fd = os.open(keyPath(self.address), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "wb") as f:
+                f.write(authkey)
+        self._listener = Listener(self.address, family="AF_UNIX", backlog=64, authkey=authkey)
+
+    def serve(self) -> None:
+        """Accept worker connections until close() is called"""
+        while True:
+            try:
+                conn = self._listener.accept()
+            except (OSError, EOFError):
+                if self._listener is None:
+                    return
+                # A client that failed the handshake or hung up during it
+                continue
+            except Exception:
+                # multiprocessing.AuthenticationError: a client with the wrong key
+                continue
+            threading.Thread(target=self._serveConnection, args=(conn,), name="storage-connection",
+                             daemon=True).start()
+
+    def _serveConnection(self, conn: Connection) -> None:
+        try:
+            while True:
+                conn.send(self._run(conn.recv()))
+        except (EOFError, OSError):
+            pass
+        finally:
+            conn.close()
+
+    def _run(self, batch: List[tuple]) -> List[tuple]:
+        if self._pool is None or len(batch) == 1:
+            return [self._call(*call) for call in batch]
+        return list(self._pool.map(lambda call: self._call(*call), batch))
+
+    def _call(self, callId: int, target: int, method: str, args: tuple) -> tuple:
+        if method not in self._methods[target]:
+            return callId, AttributeError(f"Storage method {method!r} is not available"), None
+        try:
+            return callId, None, getattr(self._stores[target], method)(*args)
+        except Exception as e:
+            return callId, _portable(e), None
+
+    def close(self) -> None:
+        listener, self._listener = self._listener, None
+        if listener is not None:
+            listener.close()
+        if self._pool is not None:
+            self._pool.shutdown()
+
+
+def main() -> None:
+    from . import paymentsDB, replaysDB, usersDB
+    from ..idempotency import IdempotencyCache
+
+    if config.STORAGE_ENGINE == "server":
+        sys.exit("The storage server holds the data itself: run it with STREAMLY_STORAGE=memory or sqlite")
+    authkey = config.STORAGE_AUTHKEY.encode() if config.STORAGE_AUTHKEY else None
+    # Workers check Idempotency-Keys here, so a retry that reaches another worker is still replayed
+    replays = replaysDB if replaysDB is not None else IdempotencyCache(config.IDEMPOTENCY_TTL,
+                                                                         config.IDEMPOTENCY_CACHE_BYTES)
+    server = StorageServer(usersDB, paymentsDB, config.STORAGE_SOCKET, authkey, replays)
+    server.start()
+    # Exit through SystemExit on SIGTERM so atexit flushes and closes the write-ahead log
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    print(f"Serving {config.STORAGE_ENGINE} storage on {config.STORAGE_SOCKET}", flush=True)
+    try:
+        server.serve()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        if os.path.exists(config.STORAGE_SOCKET):
+            os.unlink(config.STORAGE_SOCKET)
+
+
+if __name__ == "__main__":
+    main()
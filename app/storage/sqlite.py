@@ -0,0 +1,543 @@
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, Dict, Hashable, Iterable, Iterator, List, Optional, Set, Tuple
+
+from ..models import Payment, User
+from .base import (CLAIM_SECONDS, CardSummary, PaymentFilter, PaymentRepository, ReplayRepository, UserRepository,
+                   hasCreditCard)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    username TEXT NOT NULL UNIQUE,
+    password TEXT NOT NULL,
+    email TEXT NOT NULL,
+    birthdate TEXT NOT NULL,
+    ccNumber TEXT,
+    hasCard INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS users_ccNumber ON users (ccNumber);
+CREATE INDEX IF NOT EXISTS users_hasCard ON users (hasCard, seq);
+
+CREATE TABLE IF NOT EXISTS payments (
+    id INTEGER PRIMARY KEY,
+    ccNumber TEXT NOT NULL,
+    amount INTEGER NOT NULL,
+    date TEXT
+);
+CREATE INDEX IF NOT EXISTS payments_ccNumber ON payments (ccNumber, id);
+CREATE INDEX IF NOT EXISTS payments_date ON payments (date);
+
+-- Running totals per card, kept by triggers so every writer and worker updates them in the same transaction.
+-- A delete only re-reads the card's payments (through payments_ccNumber) when it removed an extreme.
+CREATE TABLE IF NOT EXISTS card_rollups (
+    ccNumber TEXT PRIMARY KEY,
+    count INTEGER NOT NULL,
+    total INTEGER NOT NULL,
+    minAmount INTEGER NOT NULL,
+    maxAmount INTEGER NOT NULL,
+    lastDate TEXT
+);
+CREATE TRIGGER IF NOT EXISTS payments_rollup_insert AFTER INSERT ON payments BEGIN
+    INSERT INTO card_rollups (ccNumber, count, total, minAmount, maxAmount, lastDate)
+    VALUES (NEW.ccNumber, 1, NEW.amount, NEW.amount, NEW.amount, NEW.date)
+    ON CONFLICT (ccNumber) DO UPDATE SET
+        count = count + 1,
+        total = total + NEW.amount,
+        minAmount = MIN(minAmount, NEW.amount),
+        maxAmount = MAX(maxAmount, NEW.amount),
+        lastDate = MAX(COALESCE(lastDate, NEW.date), COALESCE(NEW.date, lastDate));
+END;
+CREATE TRIGGER IF NOT EXISTS payments_rollup_delete AFTER DELETE ON payments BEGIN
+    DELETE FROM card_rollups WHERE ccNumber = OLD.ccNumber AND count = 1;
+    UPDATE card_rollups SET
+        count = count - 1,
+        total = total - OLD.amount,
+        minAmount = CASE WHEN OLD.amount = minAmount
+            THEN (SELECT MIN(amount) FROM payments WHERE ccNumber = OLD.ccNumber) ELSE minAmount END,
+        maxAmount = CASE WHEN OLD.amount = maxAmount
+            THEN (SELECT MAX(amount) FROM payments WHERE ccNumber = OLD.ccNumber) ELSE maxAmount END,
+        lastDate = CASE WHEN OLD.date = lastDate
+            THEN (SELECT MAX(date) FROM payments WHERE ccNumber = OLD.ccNumber) ELSE lastDate END
+    WHERE ccNumber = OLD.ccNumber;
+END;
+-- Databases created before card_rollups existed are filled in once
+INSERT OR IGNORE INTO card_rollups (ccNumber, count, total, minAmount, maxAmount, lastDate)
+    SELECT ccNumber, COUNT(*), SUM(amount), MIN(amount), MAX(amount), MAX(date) FROM payments
+    WHERE NOT EXISTS (SELECT 1 FROM card_rollups) GROUP BY ccNumber;
+
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO counters (name, value) VALUES ('payments', 1);
+
+-- Idempotency-Key claims (no status yet while the request runs) and the responses kept for replays
+CREATE TABLE IF NOT EXISTS idempotency (
+    key TEXT PRIMARY KEY,
+    fingerprint TEXT NOT NULL,
+    claimId TEXT,
+    status INTEGER,
+    body BLOB,
+    expires REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idempotency_expires ON idempotency (expires);
+-- Key and body bytes of the kept responses, kept by triggers so every worker sees one total
+INSERT OR IGNORE INTO counters (name, value)
+    SELECT 'idempotency_bytes', COALESCE(SUM(LENGTH(key) + LENGTH(body)), 0) FROM idempotency;
+CREATE TRIGGER IF NOT EXISTS idempotency_bytes_update AFTER UPDATE OF body ON idempotency BEGIN
+    UPDATE counters SET value = value + COALESCE(LENGTH(NEW.key) + LENGTH(NEW.body), 0)
+        - COALESCE(LENGTH(OLD.key) + LENGTH(OLD.body), 0) WHERE name = 'idempotency_bytes';
+END;
+CREATE TRIGGER IF NOT EXISTS idempotency_bytes_delete AFTER DELETE ON idempotency WHEN OLD.body IS NOT NULL BEGIN
+    UPDATE counters SET value = value - LENGTH(OLD.key) - LENGTH(OLD.body) WHERE name = 'idempotency_bytes';
+END;
+"""
+
+# GROUP BY expression for each aggregate grouping
+AGGREGATE_KEYS = {
+    "card": "ccNumber",
+    "day": "substr(date, 1, 10)",
+}
+
+# Rows are read in batches of this size when streaming a whole table
+ITERATE_BATCH_SIZE = 500
+
+# Keys per IN (...) lookup, below SQLite's bound parameter limit
+LOOKUP_BATCH_SIZE = 500
+
+USER_COLUMNS = "seq, username, password, email, birthdate, ccNumber"
+PAYMENT_COLUMNS = "id, ccNumber, amount, date"
+
+
+class SqliteDatabase:
+    """SQLite file shared by every worker, with one connection per thread and WAL journaling"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        self.connection().executescript(SCHEMA)
+
+    def connection(self) -> sqlite3.Connection:
+        """Return this thread's connection, opening it on first use"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Autocommit mode: transactions are opened explicitly by transaction()
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None,
+                                   check_same_thread=False, cached_statements=256)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            # INSERT OR REPLACE must fire the delete trigger for the row it replaces, or card_rollups double counts
+            conn.execute("PRAGMA recursive_triggers=ON")
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        """Run a block in one write transaction; nested blocks join the outer transaction"""
+        conn = self.connection()
+        if conn.in_transaction:
+            yield conn
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def close(self) -> None:
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
+
+
+def _user(row) -> User:
+    return User(username=row[1], password=row[2], email=row[3], birthdate=row[4], ccNumber=row[5])
+
+def _payment(row) -> Payment:
+    return Payment(id=row[0], ccNumber=row[1], amount=row[2], date=row[3])
+
+
+class SqliteUserStore(UserRepository):
+    """User table in SQLite, indexed on username and ccNumber"""
+
+    INSERT = ("INSERT OR REPLACE INTO users (username, password, email, birthdate, ccNumber, hasCard) "
+              "VALUES (?, ?, ?, ?, ?, ?)")
+    INSERT_NEW = ("INSERT INTO users (username, password, email, birthdate, ccNumber, hasCard) "
+                  "VALUES (?, ?, ?, ?, ?, ?)")
+    INSERT_IGNORE = ("INSERT OR IGNORE INTO users (username, password, email, birthdate, ccNumber, hasCard) "
+                     "VALUES (?, ?, ?, ?, ?, ?)")
+
+    def __init__(self, database: SqliteDatabase):
+        self._db = database
+
+    def _params(self, user: User):
+        return (user.username, user.password, user.email, user.birthdate, user.ccNumber, int(hasCreditCard(user)))
+
+    def add(self, user: User) -> None:
+        # REPLACE deletes the old row, so a replaced user moves to the end like in the memory engine
+        with self._db.transaction() as conn:
+            conn.execute(self.INSERT, self._params(user))
+
+    def addIfAbsent(self, user: User) -> bool:
+        # The UNIQUE constraint on username makes this atomic across threads and processes
+        try:
+            with self._db.transaction() as conn:
+                conn.execute(self.INSERT_NEW, self._params(user))
+        except sqlite3.IntegrityError:
+            return False
+        return True
+
+    def addManyIfAbsent(self, users: List[User]) -> List[bool]:
+        # One transaction for the whole batch; OR IGNORE leaves rowcount 0 for taken usernames
+        with self._db.transaction() as conn:
+            return [conn.execute(self.INSERT_IGNORE, self._params(user)).rowcount > 0 for user in users]
+
+    def existingUsernames(self, usernames: Iterable[str]) -> Set[str]:
+        usernames = list(usernames)
+        conn = self._db.connection()
+        taken = set()
+        for start in range(0, len(usernames), LOOKUP_BATCH_SIZE):
+            batch = usernames[start:start + LOOKUP_BATCH_SIZE]
+            rows = conn.execute(f"SELECT username FROM users WHERE username IN ({','.join('?' * len(batch))})", batch)
+            taken.update(row[0] for row in rows)
+        return taken
+
+    def ownersByCard(self, ccNumbers: Iterable[str]) -> Dict[str, List[str]]:
+        ccNumbers = list(ccNumbers)
+        conn = self._db.connection()
+        owners: Dict[str, List[str]] = {}
+        for start in range(0, len(ccNumbers), LOOKUP_BATCH_SIZE):
+            batch = ccNumbers[start:start + LOOKUP_BATCH_SIZE]
+            rows = conn.execute(
+                f"SELECT ccNumber, username FROM users WHERE ccNumber IN ({','.join('?' * len(batch))}) ORDER BY username",
+                batch)
+            for ccNumber, username in rows:
+                owners.setdefault(ccNumber, []).append(username)
+        return owners
+
+    def update(self, user: User) -> bool:
+        with self._db.transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE users SET password = ?, email = ?, birthdate = ?, ccNumber = ?, hasCard = ? WHERE username = ?",
+                (user.password, user.email, user.birthdate, user.ccNumber, int(hasCreditCard(user)), user.username))
+        return cursor.rowcount > 0
+
+    def extend(self, users: Iterable[User]) -> None:
+        with self._db.transaction() as conn:
+            conn.executemany(self.INSERT, (self._params(user) for user in users))
+
+    def get(self, username: str) -> Optional[User]:
+        row = self._db.connection().execute(
+            f"SELECT {USER_COLUMNS} FROM users WHERE username = ?", (username,)).fetchone()
+        return _user(row) if row is not None else None
+
+    def remove(self, username: str) -> Optional[User]:
+        with self._db.transaction() as conn:
+            row = conn.execute(f"SELECT {USER_COLUMNS} FROM users WHERE username = ?", (username,)).fetchone()
+            if row is None:
+                return None
+            conn.execute("DELETE FROM users WHERE seq = ?", (row[0],))
+        return _user(row)
+
+    def hasCard(self, ccNumber: str) -> bool:
+        return self._db.connection().execute(
+            "SELECT 1 FROM users WHERE ccNumber = ? LIMIT 1", (ccNumber,)).fetchone() is not None
+
+    def getByCard(self, ccNumber: str) -> List[User]:
+        rows = self._db.connection().execute(
+            f"SELECT {USER_COLUMNS} FROM users WHERE ccNumber = ? ORDER BY seq", (ccNumber,)).fetchall()
+        return [_user(row) for row in rows]
+
+    def countByCard(self) -> Tuple[int, int]:
+        counts = dict(self._db.connection().execute("SELECT hasCard, COUNT(*) FROM users GROUP BY hasCard"))
+        return counts.get(1, 0), counts.get(0, 0)
+
+    def _rows(self, after: Optional[int], limit: int, hasCard: Optional[bool]):
+        conn = self._db.connection()
+        if hasCard is None:
+            return conn.execute(f"SELECT {USER_COLUMNS} FROM users WHERE seq > ? ORDER BY seq LIMIT ?",
+                                (after or 0, limit)).fetchall()
+        return conn.execute(f"SELECT {USER_COLUMNS} FROM users WHERE hasCard = ? AND seq > ? ORDER BY seq LIMIT ?",
+                            (int(hasCard), after or 0, limit)).fetchall()
+
+    def iterate(self, hasCard: Optional[bool] = None) -> Iterator[User]:
+        # Keyset batches keep memory flat and avoid holding a read transaction open
+        after = None
+        while True:
+            rows = self._rows(after, ITERATE_BATCH_SIZE, hasCard)
+            for row in rows:
+                yield _user(row)
+            if len(rows) < ITERATE_BATCH_SIZE:
+                return
+            after = rows[-1][0]
+
+    def page(self, after: Optional[int], limit: int,
+             hasCard: Optional[bool] = None) -> Tuple[List[User], Optional[int]]:
+        rows = self._rows(after, limit + 1, hasCard)
+        nextKey = rows[limit - 1][0] if len(rows) > limit else None
+        return [_user(row) for row in rows[:limit]], nextKey
+
+    def clear(self) -> None:
+        with self._db.transaction() as conn:
+            conn.execute("DELETE FROM users")
+
+    def __contains__(self, username: str) -> bool:
+        return self._db.connection().execute(
+            "SELECT 1 FROM users WHERE username = ?", (username,)).fetchone() is not None
+
+    def __len__(self) -> int:
+        return self._db.connection().execute("SELECT COUNT(*) FROM users").fetchone()[0]
+
+    def __getitem__(self, index: int) -> User:
+        if index < 0:
+            return super().__getitem__(index)
+        row = self._db.connection().execute(
+            f"SELECT {USER_COLUMNS} FROM users ORDER BY seq LIMIT 1 OFFSET ?", (index,)).fetchone()
+        if row is None:
+            raise IndexError("user index out of range")
+        return _user(row)
+
+
+class SqlitePaymentStore(PaymentRepository):
+    """Payment table in SQLite keyed by id, with the id counter kept in the same database"""
+
+    INSERT = "INSERT OR REPLACE INTO payments (id, ccNumber, amount, date) VALUES (?, ?, ?, ?)"
+    ADVANCE = "UPDATE counters SET value = MAX(value, ?) WHERE name = 'payments'"
+
+    def __init__(self, database: SqliteDatabase):
+        self._db = database
+
+    def allocateId(self) -> int:
+        with self._db.transaction() as conn:
+            conn.execute("UPDATE counters SET value = value + 1 WHERE name = 'payments'")
+            return conn.execute("SELECT value - 1 FROM counters WHERE name = 'payments'").fetchone()[0]
+
+    def nextId(self) -> int:
+        return self._db.connection().execute("SELECT value FROM counters WHERE name = 'payments'").fetchone()[0]
+
+    def advanceNextId(self, nextId: int) -> None:
+        with self._db.transaction() as conn:
+            conn.execute(self.ADVANCE, (nextId,))
+
+    def add(self, payment: Payment) -> None:
+        if payment.id is None:
+            raise ValueError("Payment id is required")
+        with self._db.transaction() as conn:
+            conn.execute(self.INSERT, (payment.id, payment.ccNumber, payment.amount, payment.date))
+            conn.execute(self.ADVANCE, (payment.id + 1,))
+
+    def allocateIds(self, count: int) -> int:
+        with self._db.transaction() as conn:
+            conn.execute("UPDATE counters SET value = value + ? WHERE name = 'payments'", (count,))
+            return conn.execute("SELECT value - ? FROM counters WHERE name = 'payments'", (count,)).fetchone()[0]
+
+    def addMany(self, payments: List[Payment]) -> None:
+        if not payments:
+            return
+        with self._db.transaction() as conn:
+            conn.executemany(self.INSERT, ((p.id, p.ccNumber, p.amount, p.date) for p in payments))
+            conn.execute(self.ADVANCE, (max(p.id for p in payments) + 1,))
+
+    def get(self, paymentId: int) -> Optional[Payment]:
+        row = self._db.connection().execute(
+            f"SELECT {PAYMENT_COLUMNS} FROM payments WHERE id = ?", (paymentId,)).fetchone()
+        return _payment(row) if row is not None else None
+
+    def remove(self, paymentId: int) -> Optional[Payment]:
+        with self._db.transaction() as conn:
+            row = conn.execute(f"SELECT {PAYMENT_COLUMNS} FROM payments WHERE id = ?", (paymentId,)).fetchone()
+            if row is None:
+                return None
+            conn.execute("DELETE FROM payments WHERE id = ?", (paymentId,))
+        return _payment(row)
+
+    def _rows(self, after: Optional[int], limit: int, filters: Optional[PaymentFilter]):
+        conditions, params = ["id > ?"], [after if after is not None else -1]
+        source = "payments"
+        if filters is not None:
+            # A card is read in id order from its (ccNumber, id) index. Left alone, the planner walks the
+            # primary key for a date range, which costs the whole table up to the range; reading the range
+            # from the date index and sorting its ids is proportional to the matches instead.
+            if filters.ccNumber is None and filters.start is not None and filters.end is not None:
+                source = "payments INDEXED BY payments_date"
+            for condition, value in [("ccNumber = ?", filters.ccNumber),
+                                     ("date >= ?", filters.start.isoformat() if filters.start is not None else None),
+                                     ("date < ?", filters.end.isoformat() if filters.end is not None else None),
+                                     ("amount >= ?", filters.minAmount), ("amount <= ?", filters.maxAmount)]:
+                if value is not None:
+                    conditions.append(condition)
+                    params.append(value)
+        return self._db.connection().execute(
+            f"SELECT {PAYMENT_COLUMNS} FROM {source} WHERE {' AND '.join(conditions)} ORDER BY id LIMIT ?",
+            (*params, limit)).fetchall()
+
+    def iterate(self, filters: Optional[PaymentFilter] = None) -> Iterator[Payment]:
+        after = None
+        while True:
+            rows = self._rows(after, ITERATE_BATCH_SIZE, filters)
+            for row in rows:
+                yield _payment(row)
+            if len(rows) < ITERATE_BATCH_SIZE:
+                return
+            after = rows[-1][0]
+
+    def page(self, after: Optional[int], limit: int,
+             filters: Optional[PaymentFilter] = None) -> Tuple[List[Payment], Optional[int]]:
+        rows = self._rows(after, limit + 1, filters)
+        nextKey = rows[limit - 1][0] if len(rows) > limit else None
+        return [_payment(row) for row in rows[:limit]], nextKey
+
+    def aggregate(self, groupBy: str, start: Optional[datetime] = None,
+                  end: Optional[datetime] = None) -> List[Tuple[Optional[str], int, int]]:
+        key = AGGREGATE_KEYS.get(groupBy)
+        if key is None:
+            raise ValueError(f"Unknown groupBy {groupBy!r}")
+        if groupBy == "card" and start is None and end is None:
+            return self._db.connection().execute("SELECT ccNumber, count, total FROM card_rollups").fetchall()
+        # Stored dates are naive ISO strings, which sort in time order
+        conditions, params = [], []
+        if start is not None:
+            conditions.append("date >= ?")
+            params.append(start.isoformat())
+        if end is not None:
+            conditions.append("date < ?")
+            params.append(end.isoformat())
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        return self._db.connection().execute(
+            f"SELECT {key}, COUNT(*), SUM(amount) FROM payments {where} GROUP BY 1", params).fetchall()
+
+    def cardSummary(self, ccNumber: str) -> CardSummary:
+        row = self._db.connection().execute(
+            "SELECT count, total, minAmount, maxAmount, lastDate FROM card_rollups WHERE ccNumber = ?",
+            (ccNumber,)).fetchone()
+        return CardSummary(*row) if row is not None else CardSummary()
+
+    def clear(self) -> None:
+        with self._db.transaction() as conn:
+            # Emptied first, so the per-row delete trigger finds nothing to update
+            conn.execute("DELETE FROM card_rollups")
+            conn.execute("DELETE FROM payments")
+            conn.execute("UPDATE counters SET value = 1 WHERE name = 'payments'")
+
+    def __contains__(self, paymentId: int) -> bool:
+        return self._db.connection().execute(
+            "SELECT 1 FROM payments WHERE id = ?", (paymentId,)).fetchone() is not None
+
+    def __len__(self) -> int:
+        return self._db.connection().execute("SELECT COUNT(*) FROM payments").fetchone()[0]
+
+    def __getitem__(self, index: int) -> Payment:
+        if index < 0:
+            return super().__getitem__(index)
+        row = self._db.connection().execute(
+            f"SELECT {PAYMENT_COLUMNS} FROM payments ORDER BY id LIMIT 1 OFFSET ?", (index,)).fetchone()
+        if row is None:
+            raise IndexError("payment index out of range")
+        return _payment(row)
+
+
+class SqliteReplayStore(ReplayRepository):
+    """Idempotency-Key claims and kept responses in SQLite, seen by every worker on the database.
+
+    A claim is a row without a status that expires after CLAIM_SECONDS, and a
+    kept response expires after ttl; each claim deletes the expired rows first.
+    Kept responses are also bounded by maxBytes of keys and bodies, shared by
+    every worker: once a new one takes the total past it, the oldest are
+    deleted. Fingerprints are compared by their repr. The hit and miss
+    counters are this process's.
+    """
+
+    def __init__(self, db: SqliteDatabase, ttl: float, maxBytes: int, clock: Callable[[], float] = time.time):
+        self._db = db
+        self.ttl = ttl
+        self.maxBytes = maxBytes
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.waits = 0
+        self.conflicts = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def claim(self, key: str, fingerprint: Hashable, waited: bool = False) -> Tuple[str, object]:
+        now = self._clock()
+        with self._db.transaction() as conn:
+            expired = conn.execute("DELETE FROM idempotency WHERE expires <= ?", (now,)).rowcount
+            row = conn.execute("SELECT fingerprint, status, body FROM idempotency WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                claimId = uuid.uuid4().hex
+                conn.execute("INSERT INTO idempotency (key, fingerprint, claimId, expires) VALUES (?, ?, ?, ?)",
+                             (key, repr(fingerprint), claimId, now + CLAIM_SECONDS))
+        with self._lock:
+            self.expirations += expired
+            if row is None:
+                self.misses += 1
+                return "run", claimId
+            if row[0] != repr(fingerprint):
+                self.conflicts += 1
+                return "conflict", None
+            if row[1] is not None:
+                if not waited:
+                    self.hits += 1
+                return "replay", (row[1], bytes(row[2]))
+            if not waited:
+                self.waits += 1
+            return "wait", None
+
+    def finish(self, key: str, claimId, result: Optional[Tuple[int, bytes]]) -> None:
+        keep = result is not None and 200 <= result[0] < 300 and len(key) + len(result[1]) <= self.maxBytes
+        with self._db.transaction() as conn:
+            # Matching the claim id leaves alone a key whose claim ran out and was taken by another request
+            if not keep:
+                conn.execute("DELETE FROM idempotency WHERE key = ? AND claimId = ?", (key, claimId))
+            elif conn.execute("UPDATE idempotency SET claimId = NULL, status = ?, body = ?, expires = ? "
+                              "WHERE key = ? AND claimId = ?",
+                              (result[0], result[1], self._clock() + self.ttl, key, claimId)).rowcount:
+                self._evict(conn)
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        """Delete the oldest kept responses until the total is back within maxBytes"""
+        total = conn.execute("SELECT value FROM counters WHERE name = 'idempotency_bytes'").fetchone()[0]
+        excess = total - self.maxBytes
+        if excess <= 0:
+            return
+        evicted = []
+        # With one ttl, expiry order is the order responses were kept in
+        for key, size in conn.execute("SELECT key, LENGTH(key) + LENGTH(body) FROM idempotency "
+                                      "WHERE status IS NOT NULL ORDER BY expires"):
+            evicted.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        conn.executemany("DELETE FROM idempotency WHERE key = ?", evicted)
+        with self._lock:
+            self.evictions += len(evicted)
+
+    def stats(self) -> Dict[str, object]:
+        entries, size, inFlight = self._db.connection().execute(
+            "SELECT COUNT(status), COALESCE(SUM(LENGTH(key) + LENGTH(body)), 0), COUNT(*) - COUNT(status) "
+            "FROM idempotency WHERE expires > ?", (self._clock(),)).fetchone()
+        with self._lock:
+            answered = self.hits + self.waits + self.misses
+            return {"entries": entries, "bytes": size, "maxBytes": self.maxBytes, "inFlight": inFlight,
+                    "hits": self.hits, "waits": self.waits, "misses": self.misses,
+                    "hitRate": round((self.hits + self.waits) / answered, 4) if answered else None,
+                    "conflicts": self.conflicts, "evictions": self.evictions, "expirations": self.expirations}
+
+    def clear(self) -> None:
+        with self._db.transaction() as conn:
+            conn.execute("DELETE FROM idempotency")
@@ -1,58 +1,145 @@
+import json
+import base64
 from datetime import datetime
-import re
-import hashlib
+from typing import List, Optional, Set, Tuple
 
 from app.models import Payment, User
 from .storage import usersDB, paymentsDB
+from .passwords import hasher
+# Validators live in app.validation; they are re-exported here for existing callers
+from .validation import (validateUsernameAlphanumeric, validatePasswordChars, validatePasswordLength, validateEmail,
+                         validateDateFormat, checkAgeEligibility, validateCreditCard, validateAmount,
+                         validateUsernameAlphanumericBatch, validatePasswordCharsBatch, validatePasswordLengthBatch,
+                         validateEmailBatch, validateDateFormatBatch, checkAgeEligibilityBatch, validateCreditCardBatch,
+                         validateAmountBatch, SIGNUP_RULES)
 
     
 def checkUsernameUnique(username: str) -> bool:
     """Check if the username is unique in the usersDB"""
-    existingUsernames = [u.username for u in usersDB]
-    return username not in existingUsernames
+    return username not in usersDB
 
-def validateUsernameAlphanumeric(username: str) -> bool:
-    """Check if the username is alphanumeric"""
-    return username.isalnum()
+def checkCardRegistered(ccNumber: str) -> bool:
+    """Check if the credit card number is registered to any user"""
+    return usersDB.hasCard(ccNumber)
 
-def validatePasswordChars(password: str) -> bool:
-    """Check if the password contains at least one uppercase letter and one number"""
-    return (any(c.isupper() for c in password) and any(c.isdigit() for c in password))
+def validateNewUser(user: User) -> Optional[Tuple[int, str]]:
+    """Run the signup checks in order, returning (status code, message) for the first failure or None"""
+    return validateNewUsers([user], usersDB.existingUsernames([user.username]))[0]
 
-def validatePasswordLength(password: str) -> bool:
-    """Check if the password length is at least 8 characters"""
-    return len(password) >= 8
+def validateNewPayment(payment: Payment) -> Optional[Tuple[int, str]]:
+    """Run the payment checks in order, returning (status code, message) for the first failure or None"""
+    # check if card number is numeric and 16 digits
+    if not validateCreditCard(payment.ccNumber):
+        return 400, "Card number must be numeric and 16 digits long"
 
-def validateEmail(email: str) -> bool:
-    """Validate the email format using regex"""
-    return re.match(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$', email) is not None
+    # Check if card number is registered to any user
+    elif not checkCardRegistered(payment.ccNumber):
+        return 404, "Card number is not registered to any user"
 
-def validateDateFormat(date_str: str) -> bool:
-    """Validate that the date is in ISO 8601 format (YYYY-MM-DD)"""
-    return re.match(r'^\d{4}-\d{2}-\d{2}$', date_str) is not None
+    # Check if amount is exactly 3 digits (100-999)
+    elif not validateAmount(payment.amount):
+        return 400, "Amount must be exactly 3 digits (100-999)"
 
-def checkAgeEligibility(birthdate: str) -> bool:
-    """Check if the user is at least 18 years old based on birthdate in YYYY-MM-DD format"""
-    if not validateDateFormat(birthdate):
-        return False
-    birth_date = datetime.strptime(birthdate, "%Y-%m-%d")
-    age = (datetime.now() - birth_date).days // 365
-    return age >= 18
+    return None
 
-def validateCreditCard(ccNumber: str) -> bool:
-    """Validate that the credit card number is numeric and 16 digits long"""
-    return re.match(r'^\d{16}$', ccNumber) is not None
+def _firstFailures(checks: List[Tuple[List[bool], Tuple[int, str]]], count: int) -> List[Optional[Tuple[int, str]]]:
+    """Combine per-check result columns into the first failing (status code, message) per row"""
+    results: List[Optional[Tuple[int, str]]] = [None] * count
+    # Later checks go first so an earlier failure overwrites them, matching the order of the if/elif chains
+    for passed, error in reversed(checks):
+        for i, ok in enumerate(passed):
+            if not ok:
+                results[i] = error
+    return results
 
-def checkCardRegistered(ccNumber: str) -> bool:
-    """Check if the credit card number is registered to any user"""
-    for user in usersDB:
-        if user.ccNumber == ccNumber:
-            return True
-    return False
+def validateNewUsers(users: List[User], takenUsernames: Set[str]) -> List[Optional[Tuple[int, str]]]:
+    """Check a batch of signups against SIGNUP_RULES, running each rule over the whole batch at once"""
+    columns = {field: [getattr(user, field) for user in users] for field in {rule.field for rule in SIGNUP_RULES}}
+    return _firstFailures([
+        ([value not in takenUsernames for value in columns[rule.field]] if rule.batchCheck is None
+         else rule.batchCheck(columns[rule.field]), (rule.status, rule.message))
+        for rule in SIGNUP_RULES
+    ], len(users))
 
-def validateAmount(amount: int) -> bool:
-    """Validate that the amount is exactly 3 digits (100-999)"""
-    return 100 <= amount <= 999
+def validateNewPayments(payments: List[Payment]) -> List[Optional[Tuple[int, str]]]:
+    """Batch form of validateNewPayment, looking up each distinct card only once"""
+    cards = [payment.ccNumber for payment in payments]
+    registered = {ccNumber: checkCardRegistered(ccNumber) for ccNumber in set(cards)}
+    return _firstFailures([
+        (validateCreditCardBatch(cards), (400, "Card number must be numeric and 16 digits long")),
+        ([registered[ccNumber] for ccNumber in cards], (404, "Card number is not registered to any user")),
+        (validateAmountBatch([payment.amount for payment in payments]), (400, "Amount must be exactly 3 digits (100-999)")),
+    ], len(payments))
 
 def hashPassword(password: str) -> str:
-    return hashlib.sha256(password.encode()).hexdigest()
\ No newline at end of file
+    """Hash a password with the configured salted KDF on the password worker pool"""
+    return hasher.hash(password)
+
+def verifyPassword(password: str, stored: str) -> bool:
+    """Check a password against its stored hash"""
+    return hasher.verify(password, stored)
+
+async def hashPasswordAsync(password: str) -> str:
+    """hashPassword for async handlers, awaiting the worker pool instead of blocking the event loop"""
+    return await hasher.hashAsync(password)
+
+async def verifyPasswordAsync(password: str, stored: str) -> bool:
+    """verifyPassword for async handlers, awaiting the worker pool instead of blocking the event loop"""
+    return await hasher.verifyAsync(password, stored)
+
+DEFAULT_PAGE_SIZE = 100
+
+def encodeCursor(kind: str, key: int) -> str:
+    """Encode a pagination position as an opaque cursor string"""
+    return base64.urlsafe_b64encode(f"{kind}:{key}".encode()).decode().rstrip("=")
+
+def decodeCursor(kind: str, cursor: str) -> Optional[int]:
+    """Decode a cursor produced by encodeCursor, returning None if it is malformed or for another listing"""
+    try:
+        decoded = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        cursorKind, key = decoded.split(":", 1)
+        return int(key) if cursorKind == kind else None
+    except ValueError:
+        return None
+
+def parseTimestamp(value: str) -> Optional[datetime]:
+    """Parse an ISO date or date-time without a time zone (payment dates are local), returning None if invalid"""
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    return parsed if parsed.tzinfo is None else None
+
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+def _dumpModel(record) -> str:
+    return record.model_dump_json()
+
+def streamNDJSON(records, predicate=None, encode=_dumpModel):
+    """Yield records as newline-delimited JSON, batched into chunks of about EXPORT_CHUNK_SIZE bytes"""
+    chunk = []
+    size = 0
+    for record in records:
+        if predicate is not None and not predicate(record):
+            continue
+        line = encode(record) + "\n"
+        chunk.append(line)
+        size += len(line)
+        if size >= EXPORT_CHUNK_SIZE:
+            yield "".join(chunk)
+            chunk = []
+            size = 0
+    if chunk:
+        yield "".join(chunk)
+
+# Largest batch accepted by the bulk create endpoints
+BULK_MAX_ROWS = 100_000
+
+def parseRecords(body: bytes, contentType: str) -> List[object]:
+    """Parse a bulk request body sent as a JSON array or as NDJSON (one JSON value per line)"""
+    if contentType.split(";")[0].strip() == "application/x-ndjson":
+        return [json.loads(line) for line in body.splitlines() if line.strip()]
+    records = json.loads(body)
+    if not isinstance(records, list):
+        raise ValueError("Expected a JSON array")
+    return records
@@ -0,0 +1,148 @@
+import re
+import time
+from datetime import date, datetime, timedelta
+from typing import Callable, List, NamedTuple, Optional, Sequence, Tuple
+
+# Patterns are compiled once at import instead of going through re's cache on every call.
+# \Z rather than $, which would also match before a trailing newline.
+EMAIL_PATTERN = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}\Z')
+DATE_PATTERN = re.compile(r'^\d{4}-\d{2}-\d{2}\Z')
+CARD_PATTERN = re.compile(r'^\d{16}\Z')
+
+# Users must be at least this many days old (18 years of 365 days) to register
+MIN_AGE_DAYS = 18 * 365
+
+# (timestamp of the next local midnight, latest eligible birthdate); replaced as a whole so readers never see a mix
+_ageCutoff: Tuple[float, date] = (0.0, date.min)
+
+
+def validateUsernameAlphanumeric(username: str) -> bool:
+    """Check if the username is alphanumeric"""
+    return username.isalnum()
+
+def validatePasswordChars(password: str) -> bool:
+    """Check if the password contains at least one uppercase letter and one number"""
+    return any(map(str.isupper, password)) and any(map(str.isdigit, password))
+
+def validatePasswordLength(password: str) -> bool:
+    """Check if the password length is at least 8 characters"""
+    return len(password) >= 8
+
+def validateEmail(email: str) -> bool:
+    """Validate the email format using regex"""
+    return EMAIL_PATTERN.match(email) is not None
+
+def validateDateFormat(date_str: str) -> bool:
+    """Validate that the date is a real date in ISO 8601 format (YYYY-MM-DD)"""
+    return parseDate(date_str) is not None
+
+def parseDate(date_str: str) -> Optional[date]:
+    """Parse a YYYY-MM-DD date without strptime, returning None if it is malformed or not a real date"""
+    if DATE_PATTERN.match(date_str) is None:
+        return None
+    try:
+        return date.fromisoformat(date_str)
+    except ValueError:
+        return None
+
+def ageCutoff() -> date:
+    """Return the latest birthdate that is old enough to register, recomputed once per day"""
+    global _ageCutoff
+    expires, cutoff = _ageCutoff
+    if time.time() >= expires:
+        today = datetime.now().date()
+        cutoff = today - timedelta(days=MIN_AGE_DAYS)
+        _ageCutoff = (datetime.combine(today + timedelta(days=1), datetime.min.time()).timestamp(), cutoff)
+    return cutoff
+
+def checkAgeEligibility(birthdate: str) -> bool:
+    """Check if the user is at least 18 years old, which a malformed birthdate never is"""
+    parsed = parseDate(birthdate)
+    return parsed is not None and parsed <= ageCutoff()
+
+def validateCreditCard(ccNumber: str) -> bool:
+    """Validate that the credit card number is numeric and 16 digits long"""
+    return CARD_PATTERN.match(ccNumber) is not None
+
+def validateOptionalCreditCard(ccNumber: Optional[str]) -> bool:
+    """Validate a signup's credit card number, where a missing or empty one means no card"""
+    return not ccNumber or CARD_PATTERN.match(ccNumber) is not None
+
+def validateAmount(amount: int) -> bool:
+    """Validate that the amount is exactly 3 digits (100-999)"""
+    return 100 <= amount <= 999
+
+# Batch forms: one result per input value, with lookups hoisted out of the loop
+
+def validateUsernameAlphanumericBatch(usernames: Sequence[str]) -> List[bool]:
+    """Check a list of usernames are alphanumeric"""
+    return [username.isalnum() for username in usernames]
+
+def validatePasswordCharsBatch(passwords: Sequence[str]) -> List[bool]:
+    """Check a list of passwords each contain an uppercase letter and a number"""
+    return [validatePasswordChars(password) for password in passwords]
+
+def validatePasswordLengthBatch(passwords: Sequence[str]) -> List[bool]:
+    """Check a list of passwords are at least 8 characters long"""
+    return [len(password) >= 8 for password in passwords]
+
+def validateEmailBatch(emails: Sequence[str]) -> List[bool]:
+    """Validate the format of a list of emails"""
+    match = EMAIL_PATTERN.match
+    return [match(email) is not None for email in emails]
+
+def validateDateFormatBatch(dates: Sequence[str]) -> List[bool]:
+    """Validate that a list of dates are real dates in YYYY-MM-DD format"""
+    return [parseDate(date_str) is not None for date_str in dates]
+
+def checkAgeEligibilityBatch(birthdates: Sequence[str]) -> List[bool]:
+    """Check a list of birthdates against one age cutoff, giving False for malformed ones"""
+    cutoff = ageCutoff()
+    parsed = [parseDate(birthdate) for birthdate in birthdates]
+    return [birth is not None and birth <= cutoff for birth in parsed]
+
+def validateCreditCardBatch(ccNumbers: Sequence[str]) -> List[bool]:
+    """Validate that a list of credit card numbers are numeric and 16 digits long"""
+    match = CARD_PATTERN.match
+    return [match(ccNumber) is not None for ccNumber in ccNumbers]
+
+def validateOptionalCreditCardBatch(ccNumbers: Sequence[Optional[str]]) -> List[bool]:
+    """Validate a list of signup credit card numbers, where missing or empty ones mean no card"""
+    match = CARD_PATTERN.match
+    return [not ccNumber or match(ccNumber) is not None for ccNumber in ccNumbers]
+
+def validateAmountBatch(amounts: Sequence[int]) -> List[bool]:
+    """Validate that a list of amounts are exactly 3 digits (100-999)"""
+    return [100 <= amount <= 999 for amount in amounts]
+
+
+class SignupRule(NamedTuple):
+    """One signup check: the field it reads, the error type UserCreate raises, and the response for a failure"""
+    field: str
+    error: str
+    status: int
+    message: str
+    # Single and batch forms of the check; None for the uniqueness rule, which needs the store
+    check: Optional[Callable[[object], bool]]
+    batchCheck: Optional[Callable[[Sequence], List[bool]]]
+
+# Every signup rule in reporting order, shared by UserCreate (single signups) and validateNewUsers (bulk)
+SIGNUP_RULES = [
+    SignupRule("username", "username_alphanumeric", 400, "Username must be alphanumeric",
+               validateUsernameAlphanumeric, validateUsernameAlphanumericBatch),
+    SignupRule("username", "username_taken", 409, "Username already exists", None, None),
+    SignupRule("password", "password_length", 400, "Password must be at least 8 characters long",
+               validatePasswordLength, validatePasswordLengthBatch),
+    SignupRule("password", "password_chars", 400, "Password must include at least 1 uppercase letter and 1 number",
+               validatePasswordChars, validatePasswordCharsBatch),
+    SignupRule("email", "email_format", 400, "Invalid email format", validateEmail, validateEmailBatch),
+    SignupRule("birthdate", "date_format", 400, "Birthdate must be in YYYY-MM-DD format",
+               validateDateFormat, validateDateFormatBatch),
+    SignupRule("birthdate", "underage", 403, "User must be at least 18 years old to register",
+               checkAgeEligibility, checkAgeEligibilityBatch),
+    SignupRule("ccNumber", "card_format", 400, "Invalid credit card number format",
+               validateOptionalCreditCard, validateOptionalCreditCardBatch),
+]
+
+# Status code and message for each (field, error type) a signup can fail with, in reporting order
+SIGNUP_ERRORS = {(rule.field, rule.error): (rule.status, rule.message) for rule in SIGNUP_RULES}
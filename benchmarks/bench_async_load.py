@@ -0,0 +1,166 @@
+"""Load test: throughput and p99 latency at 1k concurrent connections, this tree against an older one.
+
+Run from the repository root:
+
+    python benchmarks/bench_async_load.py --before <git ref> [--connections 1000] [--duration 10]
+
+Starts uvicorn on the working tree ("after") and, with --before, on a
+temporary git worktree of that ref (say, the last commit with synchronous
+handlers). Each server is seeded through the bulk endpoints, then
+--connections keep-alive connections send requests back to back for
+--duration seconds per scenario:
+  reads    getByUsername, getPaymentById and summaryByUser in turn
+  creates  POST /payments/create
+  logins   POST /users/login, which verifies a password hash
+The client is a raw asyncio HTTP/1.1 loop in this process, so on a small
+machine it competes with the server for CPU; compare runs, not absolutes.
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PASSWORD = "MyPassword123"
+
+
+def freePort() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def startServer(appDir: str, port: int, args) -> subprocess.Popen:
+    env = {**os.environ, "STREAMLY_STORAGE": args.storage, "STREAMLY_PASSWORD_COST": str(args.password_cost),
+           "STREAMLY_SQLITE_PATH": os.path.join(tempfile.mkdtemp(), "bench.db")}
+    env.pop("STREAMLY_DATA_DIR", None)
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port),
+                               "--log-level", "warning", "--backlog", "4096"], cwd=appDir, env=env)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/")
+            return server
+        except OSError:
+            time.sleep(0.2)
+    server.kill()
+    raise RuntimeError(f"server in {appDir} did not start")
+
+def post(port: int, path: str, rows: list) -> None:
+    request = urllib.request.Request(f"http://127.0.0.1:{port}{path}", data=json.dumps(rows).encode(),
+                                     headers={"Content-Type": "application/json"})
+    urllib.request.urlopen(request, timeout=600).read()
+
+def seed(port: int, users: int, payments: int) -> None:
+    post(port, "/users/users/bulkCreate", [
+        {"username": f"user{n}", "password": PASSWORD, "email": f"user{n}@example.com",
+         "birthdate": "1990-01-01", "ccNumber": f"{4000000000000000 + n}"} for n in range(users)])
+    post(port, "/payments/bulkCreate", [
+        {"ccNumber": f"{4000000000000000 + n % users}", "amount": 100 + n % 900} for n in range(payments)])
+
+def scenario(name: str, users: int, payments: int):
+    """Return a function giving the n-th request of a scenario as raw HTTP/1.1 bytes"""
+    def get(path: str) -> bytes:
+        return f"GET {path} HTTP/1.1\r\nHost: bench\r\n\r\n".encode()
+
+    def postJSON(path: str, body: dict) -> bytes:
+        data = json.dumps(body).encode()
+        return (f"POST {path} HTTP/1.1\r\nHost: bench\r\nContent-Type: application/json\r\n"
+                f"Content-Length: {len(data)}\r\n\r\n").encode() + data
+
+    if name == "reads":
+        return lambda n: get([f"/users/getByUsername/user{n % users}", f"/payments/getPaymentById/{1 + n % payments}",
+                              f"/payments/summaryByUser/user{n % users}"][n % 3])
+    if name == "creates":
+        return lambda n: postJSON("/payments/create", {"ccNumber": f"{4000000000000000 + n % users}", "amount": 150})
+    return lambda n: postJSON("/users/login", {"username": f"user{n % users}", "password": PASSWORD})
+
+async def readResponse(reader: asyncio.StreamReader) -> int:
+    head = await reader.readuntil(b"\r\n\r\n")
+    length = 0
+    for line in head.split(b"\r\n"):
+        if line[:15].lower() == b"content-length:":
+            length = int(line[15:])
+    await reader.readexactly(length)
+    return int(head[9:12])
+
+async def collect(port: int, connections: int, duration: float, makeRequest, first: int = 0):
+    """Drive the connections until the deadline; return every latency, the failure count and the elapsed time"""
+    latencies, failures = [], 0
+    counter = iter(range(first, 1 << 62))
+    deadline = time.perf_counter() + duration
+
+    async def connection():
+        nonlocal failures
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        try:
+            while time.perf_counter() < deadline:
+                request = makeRequest(next(counter))
+                began = time.perf_counter()
+                writer.write(request)
+                status = await readResponse(reader)
+                latencies.append(time.perf_counter() - began)
+                failures += status >= 400
+        finally:
+            writer.close()
+
+    began = time.perf_counter()
+    await asyncio.gather(*(connection() for _ in range(connections)))
+    return latencies, failures, time.perf_counter() - began
+
+def summarize(latencies: list, failures: int, elapsed: float) -> dict:
+    latencies = sorted(latencies)
+    return {"rps": len(latencies) / elapsed, "p50": latencies[len(latencies) // 2] * 1000,
+            "p99": latencies[int(len(latencies) * 0.99)] * 1000, "failures": failures}
+
+async def load(port: int, connections: int, duration: float, makeRequest) -> dict:
+    return summarize(*await collect(port, connections, duration, makeRequest))
+
+def run(label: str, appDir: str, args) -> None:
+    port = freePort()
+    server = startServer(appDir, port, args)
+    try:
+        seed(port, args.users, args.payments)
+        for name in args.scenarios:
+            result = asyncio.run(load(port, args.connections, args.duration, scenario(name, args.users, args.payments)))
+            print(f"{label:<8} {name:<8} {result['rps']:>10.0f} {result['p50']:>9.1f} {result['p99']:>9.1f}"
+                  f" {result['failures']:>9}", flush=True)
+    finally:
+        server.terminate()
+        server.wait()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--before", help="git ref to compare against, served from a temporary worktree")
+    parser.add_argument("--connections", type=int, default=1000)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--payments", type=int, default=100_000)
+    parser.add_argument("--scenarios", nargs="+", choices=["reads", "creates", "logins"],
+                        default=["reads", "creates", "logins"])
+    parser.add_argument("--storage", choices=["memory", "sqlite"], default="memory")
+    parser.add_argument("--password-cost", type=int, default=10, help="scrypt log2 N for the seeded users")
+    args = parser.parse_args()
+
+    print(f"{args.connections} connections, {args.duration:g}s per scenario, {args.storage} storage")
+    print(f"{'tree':<8} {'scenario':<8} {'req/s':>10} {'p50 ms':>9} {'p99 ms':>9} {'failures':>9}")
+    if args.before:
+        worktree = tempfile.mkdtemp()
+        subprocess.run(["git", "worktree", "add", "--detach", worktree, args.before], cwd=REPO, check=True,
+                       capture_output=True)
+        try:
+            run("before", worktree, args)
+        finally:
+            subprocess.run(["git", "worktree", "remove", "--force", worktree], cwd=REPO, capture_output=True)
+            shutil.rmtree(worktree, ignore_errors=True)
+    run("after", REPO, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""Benchmark payment ingestion through the single create endpoint against bulk import.
+
+Run from the repository root:
+
+    python benchmarks/bench_bulk_payments.py [--rows 100000] [--storage memory|sqlite]
+
+A settlement file of --rows payments over --cards registered cards is sent
+once through /payments/bulkCreate, and a sample of --single rows is sent one
+request at a time through /payments/create. Both go through the FastAPI app.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+parser.add_argument("--rows", type=int, default=100_000)
+parser.add_argument("--single", type=int, default=5_000)
+parser.add_argument("--cards", type=int, default=1_000)
+parser.add_argument("--storage", choices=["memory", "sqlite"], default="memory")
+args = parser.parse_args()
+
+# Settings are read when the app is imported
+os.environ["STREAMLY_STORAGE"] = args.storage
+os.environ["STREAMLY_SQLITE_PATH"] = os.path.join(tempfile.mkdtemp(), "bench.db")
+os.environ.pop("STREAMLY_DATA_DIR", None)
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.models import User
+from app.storage import paymentsDB, usersDB
+
+
+def card(n: int) -> str:
+    return f"{4000000000000000 + n % args.cards}"
+
+def main():
+    client = TestClient(app)
+    usersDB.clear()
+    usersDB.extend(User(username=f"user{n}", password="x", email=f"user{n}@example.com",
+                        birthdate="1990-01-01", ccNumber=card(n)) for n in range(args.cards))
+
+    paymentsDB.clear()
+    start = time.perf_counter()
+    for n in range(args.single):
+        assert client.post("/payments/create", json={"ccNumber": card(n), "amount": 100 + n % 900}).status_code == 201
+    singleRate = args.single / (time.perf_counter() - start)
+
+    paymentsDB.clear()
+    body = "\n".join(json.dumps({"ccNumber": card(n), "amount": 100 + n % 900}) for n in range(args.rows))
+    start = time.perf_counter()
+    response = client.post("/payments/bulkCreate", content=body, headers={"Content-Type": "application/x-ndjson"})
+    lines = response.text.count("\n")
+    bulkRate = args.rows / (time.perf_counter() - start)
+    assert response.headers["x-created-count"] == str(args.rows) and lines == args.rows
+
+    print(f"{args.storage} storage, {args.cards} registered cards")
+    print(f"single create: {singleRate:>10.0f} payments/sec")
+    print(f"bulk import:   {bulkRate:>10.0f} payments/sec ({bulkRate / singleRate:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
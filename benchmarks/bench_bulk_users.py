@@ -0,0 +1,64 @@
+"""Benchmark signup throughput of the single create endpoint against bulk import.
+
+Run from the repository root:
+
+    python benchmarks/bench_bulk_users.py [--rows 100000] [--cost 14]
+
+Both paths run through the FastAPI app with an in-memory store. Single creates
+are timed on a sample of --single rows and extrapolated; the bulk path imports
+all --rows in one request. Password hashing dominates both at production cost;
+the cost is read when the app is imported, so run the script again with
+--cost 1 to see the per-row validation and storage overhead on its own.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+parser.add_argument("--rows", type=int, default=100_000)
+parser.add_argument("--single", type=int, default=2_000)
+parser.add_argument("--cost", type=int, default=14)
+args = parser.parse_args()
+
+# Settings are read when the app is imported
+os.environ["STREAMLY_STORAGE"] = "memory"
+os.environ.pop("STREAMLY_DATA_DIR", None)
+os.environ["STREAMLY_PASSWORD_COST"] = str(args.cost)
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.storage import usersDB
+
+
+def signup(n: int) -> dict:
+    return {"username": f"user{n}", "password": "MyPassword123", "email": f"user{n}@example.com",
+            "birthdate": "1990-01-01", "ccNumber": "1234567890123456" if n % 2 else None}
+
+def main():
+    client = TestClient(app)
+
+    usersDB.clear()
+    start = time.perf_counter()
+    for n in range(args.single):
+        assert client.post("/users/users/create", json=signup(n)).status_code == 201
+    singleRate = args.single / (time.perf_counter() - start)
+
+    usersDB.clear()
+    body = "\n".join(json.dumps(signup(n)) for n in range(args.rows))
+    start = time.perf_counter()
+    response = client.post("/users/users/bulkCreate", content=body, headers={"Content-Type": "application/x-ndjson"})
+    bulkRate = args.rows / (time.perf_counter() - start)
+    assert response.json()["created"] == args.rows
+
+    print(f"scrypt cost {args.cost}")
+    print(f"single create: {singleRate:>10.0f} rows/sec")
+    print(f"bulk import:   {bulkRate:>10.0f} rows/sec ({bulkRate / singleRate:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Benchmark payment validation latency against the number of registered users.
+
+Run from the repository root:
+
+    python benchmarks/bench_card_lookup.py [--sizes 1000 10000 100000 1000000]
+
+For each store size the script registers that many users with cards and then
+times checkCardRegistered and the createPayment handler, awaiting each call on
+one event loop. p99 should stay flat as the number of users grows.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.models import Payment, User
+from app.routes.payments import createPayment
+from app.storage import paymentsDB, usersDB
+from app.utils import checkCardRegistered
+
+
+def cardFor(i: int) -> str:
+    return f"{i:016d}"
+
+def populate(count: int) -> None:
+    usersDB.clear()
+    paymentsDB.clear()
+    for i in range(count):
+        # model_construct skips validation so large stores build quickly
+        usersDB.add(User.model_construct(
+            username=f"user{i}",
+            password="x",
+            email=f"user{i}@example.com",
+            birthdate="1990-01-01",
+            ccNumber=cardFor(i)
+        ))
+
+def percentiles(samples):
+    samples = sorted(samples)
+    pick = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))]
+    return pick(0.50), pick(0.99)
+
+def timeCalls(fn, args, rounds: int):
+    samples = []
+    for i in range(rounds):
+        arg = args[i % len(args)]
+        start = time.perf_counter_ns()
+        fn(arg)
+        samples.append(time.perf_counter_ns() - start)
+    return percentiles(samples)
+
+async def timeAwaits(fn, args, rounds: int):
+    """timeCalls for a coroutine function such as a route handler, awaiting each call"""
+    samples = []
+    for i in range(rounds):
+        arg = args[i % len(args)]
+        start = time.perf_counter_ns()
+        await fn(arg)
+        samples.append(time.perf_counter_ns() - start)
+    return percentiles(samples)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000, 1_000_000])
+    parser.add_argument("--rounds", type=int, default=20_000)
+    args = parser.parse_args()
+
+    print(f"{'users':>10} {'lookup p50':>12} {'lookup p99':>12} {'create p50':>12} {'create p99':>12}")
+    for size in args.sizes:
+        populate(size)
+        # Probe cards spread over the whole store: worst case for the old linear scan
+        cards = [cardFor(i) for i in range(size - 1, -1, -max(1, size // 100))]
+        lookup50, lookup99 = timeCalls(checkCardRegistered, cards, args.rounds)
+        payments = [Payment(ccNumber=card, amount=150) for card in cards]
+        create50, create99 = asyncio.run(timeAwaits(createPayment, payments, args.rounds))
+        print(f"{size:>10} {lookup50:>10}ns {lookup99:>10}ns {create50:>10}ns {create99:>10}ns")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""Benchmark the cost of request metrics and step timers as a share of request time.
+
+Run from the repository root:
+
+    python benchmarks/bench_metrics_overhead.py [--requests 2000] [--rounds 40]
+
+Builds the app twice in one process: once as served (MetricsMiddleware plus
+the step timers) and once without either. Then it sends the same mix of
+requests straight into each ASGI stack, with no sockets and no HTTP parsing:
+getByUsername, getPaymentById, a getAll page and a payment creation. Rounds
+alternate between the two stacks, and the overhead is the median of the
+per-round differences. Leaving out the network makes it a bigger share of
+request time than a real deployment would see.
+
+A difference of a few percent is within the noise of such a run, so the
+instrumentation is also timed on its own: the middleware around an app that
+answers immediately, and a step timer, against the same without them. The
+timer cost is counted once for every step the mix actually timed.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def request(method: str, path: str, body: bytes = b"") -> tuple:
+    path, _, query = path.partition("?")
+    scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": method, "scheme": "http",
+             "path": path, "raw_path": path.encode(), "query_string": query.encode(), "root_path": "",
+             "headers": [(b"host", b"bench"), (b"content-type", b"application/json"),
+                         (b"content-length", str(len(body)).encode())],
+             "client": ("127.0.0.1", 1), "server": ("127.0.0.1", 80)}
+    return scope, body
+
+async def instrumentationCost(count: int, route, repeat: int = 5) -> tuple:
+    """Seconds per request added by the middleware, and per step by a timer, measured without the app (best of repeat)"""
+    from app import metrics
+
+    async def bare(scope, receive, send):
+        scope["route"] = route
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"{}"})
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    wrapped = metrics.MetricsMiddleware(bare)
+    scope = request("GET", "/users/getByUsername/user0")[0]
+    timings = {bare: [], wrapped: []}
+    for _ in range(repeat):
+        for app in (bare, wrapped):
+            began = time.perf_counter()
+            for _ in range(count):
+                await app(dict(scope), receive, send)
+            timings[app].append((time.perf_counter() - began) / count)
+    middleware = min(timings[wrapped]) - min(timings[bare])
+
+    timers = []
+    for _ in range(repeat):
+        began = time.perf_counter()
+        for _ in range(count):
+            with metrics.timed("bench"):
+                pass
+        timers.append((time.perf_counter() - began) / count)
+    return middleware, min(timers)
+
+async def drive(app, requests: list) -> float:
+    """Send every request through the ASGI app; return the mean seconds per request"""
+    async def send(message):
+        pass
+
+    began = time.perf_counter()
+    for scope, body in requests:
+        async def receive(body=body):
+            return {"type": "http.request", "body": body, "more_body": False}
+        await app(dict(scope), receive, send)
+    return (time.perf_counter() - began) / len(requests)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--rounds", type=int, default=40)
+    parser.add_argument("--users", type=int, default=10_000)
+    args = parser.parse_args()
+
+    os.environ["STREAMLY_STORAGE"] = "memory"
+    os.environ["STREAMLY_METRICS"] = "1"
+    os.environ.pop("STREAMLY_DATA_DIR", None)
+    from app import config
+    from app.main import app
+    from app.metrics import MetricsMiddleware, stepSeconds
+    from app.models import Payment, User
+    from app.storage import paymentsDB, usersDB
+
+    usersDB.extend(User(username=f"user{n}", password="x", email=f"user{n}@example.com", birthdate="1990-01-01",
+                        ccNumber=f"{4000000000000000 + n}") for n in range(args.users))
+    paymentsDB.extend(Payment(id=n, ccNumber=f"{4000000000000000 + n % args.users}", amount=100 + n % 900,
+                              date="2024-01-01T00:00:00") for n in range(1, args.users * 10 + 1))
+    paymentsDB.advanceNextId(args.users * 10 + 1)
+
+    # The stack as served, and one built without the middleware
+    withMetrics = app.build_middleware_stack()
+    app.user_middleware = [m for m in app.user_middleware if m.cls is not MetricsMiddleware]
+    withoutMetrics = app.build_middleware_stack()
+
+    mix = []
+    for n in range(args.requests):
+        kind = n % 4
+        if kind == 0:
+            mix.append(request("GET", f"/users/getByUsername/user{n % args.users}"))
+        elif kind == 1:
+            mix.append(request("GET", f"/payments/getPaymentById/{1 + n % (args.users * 10)}"))
+        elif kind == 2:
+            mix.append(request("GET", "/payments/getAll?limit=20"))
+        else:
+            body = json.dumps({"ccNumber": f"{4000000000000000 + n % args.users}", "amount": 150}).encode()
+            mix.append(request("POST", "/payments/create", body))
+
+    async def run():
+        timings = {True: [], False: []}
+        await drive(withMetrics, mix[:1000])
+        await drive(withoutMetrics, mix[:1000])
+        for round in range(args.rounds):
+            for enabled in ((True, False) if round % 2 == 0 else (False, True)):
+                config.METRICS = enabled
+                timings[enabled].append(await drive(withMetrics if enabled else withoutMetrics, mix))
+        config.METRICS = True
+        return timings
+
+    timings = asyncio.run(run())
+    steps = sum(stepSeconds.counts().values()) / (len(timings[True]) * len(mix) + 2000)
+    on, off = statistics.median(timings[True]), statistics.median(timings[False])
+    difference = statistics.median(a - b for a, b in zip(timings[True], timings[False]))
+    print(f"{args.requests} requests x {args.rounds} rounds, median per request")
+    print(f"without metrics           {off * 1e6:8.1f} µs")
+    print(f"with metrics              {on * 1e6:8.1f} µs")
+    print(f"difference                {difference * 1e6:8.1f} µs ({difference / off * 100:+.2f}%)")
+
+    route = next(r for r in app.routes if getattr(r, "path", None) == "/users/getByUsername/{username}")
+    middleware, timer = asyncio.run(instrumentationCost(50_000, route))
+    perRequest = middleware + timer * steps
+    print(f"middleware alone          {middleware * 1e6:8.2f} µs per request")
+    print(f"step timer alone          {timer * 1e6:8.2f} µs per step, {steps:.2f} steps per request")
+    print(f"instrumentation share     {perRequest / off * 100:8.2f}% of a request without metrics")
+
+
+if __name__ == "__main__":
+    main()
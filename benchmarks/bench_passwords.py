@@ -0,0 +1,68 @@
+"""Benchmark signup hashing throughput for each password hashing cost.
+
+Run from the repository root:
+
+    python benchmarks/bench_passwords.py [--threads 40] [--workers N]
+
+Request threads (40 matches Starlette's default threadpool) hash passwords
+through a PasswordHasher for a fixed time. The script reports signups/sec and
+mean hashing latency for each scheme and cost setting.
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.passwords import PasswordHasher
+
+SETTINGS = [
+    ("scrypt", 12),
+    ("scrypt", 14),
+    ("scrypt", 15),
+    ("pbkdf2_sha256", 100_000),
+    ("pbkdf2_sha256", 600_000),
+]
+
+
+def bench(hasher: PasswordHasher, threads: int, seconds: float):
+    deadline = time.perf_counter() + seconds
+    counts = [0] * threads
+    latencies = [0.0] * threads
+
+    def worker(n):
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            hasher.hash("MyPassword123")
+            latencies[n] += time.perf_counter() - start
+            counts[n] += 1
+
+    workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    total = sum(counts)
+    return total / seconds, 1000 * sum(latencies) / max(1, total)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=40)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--seconds", type=float, default=5.0)
+    args = parser.parse_args()
+
+    print(f"{args.threads} request threads, {args.workers} hashing processes")
+    print(f"{'scheme':<15} {'cost':>8} {'signups/sec':>12} {'mean ms':>9}")
+    for scheme, cost in SETTINGS:
+        hasher = PasswordHasher(scheme, cost, args.workers)
+        hasher.hash("warmup")
+        rate, latency = bench(hasher, args.threads, args.seconds)
+        hasher.close()
+        print(f"{scheme:<15} {cost:>8} {rate:>12.1f} {latency:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Benchmark /payments/aggregate against aggregating Payment objects in a Python loop.
+
+Run from the repository root:
+
+    python benchmarks/bench_payment_aggregate.py [--records 1000000] [--cards 20000] [--repeat 20]
+
+Fills the in-memory store with --records payments over --cards cards (one
+registered user per card, one payment every 3 seconds), then reports mean
+latency for each grouping through the FastAPI app, with and without a one-day
+range. The loop baseline groups by card over paymentsDB.iterate(), which is
+what a client aggregating /payments/getAll has to do; it is skipped above
+--loop-limit records.
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ["STREAMLY_STORAGE"] = "memory"
+os.environ.pop("STREAMLY_DATA_DIR", None)
+# Filling the cache would only slow the setup down
+os.environ["STREAMLY_JSON_CACHE_BYTES"] = "0"
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.models import Payment, User
+from app.storage import paymentsDB, usersDB
+
+START = datetime(2024, 1, 1)
+CHUNK = 100_000
+
+
+def fill(records: int, cards: int) -> None:
+    usersDB.extend(User(username=f"user{n}", password="x", email=f"user{n}@example.com", birthdate="1990-01-01",
+                        ccNumber=f"{4000000000000000 + n}") for n in range(cards))
+    for first in range(1, records + 1, CHUNK):
+        paymentsDB.addMany([Payment(id=n, ccNumber=f"{4000000000000000 + n % cards}", amount=100 + n % 900,
+                                    date=(START + timedelta(seconds=3 * n)).isoformat())
+                            for n in range(first, min(first + CHUNK, records + 1))])
+
+def loopByCard() -> dict:
+    groups = {}
+    for payment in paymentsDB.iterate():
+        count, total = groups.get(payment.ccNumber, (0, 0))
+        groups[payment.ccNumber] = (count + 1, total + payment.amount)
+    return groups
+
+def timed(fn, repeat: int) -> float:
+    fn()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--records", type=int, default=1_000_000)
+    parser.add_argument("--cards", type=int, default=20_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--loop-limit", type=int, default=2_000_000)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    fill(args.records, args.cards)
+    print(f"{args.records} payments over {args.cards} cards, filled in {time.perf_counter() - start:.1f}s")
+
+    client = TestClient(app)
+    day = {"from": (START + timedelta(days=1)).isoformat(), "to": (START + timedelta(days=2)).isoformat()}
+    print(f"{'query':<24} {'store ms':>9} {'endpoint ms':>12}")
+    for groupBy in ["card", "user", "day"]:
+        for label, bounds in [("", {}), (" (1 day)", day)]:
+            startAt = datetime.fromisoformat(bounds["from"]) if bounds else None
+            endAt = datetime.fromisoformat(bounds["to"]) if bounds else None
+            store = timed(lambda: paymentsDB.aggregate("card" if groupBy == "user" else groupBy, startAt, endAt),
+                          args.repeat)
+            endpoint = timed(lambda: client.get("/payments/aggregate", params={"groupBy": groupBy, **bounds}),
+                             args.repeat)
+            print(f"{groupBy + label:<24} {store:>9.2f} {endpoint:>12.2f}")
+
+    if args.records <= args.loop_limit:
+        print(f"Python loop over Payment objects, by card: {timed(loopByCard, 1):.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Benchmark filtered payment listings against filtering a scan of every payment.
+
+Run from the repository root:
+
+    python benchmarks/bench_payment_filters.py [--records 1000000] [--cards 20000] [--storage memory|sqlite]
+
+Fills the store with --records payments over --cards cards (one payment every
+3 seconds), then reports mean latency of /payments/getAll pages filtered by
+card, by a one-hour range, by both, and by an amount range, next to the cost
+of finding the same payments by scanning paymentsDB.iterate(). With --shuffle
+the payments are stored with dates out of id order, so date ranges go through
+the date-sorted index instead of bisecting the date column.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+START = datetime(2024, 1, 1)
+CHUNK = 100_000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--records", type=int, default=1_000_000)
+    parser.add_argument("--cards", type=int, default=20_000)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--storage", choices=["memory", "sqlite"], default="memory")
+    parser.add_argument("--shuffle", action="store_true", help="store dates out of id order")
+    args = parser.parse_args()
+
+    os.environ["STREAMLY_STORAGE"] = args.storage
+    os.environ["STREAMLY_SQLITE_PATH"] = os.path.join(tempfile.mkdtemp(), "bench.db")
+    os.environ["STREAMLY_JSON_CACHE_BYTES"] = "0"
+    os.environ.pop("STREAMLY_DATA_DIR", None)
+    from fastapi.testclient import TestClient
+
+    from app.main import app
+    from app.models import Payment
+    from app.storage import paymentsDB
+
+    seconds = list(range(1, args.records + 1))
+    if args.shuffle:
+        random.shuffle(seconds)
+    for first in range(1, args.records + 1, CHUNK):
+        paymentsDB.addMany([Payment(id=n, ccNumber=f"{4000000000000000 + n % args.cards}", amount=100 + n % 900,
+                                    date=(START + timedelta(seconds=3 * seconds[n - 1])).isoformat())
+                            for n in range(first, min(first + CHUNK, args.records + 1))])
+    print(f"{args.storage} storage, {args.records} payments over {args.cards} cards"
+          f"{', dates out of order' if args.shuffle else ''}")
+
+    hours = max(1, args.records * 3 // 3600)
+
+    def byCard():
+        return {"ccNumber": f"{4000000000000000 + random.randrange(args.cards)}"}
+
+    def byHour():
+        at = START + timedelta(hours=random.randrange(hours))
+        return {"from": at.isoformat(), "to": (at + timedelta(hours=1)).isoformat()}
+
+    def byAmount():
+        low = 100 + random.randrange(890)
+        return {"minAmount": low, "maxAmount": low + 9}
+
+    client = TestClient(app)
+    queries = [("card", byCard), ("1 hour", byHour), ("card + 1 hour", lambda: {**byCard(), **byHour()}),
+               ("amount range", byAmount)]
+    print(f"{'filter':<16} {'page of 100 ms':>15} {'scan ms':>10}")
+    for name, makeParams in queries:
+        requests = [makeParams() for _ in range(args.requests)]
+        began = time.perf_counter()
+        for params in requests:
+            client.get("/payments/getAll", params={**params, "limit": 100})
+        page = (time.perf_counter() - began) / len(requests) * 1000
+
+        # What a client without the filters does: walk every payment and keep the first 100 matches
+        params = requests[0]
+        began = time.perf_counter()
+        matches = []
+        for payment in paymentsDB.iterate():
+            if "ccNumber" in params and payment.ccNumber != params["ccNumber"]:
+                continue
+            if "from" in params and not params["from"] <= payment.date < params["to"]:
+                continue
+            if "minAmount" in params and not params["minAmount"] <= payment.amount <= params["maxAmount"]:
+                continue
+            matches.append(payment)
+            if len(matches) == 100:
+                break
+        scan = (time.perf_counter() - began) * 1000
+        print(f"{name:<16} {page:>15.3f} {scan:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Benchmark a user's spend summary from the running rollups against scanning their payment history.
+
+Run from the repository root:
+
+    python benchmarks/bench_payment_summary.py [--records 1000000] [--cards 20000] [--storage memory|sqlite]
+
+Fills the store with --records payments over --cards cards (one registered
+user per card), then reports mean latency of /payments/summaryByUser for
+random users, and of the same numbers computed by scanning the user's
+payments the way a client of /payments/getAll would. Deleting a payment that
+held a card's largest amount makes the next read recompute that card's range,
+which is timed separately.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+CHUNK = 100_000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--records", type=int, default=1_000_000)
+    parser.add_argument("--cards", type=int, default=20_000)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--storage", choices=["memory", "sqlite"], default="memory")
+    args = parser.parse_args()
+
+    os.environ["STREAMLY_STORAGE"] = args.storage
+    os.environ["STREAMLY_SQLITE_PATH"] = os.path.join(tempfile.mkdtemp(), "bench.db")
+    os.environ["STREAMLY_JSON_CACHE_BYTES"] = "0"
+    os.environ.pop("STREAMLY_DATA_DIR", None)
+    from fastapi.testclient import TestClient
+
+    from app.main import app
+    from app.models import Payment, User
+    from app.storage import paymentsDB, usersDB
+
+    start = datetime(2024, 1, 1)
+    usersDB.extend(User(username=f"user{n}", password="x", email=f"user{n}@example.com", birthdate="1990-01-01",
+                        ccNumber=f"{4000000000000000 + n}") for n in range(args.cards))
+    for first in range(1, args.records + 1, CHUNK):
+        paymentsDB.addMany([Payment(id=n, ccNumber=f"{4000000000000000 + n % args.cards}", amount=100 + n % 900,
+                                    date=(start + timedelta(seconds=3 * n)).isoformat())
+                            for n in range(first, min(first + CHUNK, args.records + 1))])
+    print(f"{args.storage} storage, {args.records} payments over {args.cards} cards")
+
+    client = TestClient(app)
+    users = [random.randrange(args.cards) for _ in range(args.requests)]
+    began = time.perf_counter()
+    for n in users:
+        client.get(f"/payments/summaryByUser/user{n}")
+    print(f"summaryByUser from rollups:  {(time.perf_counter() - began) / len(users) * 1000:8.3f} ms")
+
+    scans = users[:3]
+    began = time.perf_counter()
+    for n in scans:
+        ccNumber = f"{4000000000000000 + n}"
+        amounts = [p.amount for p in paymentsDB.iterate() if p.ccNumber == ccNumber]
+        (len(amounts), sum(amounts), min(amounts, default=None), max(amounts, default=None))
+    print(f"scan of the user's payments: {(time.perf_counter() - began) / len(scans) * 1000:8.1f} ms")
+
+    # Payment n has amount 100 + n % 900, so ids 899 + 900k carry the largest amount, 999
+    victims = list(range(899, args.records + 1, 900))[:50]
+    began = time.perf_counter()
+    for paymentId in victims:
+        ccNumber = f"{4000000000000000 + paymentId % args.cards}"
+        paymentsDB.remove(paymentId)
+        paymentsDB.cardSummary(ccNumber)
+    print(f"delete of a card's largest payment + next read: "
+          f"{(time.perf_counter() - began) / max(1, len(victims)) * 1000:8.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
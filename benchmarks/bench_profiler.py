@@ -0,0 +1,114 @@
+"""Benchmark request time with the runtime profiler off and while a profile is being taken.
+
+Run from the repository root:
+
+    python benchmarks/bench_profiler.py [--requests 2000] [--rounds 10] [--interval 0.01]
+
+Sends a mix of getByUsername, getPaymentById, getAll pages and payment
+creations straight into the ASGI app. Rounds alternate between no profile
+(the app as always served: the profiler adds nothing to a request until a
+profile starts) and a profile sampling every --interval seconds, and the
+median per-request time of each is reported. Also prints the hottest stacks
+of the last profile.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def request(method: str, path: str, body: bytes = b"") -> tuple:
+    path, _, query = path.partition("?")
+    scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": method, "scheme": "http",
+             "path": path, "raw_path": path.encode(), "query_string": query.encode(), "root_path": "",
+             "headers": [(b"host", b"bench"), (b"content-type", b"application/json"),
+                         (b"content-length", str(len(body)).encode())],
+             "client": ("127.0.0.1", 1), "server": ("127.0.0.1", 80)}
+    return scope, body
+
+async def drive(app, requests: list) -> float:
+    """Send every request through the ASGI app; return the mean seconds per request"""
+    async def send(message):
+        pass
+
+    began = time.perf_counter()
+    for scope, body in requests:
+        async def receive(body=body):
+            return {"type": "http.request", "body": body, "more_body": False}
+        await app(dict(scope), receive, send)
+        # In-process requests never suspend; let the profile's own task run like it would between real requests
+        await asyncio.sleep(0)
+    return (time.perf_counter() - began) / len(requests)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--interval", type=float, default=0.01)
+    args = parser.parse_args()
+
+    os.environ["STREAMLY_STORAGE"] = "memory"
+    os.environ.pop("STREAMLY_DATA_DIR", None)
+    from app.main import app
+    from app.models import Payment, User
+    from app.profiler import ProfileSession, profiler
+    from app.storage import paymentsDB, usersDB
+
+    usersDB.extend(User(username=f"user{n}", password="x", email=f"user{n}@example.com", birthdate="1990-01-01",
+                        ccNumber=f"{4000000000000000 + n}") for n in range(args.users))
+    paymentsDB.extend(Payment(id=n, ccNumber=f"{4000000000000000 + n % args.users}", amount=100 + n % 900,
+                              date="2024-01-01T00:00:00") for n in range(1, args.users * 10 + 1))
+    paymentsDB.advanceNextId(args.users * 10 + 1)
+
+    mix = []
+    for n in range(args.requests):
+        kind = n % 4
+        if kind == 0:
+            mix.append(request("GET", f"/users/getByUsername/user{n % args.users}"))
+        elif kind == 1:
+            mix.append(request("GET", f"/payments/getPaymentById/{1 + n % (args.users * 10)}"))
+        elif kind == 2:
+            mix.append(request("GET", "/payments/getAll?limit=20"))
+        else:
+            body = json.dumps({"ccNumber": f"{4000000000000000 + n % args.users}", "amount": 150}).encode()
+            mix.append(request("POST", "/payments/create", body))
+
+    async def run():
+        timings = {False: [], True: []}
+        session = None
+        await drive(app, mix[:1000])
+        for round in range(args.rounds):
+            for profiled in ((False, True) if round % 2 == 0 else (True, False)):
+                if not profiled:
+                    timings[False].append(await drive(app, mix))
+                    continue
+                session = ProfileSession(app, seconds=300, interval=args.interval)
+                task = asyncio.create_task(profiler.profile(session))
+                await asyncio.sleep(0)
+                timings[True].append(await drive(app, mix))
+                # Cancelling ends the profile the same way its time limit would
+                task.cancel()
+                with contextlib.suppress(asyncio.CancelledError):
+                    await task
+        return timings, session
+
+    timings, session = asyncio.run(run())
+    off, on = statistics.median(timings[False]), statistics.median(timings[True])
+    print(f"{args.requests} requests x {args.rounds} rounds, median per request")
+    print(f"no profile                {off * 1e6:8.1f} µs")
+    print(f"profiling every {args.interval * 1000:g} ms    {on * 1e6:8.1f} µs ({(on - off) / off * 100:+.2f}%)")
+    print(f"last profile: {session.samples} samples, {session.idle} idle, {len(session.stacks)} distinct stacks")
+    for line in session.collapsed().splitlines()[:5]:
+        stack, count = line.rsplit(" ", 1)
+        print(f"{count:>6}  {stack.rsplit(';', 1)[-1]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Benchmark list and lookup endpoints with the serialized-record cache on and off.
+
+Run from the repository root:
+
+    python benchmarks/bench_record_cache.py [--records 10000] [--requests 50]
+
+Each setting runs in a child process (STREAMLY_JSON_CACHE_BYTES=0 turns the
+cache off). The child fills an in-memory store with --records users and
+payments, then reports mean latency for /users/getAll, /payments/getAll and
+random /payments/getPaymentById lookups, plus the cache counters at the end.
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SETTINGS = [("off", "0"), ("on", str(256 * 1024 * 1024))]
+
+
+def child(records: int, requests: int) -> None:
+    from fastapi.testclient import TestClient
+
+    from app.main import app
+    from app.models import Payment, User
+    from app.storage import paymentsDB, usersDB
+
+    usersDB.extend(User(username=f"user{n}", password="scrypt$ln=14,r=8,p=1$c2FsdA$ZGlnZXN0", email=f"user{n}@example.com",
+                        birthdate="1990-01-01", ccNumber=f"{4000000000000000 + n}" if n % 2 else None)
+                   for n in range(records))
+    paymentsDB.extend(Payment(id=n, ccNumber=f"{4000000000000000 + n}", amount=100 + n % 900,
+                              date="2024-01-01T10:00:00") for n in range(1, records + 1))
+    client = TestClient(app)
+    results = {}
+    for path in ["/users/getAll", "/payments/getAll"]:
+        client.get(path)
+        start = time.perf_counter()
+        for _ in range(requests):
+            client.get(path)
+        results[path] = (time.perf_counter() - start) / requests * 1000
+
+    ids = [random.randint(1, records) for _ in range(requests * 20)]
+    start = time.perf_counter()
+    for paymentId in ids:
+        client.get(f"/payments/getPaymentById/{paymentId}")
+    results["/payments/getPaymentById"] = (time.perf_counter() - start) / len(ids) * 1000
+    results["stats"] = paymentsDB.cacheStats()
+    print(json.dumps(results))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--records", type=int, default=10_000)
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args.records, args.requests)
+        return
+
+    timings = {}
+    for name, budget in SETTINGS:
+        env = dict(os.environ, STREAMLY_JSON_CACHE_BYTES=budget, STREAMLY_STORAGE="memory")
+        env.pop("STREAMLY_DATA_DIR", None)
+        output = subprocess.run([sys.executable, __file__, "--child", "--records", str(args.records),
+                                 "--requests", str(args.requests)], env=env, check=True,
+                                capture_output=True, text=True).stdout
+        timings[name] = json.loads(output.splitlines()[-1])
+
+    print(f"{args.records} records, mean ms per request")
+    print(f"{'endpoint':<26} {'cache off':>10} {'cache on':>10}")
+    for path in ["/users/getAll", "/payments/getAll", "/payments/getPaymentById"]:
+        off, on = timings["off"][path], timings["on"][path]
+        print(f"{path:<26} {off:>10.3f} {on:>10.3f}  ({off / on:.1f}x)")
+    print("payment cache with cache on:", timings["on"]["stats"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Measure the memory each stored user and payment takes, as models versus the compact rows.
+
+Run from the repository root:
+
+    python benchmarks/bench_record_memory.py [--records 200000] [--cards 20000]
+
+Reports traced bytes per record (tracemalloc) for:
+  models   a dict of User / Payment model instances, which is how the stores used to hold rows
+  rows     the compact form: a dict of UserRow tuples, or PaymentColumns
+  store    a whole UserStore / PaymentStore, with its indexes (JSON cache off)
+
+Payments draw their card from --cards distinct numbers and have distinct
+microsecond timestamps, like payments created through the API.
+"""
+import argparse
+import gc
+import os
+import sys
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.models import Payment, User
+from app.storage import PaymentStore, UserStore
+from app.storage.rows import PaymentColumns, toUserRow
+
+HASH = "scrypt$ln=14,r=8,p=1$c2FsdHNhbHRzYWx0c2FsdA$ZGlnZXN0ZGlnZXN0ZGlnZXN0ZGlnZXN0ZGlnZXN0ZGk"
+
+
+def makeUsers(count: int):
+    for n in range(count):
+        yield User(username=f"user{n}", password=HASH, email=f"user{n}@example.com",
+                   birthdate=f"{1950 + n % 50}-{1 + n % 12:02d}-{1 + n % 28:02d}",
+                   ccNumber=f"{4000000000000000 + n}" if n % 2 else None)
+
+def makePayments(count: int, cards: int):
+    start = datetime(2024, 1, 1)
+    for n in range(1, count + 1):
+        yield Payment(id=n, ccNumber=f"{4000000000000000 + n % cards}", amount=100 + n % 900,
+                      date=(start + timedelta(seconds=n, microseconds=n % 999_983)).isoformat())
+
+def measure(build) -> int:
+    """Return the bytes still allocated by what build() returns"""
+    gc.collect()
+    tracemalloc.start()
+    kept = build()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del kept
+    return size
+
+def userRows(records: int):
+    return {n: toUserRow(user) for n, user in enumerate(makeUsers(records))}
+
+def userStore(records: int):
+    store = UserStore(cacheBytes=0)
+    store.extend(makeUsers(records))
+    return store
+
+def paymentColumns(records: int, cards: int):
+    columns = PaymentColumns()
+    for payment in makePayments(records, cards):
+        columns.put(payment)
+    return columns
+
+def paymentStore(records: int, cards: int):
+    store = PaymentStore(cacheBytes=0)
+    for payment in makePayments(records, cards):
+        store.add(payment)
+    return store
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--records", type=int, default=200_000)
+    parser.add_argument("--cards", type=int, default=20_000)
+    args = parser.parse_args()
+    records, cards = args.records, args.cards
+
+    tables = {
+        "users": [
+            ("models", measure(lambda: {user.username: user for user in makeUsers(records)})),
+            ("rows", measure(lambda: userRows(records))),
+            ("store", measure(lambda: userStore(records))),
+        ],
+        "payments": [
+            ("models", measure(lambda: {p.id: p for p in makePayments(records, cards)})),
+            ("rows", measure(lambda: paymentColumns(records, cards))),
+            ("store", measure(lambda: paymentStore(records, cards))),
+        ],
+    }
+    print(f"{records} records, bytes per record")
+    for table, results in tables.items():
+        before = results[0][1]
+        for name, size in results:
+            ratio = f"  ({before / size:.1f}x smaller)" if name != "models" else ""
+            print(f"{table:<9} {name:<7} {size / records:>8.1f}{ratio}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Microbenchmark the signup and payment validators, one value at a time and in batches.
+
+Run from the repository root:
+
+    python benchmarks/bench_validation.py [--batch 10000] [--repeat 5]
+
+For each validator the script reports ns per value for the previous
+implementation (re.match with a string pattern, strptime for dates), the
+current single-value function, and its batch form over --batch values.
+"""
+import argparse
+import os
+import re
+import sys
+import timeit
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import validation
+
+
+def legacyEmail(email):
+    return re.match(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$', email) is not None
+
+def legacyDateFormat(date_str):
+    return re.match(r'^\d{4}-\d{2}-\d{2}$', date_str) is not None
+
+def legacyAgeEligibility(birthdate):
+    if not legacyDateFormat(birthdate):
+        return False
+    birth_date = datetime.strptime(birthdate, "%Y-%m-%d")
+    return (datetime.now() - birth_date).days // 365 >= 18
+
+def legacyCreditCard(ccNumber):
+    return re.match(r'^\d{16}$', ccNumber) is not None
+
+# name, previous implementation (or None if unchanged), current function, batch form, sample values
+CASES = [
+    ("email", legacyEmail, validation.validateEmail, validation.validateEmailBatch,
+     ["alice.smith@streamly.com", "not-an-email", "bob@example.org"]),
+    ("dateFormat", legacyDateFormat, validation.validateDateFormat, validation.validateDateFormatBatch,
+     ["1990-01-01", "01/01/1990", "2001-12-31"]),
+    ("ageEligibility", legacyAgeEligibility, validation.checkAgeEligibility, validation.checkAgeEligibilityBatch,
+     ["1990-01-01", "2015-06-30", "1985-12-25"]),
+    ("creditCard", legacyCreditCard, validation.validateCreditCard, validation.validateCreditCardBatch,
+     ["4532123456789012", "4532-1234", "1234567890123456"]),
+    ("usernameAlnum", None, validation.validateUsernameAlphanumeric, validation.validateUsernameAlphanumericBatch,
+     ["alicesmith", "bob_1", "carol99"]),
+    ("passwordLength", None, validation.validatePasswordLength, validation.validatePasswordLengthBatch,
+     ["MyPassword123", "short", "AnotherPass1"]),
+    ("passwordChars", None, validation.validatePasswordChars, validation.validatePasswordCharsBatch,
+     ["MyPassword123", "lowercase", "UPPER123"]),
+    ("amount", None, validation.validateAmount, validation.validateAmountBatch, [150, 99, 999]),
+]
+
+
+def perValue(stmt, values: int, repeat: int) -> float:
+    """Best-of-repeat time per value in nanoseconds"""
+    return min(timeit.repeat(stmt, number=1, repeat=repeat)) / values * 1e9
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--batch", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"ns per value, best of {args.repeat}, batch size {args.batch}")
+    print(f"{'validator':<16} {'previous':>10} {'single':>10} {'batch':>10}")
+    for name, legacy, single, batch, samples in CASES:
+        values = (samples * (args.batch // len(samples) + 1))[:args.batch]
+        legacyTime = perValue(lambda: [legacy(v) for v in values], len(values), args.repeat) if legacy else None
+        singleTime = perValue(lambda: [single(v) for v in values], len(values), args.repeat)
+        batchTime = perValue(lambda: batch(values), len(values), args.repeat)
+        legacyText = f"{legacyTime:>10.0f}" if legacyTime is not None else f"{'-':>10}"
+        print(f"{name:<16} {legacyText} {singleTime:>10.0f} {batchTime:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
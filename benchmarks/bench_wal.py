@@ -0,0 +1,95 @@
+"""Benchmark write-ahead log throughput and recovery time.
+
+Run from the repository root:
+
+    python benchmarks/bench_wal.py [--threads 1 8 32] [--records 1000000]
+
+The write test adds payments from several threads for a fixed time with fsync
+enabled and reports writes/sec and how many records shared each fsync. The
+recovery test builds a store of --records payments and times startup replay
+from the log alone and from a snapshot.
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.models import Payment
+from app.persistence import WriteAheadLog
+from app.storage import PaymentStore, UserStore
+
+
+def openStores(directory, **kwargs):
+    users, payments = UserStore(), PaymentStore()
+    wal = WriteAheadLog(directory, **kwargs)
+    start = time.perf_counter()
+    wal.open(users, payments)
+    return wal, users, payments, time.perf_counter() - start
+
+def benchWrites(threads: int, seconds: float) -> None:
+    directory = tempfile.mkdtemp(prefix="streamly-wal-")
+    try:
+        wal, users, payments, _ = openStores(directory)
+        deadline = time.perf_counter() + seconds
+        counts = [0] * threads
+
+        def worker(n):
+            while time.perf_counter() < deadline:
+                payments.add(Payment(id=payments.allocateId(), ccNumber="1234567890123456", amount=150))
+                counts[n] += 1
+
+        workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        wal.close()
+        total = sum(counts)
+        print(f"{threads:>8} {total / seconds:>12.0f} {total / max(1, wal.flushCount):>16.1f}")
+    finally:
+        shutil.rmtree(directory)
+
+def benchRecovery(records: int) -> None:
+    directory = tempfile.mkdtemp(prefix="streamly-wal-")
+    try:
+        # Build the log without fsync; only replay speed is measured here
+        wal, users, payments, _ = openStores(directory, fsync=False, snapshotEvery=records * 10)
+        for _ in range(records):
+            payments.add(Payment(id=payments.allocateId(), ccNumber="1234567890123456", amount=150, date="2024-01-01T10:00:00"))
+        wal.close()
+
+        wal, users, payments, elapsed = openStores(directory, snapshotEvery=records * 10)
+        print(f"log replay:      {len(payments)} records in {elapsed:.2f}s")
+
+        start = time.perf_counter()
+        wal.snapshot(wal._segment)
+        print(f"snapshot write:  {time.perf_counter() - start:.2f}s")
+        wal.close()
+
+        wal, users, payments, elapsed = openStores(directory, snapshotEvery=records * 10)
+        print(f"snapshot replay: {len(payments)} records in {elapsed:.2f}s")
+        wal.close()
+    finally:
+        shutil.rmtree(directory)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--records", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    print(f"{'threads':>8} {'writes/sec':>12} {'records/fsync':>16}")
+    for threads in args.threads:
+        benchWrites(threads, args.seconds)
+    print()
+    benchRecovery(args.records)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""Scaling test: request throughput with 1 to 8 uvicorn workers sharing one storage server.
+
+Run from the repository root:
+
+    python benchmarks/bench_workers.py [--workers 1 2 4 8] [--connections 256] [--duration 10]
+
+For each worker count, starts the storage server (python -m app.storage.server,
+memory engine) and uvicorn --workers N with STREAMLY_STORAGE=server, seeds it
+through the bulk endpoints and runs the bench_async_load scenarios (reads,
+creates, logins) from --clients load-generator processes sharing --connections
+keep-alive connections. A "local" row serves the memory engine from a single
+worker without the storage server, to show the cost of the socket hop. After
+every run the payment ids are checked to be unique across the workers.
+Throughput can only scale with the cores left over by the load generators and
+the storage server, so read the speedup column against the machine's core count.
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import quote
+
+from bench_async_load import REPO, collect, freePort, scenario, seed, summarize
+
+
+def waitFor(port: int, process: subprocess.Popen) -> None:
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("server exited during startup")
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/")
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("server did not start")
+
+def startDeployment(workers: int, port: int, args) -> list:
+    """Start the storage server and uvicorn with the given number of workers (0: one worker, no storage server)"""
+    directory = tempfile.mkdtemp(prefix="streamly-")
+    env = {**os.environ, "STREAMLY_PASSWORD_COST": str(args.password_cost), "STREAMLY_STORAGE": "memory",
+           "STREAMLY_STORAGE_SOCKET": os.path.join(directory, "storage.sock"),
+           # The hashing pools' semaphores are reported as leaked when their processes are killed
+           "PYTHONWARNINGS": "ignore::UserWarning:multiprocessing.resource_tracker"}
+    env.pop("STREAMLY_DATA_DIR", None)
+    env.pop("STREAMLY_STORAGE_AUTHKEY", None)
+    processes = []
+    if workers:
+        processes.append(subprocess.Popen([sys.executable, "-m", "app.storage.server"], cwd=REPO, env=env,
+                                          stdout=subprocess.DEVNULL, start_new_session=True))
+        env = {**env, "STREAMLY_STORAGE": "server"}
+    processes.append(subprocess.Popen([sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port),
+                                       "--workers", str(max(workers, 1)), "--log-level", "warning",
+                                       "--backlog", "4096"], cwd=REPO, env=env, start_new_session=True))
+    try:
+        waitFor(port, processes[-1])
+        # uvicorn answers as soon as one worker is up; give the others time to import the app
+        time.sleep(1 + 0.5 * workers)
+    except Exception:
+        stopDeployment(processes)
+        raise
+    processes[-1].directory = directory
+    return processes
+
+def stopDeployment(processes: list) -> None:
+    # uvicorn first, so its workers close their storage connections before the server goes away. Each
+    # deployment has its own process group, which also takes down the password hashing pools' processes.
+    for process in reversed(processes):
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait()
+        time.sleep(0.5)
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+    shutil.rmtree(getattr(processes[-1], "directory", ""), ignore_errors=True)
+
+def loadClient(port: int, connections: int, duration: float, name: str, users: int, payments: int, first: int):
+    """One load-generator process; returns its latencies, failures and elapsed time"""
+    return asyncio.run(collect(port, connections, duration, scenario(name, users, payments), first))
+
+def paymentIdsUnique(port: int) -> bool:
+    ids, cursor = [], None
+    while True:
+        url = f"http://127.0.0.1:{port}/payments/getAll?limit=1000" + (f"&cursor={quote(cursor)}" if cursor else "")
+        body = json.loads(urllib.request.urlopen(url, timeout=60).read())
+        ids.extend(p["id"] for p in body["payments"])
+        cursor = body.get("nextCursor")
+        if not cursor:
+            return len(ids) == len(set(ids)) == ids[-1]
+
+def run(workers: int, args, baseline: dict) -> None:
+    port = freePort()
+    processes = startDeployment(workers, port, args)
+    try:
+        seed(port, args.users, args.payments)
+        share = [args.connections // args.clients + (n < args.connections % args.clients) for n in range(args.clients)]
+        with ProcessPoolExecutor(args.clients) as pool:
+            for name in args.scenarios:
+                runs = [pool.submit(loadClient, port, connections, args.duration, name, args.users, args.payments,
+                                    n << 40) for n, connections in enumerate(share)]
+                results = [r.result() for r in runs]
+                result = summarize([latency for r in results for latency in r[0]], sum(r[1] for r in results),
+                                   max(r[2] for r in results))
+                if workers == 1:
+                    baseline[name] = result["rps"]
+                speedup = f"{result['rps'] / baseline[name]:.2f}x" if workers and name in baseline else "-"
+                label = str(workers) if workers else "local"
+                print(f"{label:<8} {name:<8} {result['rps']:>10.0f} {speedup:>8} {result['p50']:>9.1f}"
+                      f" {result['p99']:>9.1f} {result['failures']:>9}", flush=True)
+        if not paymentIdsUnique(port):
+            print(f"{workers} workers: payment ids are not unique", flush=True)
+    finally:
+        stopDeployment(processes)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--no-local", action="store_true", help="skip the single-process run without the server")
+    parser.add_argument("--connections", type=int, default=256)
+    parser.add_argument("--clients", type=int, default=min(4, os.cpu_count() or 1),
+                        help="load-generator processes the connections are spread over")
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--payments", type=int, default=100_000)
+    parser.add_argument("--scenarios", nargs="+", choices=["reads", "creates", "logins"],
+                        default=["reads", "creates", "logins"])
+    parser.add_argument("--password-cost", type=int, default=10, help="scrypt log2 N for the seeded users")
+    args = parser.parse_args()
+
+    print(f"{os.cpu_count()} CPUs, {args.connections} connections from {args.clients} processes,"
+          f" {args.duration:g}s per scenario")
+    print(f"{'workers':<8} {'scenario':<8} {'req/s':>10} {'speedup':>8} {'p50 ms':>9} {'p99 ms':>9} {'failures':>9}")
+    baseline = {}
+    for workers in ([] if args.no_local else [0]) + sorted(args.workers):
+        run(workers, args, baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,4 @@
+import os
+
+# Keep password hashing cheap in tests; the defaults are tuned for production
+os.environ.setdefault("STREAMLY_PASSWORD_COST", "10")
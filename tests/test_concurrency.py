@@ -0,0 +1,113 @@
+import asyncio
+import sys
+import os
+import threading
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.storage import paymentsDB, usersDB
+from app.models import Payment, User
+from app.routes.users import create_user, delete_user
+from app.routes.payments import createPayment, delete_payment
+
+THREADS = 16
+
+
+@pytest.fixture(autouse=True)
+def clear_database():
+    """Clear the database and switch threads as often as possible to expose races"""
+    usersDB.clear()
+    paymentsDB.clear()
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    yield
+    sys.setswitchinterval(interval)
+
+def hammer(worker):
+    """Run worker(n) on THREADS threads started at the same moment; handlers are awaited on a loop per call"""
+    barrier = threading.Barrier(THREADS)
+    errors = []
+
+    def run(n):
+        barrier.wait()
+        try:
+            worker(n)
+        except BaseException as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run, args=(n,)) for n in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+
+def signup(username, ccNumber=None):
+    return User(
+        username=username,
+        password="MyPassword123",
+        email=f"{username}@example.com",
+        birthdate="1990-01-01",
+        ccNumber=ccNumber
+    )
+
+class TestConcurrentUsers:
+    def test_duplicate_signups_create_one_user(self):
+        """Test that racing signups for the same usernames succeed exactly once each"""
+        statuses = []
+
+        def worker(n):
+            for i in range(20):
+                statuses.append(asyncio.run(create_user(signup(f"racer{i}"))).status_code)
+
+        hammer(worker)
+        assert statuses.count(201) == 20
+        assert statuses.count(409) == 20 * (THREADS - 1)
+        assert len(usersDB) == 20
+
+    def test_create_delete_churn_keeps_indexes_consistent(self):
+        """Test that interleaved creates and deletes leave every index in agreement"""
+        def worker(n):
+            for i in range(30):
+                username = f"churn{(n + i) % 10}"
+                asyncio.run(create_user(signup(username, "1234567890123456" if i % 2 else None)))
+                asyncio.run(delete_user(f"churn{(n * 7 + i) % 10}"))
+
+        hammer(worker)
+        users = list(usersDB)
+        assert len(users) == len(usersDB)
+        assert len({u.username for u in users}) == len(users)
+        withCard, withoutCard = usersDB.countByCard()
+        assert withCard + withoutCard == len(users)
+        assert usersDB.hasCard("1234567890123456") == any(u.ccNumber for u in users)
+        assert sorted(u.username for u in usersDB.getByCard("1234567890123456")) == \
+            sorted(u.username for u in users if u.ccNumber)
+
+class TestConcurrentPayments:
+    def test_concurrent_creates_get_unique_ids(self):
+        """Test that payment ids stay unique under concurrent creates"""
+        usersDB.add(signup("payer", "1234567890123456"))
+
+        def worker(n):
+            for _ in range(25):
+                assert asyncio.run(createPayment(Payment(ccNumber="1234567890123456", amount=150))).status_code == 201
+
+        hammer(worker)
+        ids = [payment.id for payment in paymentsDB]
+        assert len(ids) == 25 * THREADS
+        assert ids == list(range(1, 25 * THREADS + 1))
+
+    def test_concurrent_deletes_remove_once(self):
+        """Test that racing deletes of the same payment succeed exactly once"""
+        paymentsDB.extend([Payment(id=i, ccNumber="1234567890123456", amount=150) for i in range(1, 51)])
+        statuses = []
+
+        def worker(n):
+            for i in range(1, 51):
+                statuses.append(asyncio.run(delete_payment(i)).status_code)
+
+        hammer(worker)
+        assert statuses.count(200) == 50
+        assert len(paymentsDB) == 0
+        assert list(paymentsDB) == []
@@ -0,0 +1,163 @@
+import asyncio
+import sys
+import os
+import pytest
+from fastapi.testclient import TestClient
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.main import app
+from app.idempotency import IdempotencyCache, paymentReplays
+from app.storage.base import CLAIM_SECONDS
+from app.responses import JSONResponse
+from app.storage import paymentsDB, usersDB
+from app.models import User
+
+client = TestClient(app)
+
+CARD = "1234567890123456"
+
+@pytest.fixture(autouse=True)
+def clear_database():
+    """Clear the database and the replay cache before each test"""
+    paymentsDB.clear()
+    usersDB.clear()
+    paymentReplays.clear()
+    yield
+
+def registerCard():
+    usersDB.append(User(username="testuser", password="hashedpass123", email="test@example.com",
+                        birthdate="1990-01-01", ccNumber=CARD))
+
+class TestIdempotentCreatePayment:
+    def test_retry_replays_first_response(self):
+        """Test that a retry with the same key gets the first response and stores nothing new"""
+        registerCard()
+        headers = {"Idempotency-Key": "order-42"}
+        first = client.post("/payments/create", json={"ccNumber": CARD, "amount": 150}, headers=headers)
+        retry = client.post("/payments/create", json={"ccNumber": CARD, "amount": 150}, headers=headers)
+        assert first.status_code == retry.status_code == 201
+        assert retry.content == first.content
+        assert retry.headers["Idempotent-Replayed"] == "true"
+        assert "Idempotent-Replayed" not in first.headers
+        assert len(paymentsDB) == 1
+
+    def test_distinct_keys_and_no_key_create_separately(self):
+        """Test that only requests sharing a key are merged"""
+        registerCard()
+        client.post("/payments/create", json={"ccNumber": CARD, "amount": 150}, headers={"Idempotency-Key": "a"})
+        client.post("/payments/create", json={"ccNumber": CARD, "amount": 150}, headers={"Idempotency-Key": "b"})
+        client.post("/payments/create", json={"ccNumber": CARD, "amount": 150})
+        client.post("/payments/create", json={"ccNumber": CARD, "amount": 150})
+        assert len(paymentsDB) == 4
+
+    def test_key_reused_for_different_payment(self):
+        """Test that a key sent again with another payload is refused"""
+        registerCard()
+        client.post("/payments/create", json={"ccNumber": CARD, "amount": 150}, headers={"Idempotency-Key": "k"})
+        response = client.post("/payments/create", json={"ccNumber": CARD, "amount": 250}, headers={"Idempotency-Key": "k"})
+        assert response.status_code == 422
+        assert len(paymentsDB) == 1
+
+    def test_failures_are_not_replayed(self):
+        """Test that a rejected payment is retried for real once the problem is fixed"""
+        headers = {"Idempotency-Key": "k"}
+        assert client.post("/payments/create", json={"ccNumber": CARD, "amount": 150}, headers=headers).status_code == 404
+        registerCard()
+        assert client.post("/payments/create", json={"ccNumber": CARD, "amount": 150}, headers=headers).status_code == 201
+        assert len(paymentsDB) == 1
+
+    def test_invalid_key(self):
+        """Test that empty and overlong keys are rejected"""
+        registerCard()
+        for key in ("", "k" * 256):
+            response = client.post("/payments/create", json={"ccNumber": CARD, "amount": 150},
+                                   headers={"Idempotency-Key": key})
+            assert response.status_code == 400
+        assert len(paymentsDB) == 0
+
+    def test_stats(self):
+        """Test that the replay cache's size and hit rate are reported"""
+        registerCard()
+        before = client.get("/stats/cache").json()["idempotency"]
+        for _ in range(4):
+            client.post("/payments/create", json={"ccNumber": CARD, "amount": 150}, headers={"Idempotency-Key": "k"})
+        after = client.get("/stats/cache").json()["idempotency"]
+        assert after["entries"] == 1 and after["bytes"] > 0
+        assert (after["hits"] - before["hits"], after["misses"] - before["misses"]) == (3, 1)
+        assert after["hitRate"] == round((after["hits"] + after["waits"]) /
+                                         (after["hits"] + after["waits"] + after["misses"]), 4)
+
+class TestIdempotencyCache:
+    def test_concurrent_retries_run_once(self):
+        """Test that retries arriving while the first request runs wait for it instead of running again"""
+        cache = IdempotencyCache(ttl=60, maxBytes=1 << 20)
+        executions = 0
+
+        async def execute():
+            nonlocal executions
+            executions += 1
+            await asyncio.sleep(0.01)
+            return JSONResponse(status_code=201, content={"id": executions})
+
+        async def run():
+            return await asyncio.gather(*(cache.run("k", ("card", 150), execute) for _ in range(10)))
+
+        responses = asyncio.run(run())
+        assert executions == 1
+        assert {response.body for response in responses} == {b'{"id":1}'}
+        assert cache.stats()["waits"] == 9
+
+    def test_waiters_take_over_after_an_error(self):
+        """Test that when the running request raises, a waiting retry runs in its place"""
+        cache = IdempotencyCache(ttl=60, maxBytes=1 << 20)
+        calls = []
+
+        async def execute():
+            calls.append(len(calls))
+            await asyncio.sleep(0.01)
+            if len(calls) == 1:
+                raise RuntimeError("lost the connection")
+            return JSONResponse(status_code=201, content={})
+
+        async def run():
+            return await asyncio.gather(*(cache.run("k", 1, execute) for _ in range(3)), return_exceptions=True)
+
+        results = asyncio.run(run())
+        assert len(calls) == 2
+        assert sum(isinstance(result, RuntimeError) for result in results) == 1
+        assert len(cache) == 1
+
+    def test_expiry_and_size_bound(self):
+        """Test that entries expire after the TTL and the oldest are evicted past the byte budget"""
+        now = [0.0]
+        cache = IdempotencyCache(ttl=10, maxBytes=1000, clock=lambda: now[0])
+
+        async def execute():
+            return JSONResponse(status_code=201, content={"pad": "x" * 100})
+
+        async def put(key):
+            await cache.run(key, 1, execute)
+
+        for n in range(10):
+            asyncio.run(put(f"key{n}"))
+        stats = cache.stats()
+        assert stats["bytes"] <= 1000 and stats["evictions"] == 10 - len(cache)
+
+        now[0] = 11
+        assert cache.stats()["entries"] == 0
+        assert cache.stats()["expirations"] > 0
+
+    def test_dead_claim_is_given_up(self):
+        """Test that a claim held past CLAIM_SECONDS frees the key, and its late finish keeps nothing"""
+        now = [0.0]
+        cache = IdempotencyCache(ttl=60, maxBytes=1 << 20, clock=lambda: now[0])
+        _, staleId = cache.claim("k", 1)
+        assert cache.claim("k", 1) == ("wait", None)
+
+        now[0] = CLAIM_SECONDS
+        outcome, claimId = cache.claim("k", 1)
+        assert outcome == "run" and claimId != staleId
+        cache.finish("k", staleId, (201, b"stale"))
+        cache.finish("k", claimId, (201, b"fresh"))
+        assert cache.claim("k", 1) == ("replay", (201, b"fresh"))
@@ -0,0 +1,115 @@
+import asyncio
+import sys
+import os
+import re
+import pytest
+from fastapi.testclient import TestClient
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import config
+from app.main import app
+from app.metrics import Counter, Histogram, Registry, requestSeconds, requests, stepSeconds
+from app.storage import paymentsDB, usersDB
+from app.models import User
+
+client = TestClient(app)
+
+CARD = "1234567890123456"
+
+# The middleware is only added when app.main is imported with metrics on
+metricsOn = pytest.mark.skipif(not config.METRICS, reason="metrics disabled by STREAMLY_METRICS=0")
+
+@pytest.fixture(autouse=True)
+def clear_database():
+    """Clear the database before each test"""
+    paymentsDB.clear()
+    usersDB.clear()
+    yield
+
+def scrape() -> dict:
+    """Parse /metrics into {'name{labels}': value}"""
+    response = client.get("/metrics")
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    return {line.rsplit(" ", 1)[0]: float(line.rsplit(" ", 1)[1])
+            for line in response.text.splitlines() if line and not line.startswith("#")}
+
+class TestRequestMetrics:
+    @metricsOn
+    def test_counts_by_route_template_and_status(self):
+        """Test that requests are counted under their route template, method and status code"""
+        before = requests.value("GET", "/users/getByUsername/{username}", 404)
+        client.get("/users/getByUsername/alice")
+        client.get("/users/getByUsername/bob")
+        assert requests.value("GET", "/users/getByUsername/{username}", 404) == before + 2
+
+        unmatched = requests.value("GET", "unmatched", 404)
+        client.get("/no/such/path")
+        assert requests.value("GET", "unmatched", 404) == unmatched + 1
+
+    @metricsOn
+    def test_latency_histogram(self):
+        """Test that each request adds one observation whose buckets are cumulative up to +Inf"""
+        before = requestSeconds.count("GET", "/payments/getAll", 200)
+        client.get("/payments/getAll")
+        assert requestSeconds.count("GET", "/payments/getAll", 200) == before + 1
+
+        samples = scrape()
+        labels = 'method="GET",route="/payments/getAll",status="200"'
+        buckets = [value for key, value in samples.items()
+                   if key.startswith("streamly_http_request_duration_seconds_bucket{" + labels)]
+        assert buckets == sorted(buckets)
+        assert buckets[-1] == samples["streamly_http_request_duration_seconds_count{" + labels + "}"]
+
+    @metricsOn
+    def test_step_timers_and_store_gauges(self):
+        """Test that the hot steps are timed and the store sizes reported"""
+        usersDB.append(User(username="testuser", password="hashedpass123", email="test@example.com",
+                            birthdate="1990-01-01", ccNumber=CARD))
+        steps = {step: stepSeconds.count(step) for step in ("createPayment.card_lookup", "get_payments.serialize")}
+        client.post("/payments/create", json={"ccNumber": CARD, "amount": 150})
+        client.get("/payments/getAll?limit=10")
+        for step, count in steps.items():
+            assert stepSeconds.count(step) == count + 1
+
+        samples = scrape()
+        assert samples['streamly_store_records{store="users"}'] == 1
+        assert samples['streamly_store_records{store="payments"}'] == 1
+        # The scrape itself is in flight while it renders
+        assert samples["streamly_http_requests_in_flight"] == 1
+
+    def test_store_reads_leave_the_loop(self, monkeypatch):
+        """Test that /metrics and /stats/cache read the stores in a worker thread, since they can block"""
+        onLoop = []
+
+        def recordLen(store):
+            try:
+                asyncio.get_running_loop()
+                onLoop.append(True)
+            except RuntimeError:
+                onLoop.append(False)
+            return 0
+
+        monkeypatch.setattr(type(usersDB), "__len__", recordLen)
+        monkeypatch.setattr(type(usersDB), "cacheStats", recordLen)
+        scrape()
+        client.get("/stats/cache")
+        assert onLoop == [False, False]
+
+class TestExposition:
+    def test_text_format(self):
+        """Test the HELP/TYPE lines, label escaping and histogram series of the text format"""
+        registry = Registry()
+        counter = registry.register(Counter("demo_total", "A demo counter", ("path",)))
+        histogram = registry.register(Histogram("demo_seconds", "A demo histogram", buckets=(0.1, 1.0)))
+        counter.inc('a "quoted"\\path')
+        histogram.observe(0.05)
+        histogram.observe(0.5)
+        histogram.observe(5)
+        text = registry.render().decode()
+        assert "# TYPE demo_total counter" in text
+        assert 'demo_total{path="a \\"quoted\\"\\\\path"} 1' in text
+        assert re.search(r'demo_seconds_bucket\{le="0\.1"\} 1\n', text)
+        assert re.search(r'demo_seconds_bucket\{le="1\.0"\} 2\n', text)
+        assert re.search(r'demo_seconds_bucket\{le="\+Inf"\} 3\n', text)
+        assert "demo_seconds_sum 5.55" in text and "demo_seconds_count 3" in text
@@ -0,0 +1,70 @@
+import asyncio
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.passwords import PasswordHasher
+
+
+class TestPasswordHasher:
+    def test_hash_and_verify(self):
+        """Test that hashes carry their parameters and verify only the right password"""
+        hasher = PasswordHasher("scrypt", cost=10, workers=0)
+        stored = hasher.hash("MyPassword123")
+        assert stored.startswith("scrypt$ln=10,r=8,p=1$")
+        assert hasher.verify("MyPassword123", stored)
+        assert not hasher.verify("MyPassword124", stored)
+
+    def test_verify_after_parameter_change(self):
+        """Test that old hashes still verify after the cost changes, and are flagged for rehash"""
+        old = PasswordHasher("scrypt", cost=10, workers=0)
+        new = PasswordHasher("pbkdf2_sha256", cost=1000, workers=0)
+        stored = old.hash("MyPassword123")
+        assert new.verify("MyPassword123", stored)
+        assert new.needsRehash(stored)
+        assert not new.needsRehash(new.hash("MyPassword123"))
+
+    def test_process_pool(self):
+        """Test hashing on worker processes"""
+        hasher = PasswordHasher("pbkdf2_sha256", cost=1000, workers=2)
+        try:
+            futures = [hasher.submit(f"Password{i}") for i in range(8)]
+            hashes = [future.result() for future in futures]
+            assert all(hasher.verify(f"Password{i}", stored) for i, stored in enumerate(hashes))
+        finally:
+            hasher.close()
+
+    def test_hash_many_in_chunks(self):
+        """Test that batch hashing keeps input order and salts every password separately"""
+        hasher = PasswordHasher("pbkdf2_sha256", cost=1000, workers=2)
+        try:
+            hashes = hasher.hashMany(["MyPassword123"] * 3 + [f"Password{i}" for i in range(20)])
+            assert len(hashes) == 23 and len(set(hashes)) == 23
+            assert all(hasher.verify(f"Password{i}", stored) for i, stored in enumerate(hashes[3:]))
+            assert hasher.hashMany([]) == []
+        finally:
+            hasher.close()
+
+    def test_malformed_hash_does_not_verify(self):
+        """Test that garbage in the password column never verifies"""
+        hasher = PasswordHasher("scrypt", cost=10, workers=0)
+        assert not hasher.verify("MyPassword123", "not-a-hash")
+        assert not hasher.verify("MyPassword123", "bcrypt$x=1$abc$def")
+
+    def test_async_hash_and_verify(self):
+        """Test that the async forms agree with the blocking ones, on the pool and in a thread"""
+        for workers in (0, 2):
+            hasher = PasswordHasher("pbkdf2_sha256", cost=1000, workers=workers)
+            try:
+                async def run():
+                    # More jobs than queue slots, so some wait for a slot without blocking the loop
+                    return await asyncio.gather(*(hasher.hashAsync(f"Password{i}") for i in range(12)))
+
+                hashes = asyncio.run(run())
+                assert all(hasher.verify(f"Password{i}", stored) for i, stored in enumerate(hashes))
+                assert asyncio.run(hasher.verifyAsync("Password3", hashes[3]))
+                assert not asyncio.run(hasher.verifyAsync("Password3", hashes[4]))
+                assert not asyncio.run(hasher.verifyAsync("Password3", "not-a-hash"))
+            finally:
+                hasher.close()
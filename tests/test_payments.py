@@ -1,5 +1,6 @@
 import sys
 import os
+import json
 import pytest
 from fastapi.testclient import TestClient
 
@@ -175,6 +176,27 @@ class TestCreatePayment:
         assert paymentsDB[0].id == 1
         assert paymentsDB[1].id == 2
 
+    def test_create_payment_id_not_reused_after_delete(self):
+        """Test that deleting the newest payment does not free its ID"""
+        usersDB.append(User(
+            username="testuser",
+            password="hashedpass123",
+            email="test@example.com",
+            birthdate="1990-01-01",
+            ccNumber="1234567890123456"
+        ))
+        payment_data = {
+            "ccNumber": "1234567890123456",
+            "amount": 100
+        }
+        assert client.post("/payments/create", json=payment_data).json()["payment"]["id"] == 1
+        assert client.post("/payments/create", json=payment_data).json()["payment"]["id"] == 2
+        assert client.delete("/payments/delete/2").status_code == 200
+
+        response = client.post("/payments/create", json=payment_data)
+        assert response.status_code == 201
+        assert response.json()["payment"]["id"] == 3
+
 class TestDeletePayment:
     def test_delete_payment_exists(self):
         """Test deleting a payment that exists"""
@@ -191,3 +213,213 @@ class TestDeletePayment:
         response = client.delete("/payments/delete/999")
         assert response.status_code == 404
         assert response.json()["message"] == "Payment not found"
+
+class TestCardRegistration:
+    def test_card_registered_through_create_user(self):
+        """Test that a card added via user signup can be charged immediately"""
+        user_data = {
+            "username": "carduser",
+            "password": "MyPassword123",
+            "email": "carduser@example.com",
+            "birthdate": "1990-01-01",
+            "ccNumber": "1234567890123456"
+        }
+        assert client.post("/users/users/create", json=user_data).status_code == 201
+
+        response = client.post("/payments/create", json={"ccNumber": "1234567890123456", "amount": 150})
+        assert response.status_code == 201
+
+    def test_card_unregistered_after_delete_user(self):
+        """Test that deleting the card owner stops further payments on that card"""
+        user_data = {
+            "username": "carduser",
+            "password": "MyPassword123",
+            "email": "carduser@example.com",
+            "birthdate": "1990-01-01",
+            "ccNumber": "1234567890123456"
+        }
+        assert client.post("/users/users/create", json=user_data).status_code == 201
+        assert client.delete("/users/delete/carduser").status_code == 200
+
+        response = client.post("/payments/create", json={"ccNumber": "1234567890123456", "amount": 150})
+        assert response.status_code == 404
+        assert response.json()["message"] == "Card number is not registered to any user"
+
+class TestGetPaymentsPagination:
+    def test_pages_follow_payment_id(self):
+        """Test paging through payments by id"""
+        paymentsDB.extend([Payment(id=i, ccNumber="1234567890123456", amount=100 + i) for i in range(1, 6)])
+        first = client.get("/payments/getAll?limit=3").json()
+        assert [p["id"] for p in first["payments"]] == [1, 2, 3]
+
+        client.delete("/payments/delete/4")
+        second = client.get(f"/payments/getAll?limit=3&cursor={first['nextCursor']}").json()
+        assert [p["id"] for p in second["payments"]] == [5]
+        assert second["nextCursor"] is None
+
+    def test_user_cursor_rejected(self):
+        """Test that a cursor from the users listing is not accepted for payments"""
+        usersDB.append(User(username="a", password="hashedpass123", email="a@example.com", birthdate="1990-01-01"))
+        usersDB.append(User(username="b", password="hashedpass123", email="b@example.com", birthdate="1990-01-01"))
+        cursor = client.get("/users/getAll?limit=1").json()["nextCursor"]
+        response = client.get(f"/payments/getAll?limit=1&cursor={cursor}")
+        assert response.status_code == 400
+
+class TestFilterPayments:
+    def addPayments(self):
+        paymentsDB.extend([Payment(id=i, ccNumber=f"{1111222233334444 + i % 2}", amount=100 * i,
+                                   date=f"2024-01-0{i}T12:00:00") for i in range(1, 8)])
+
+    def test_filters_combine(self):
+        """Test card, date range and amount filters on the full listing"""
+        self.addPayments()
+        response = client.get("/payments/getAll", params={"ccNumber": "1111222233334445", "from": "2024-01-02",
+                                                          "to": "2024-01-07", "maxAmount": 500})
+        assert response.status_code == 200
+        assert [p["id"] for p in response.json()["payments"]] == [3, 5]
+        response = client.get("/payments/getAll", params={"minAmount": 600})
+        assert [p["id"] for p in response.json()["payments"]] == [6, 7]
+
+    def test_filtered_pages_and_export(self):
+        """Test that cursor pages and the export apply the same filter"""
+        self.addPayments()
+        params = {"ccNumber": "1111222233334444", "limit": 2}
+        first = client.get("/payments/getAll", params=params).json()
+        assert [p["id"] for p in first["payments"]] == [2, 4]
+        second = client.get("/payments/getAll", params={**params, "cursor": first["nextCursor"]}).json()
+        assert [p["id"] for p in second["payments"]] == [6]
+        assert second["nextCursor"] is None
+        response = client.get("/payments/export", params={"from": "2024-01-06T12:00:00"})
+        assert [json.loads(line)["id"] for line in response.text.splitlines()] == [6, 7]
+
+    def test_invalid_date_bound(self):
+        """Test that an unparseable date bound is rejected"""
+        assert client.get("/payments/getAll", params={"from": "yesterday"}).status_code == 400
+        assert client.get("/payments/export", params={"to": "2024-01-01T00:00:00Z"}).status_code == 400
+
+class TestExportPayments:
+    def test_export_ndjson(self):
+        """Test that export streams every payment as one JSON line"""
+        paymentsDB.extend([Payment(id=i, ccNumber="1234567890123456", amount=100 + i) for i in range(1, 4)])
+        response = client.get("/payments/export")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        assert [json.loads(line)["id"] for line in response.text.splitlines()] == [1, 2, 3]
+
+class TestBulkCreatePayments:
+    def test_bulk_create_streams_results(self):
+        """Test that a batch gets one consecutive id block, one date and a result line per row"""
+        usersDB.append(User(username="payer", password="hashedpass123", email="payer@example.com",
+                            birthdate="1990-01-01", ccNumber="1234567890123456"))
+        paymentsDB.append(Payment(id=7, ccNumber="1234567890123456", amount=150))
+        rows = [
+            {"ccNumber": "1234567890123456", "amount": 150},
+            {"ccNumber": "12345", "amount": 150},
+            {"ccNumber": "9999999999999999", "amount": 150},
+            {"ccNumber": "1234567890123456", "amount": 50},
+            {"ccNumber": "1234567890123456"},
+            {"ccNumber": "1234567890123456", "amount": 999},
+        ]
+        response = client.post("/payments/bulkCreate", json=rows)
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        assert response.headers["x-created-count"] == "2"
+        assert response.headers["x-failed-count"] == "4"
+        results = [json.loads(line) for line in response.text.splitlines()]
+        assert [(r["index"], r["status"]) for r in results] == [(0, 201), (1, 400), (2, 404), (3, 400), (4, 400), (5, 201)]
+        assert [results[0]["id"], results[5]["id"]] == [8, 9]
+        assert results[2]["message"] == "Card number is not registered to any user"
+        assert paymentsDB.get(8).date == paymentsDB.get(9).date is not None
+        assert len(paymentsDB) == 3
+
+    def test_bulk_create_ndjson(self):
+        """Test that an NDJSON body is accepted and later single creates continue after the block"""
+        usersDB.append(User(username="payer", password="hashedpass123", email="payer@example.com",
+                            birthdate="1990-01-01", ccNumber="1234567890123456"))
+        body = "\n".join(json.dumps({"ccNumber": "1234567890123456", "amount": 100 + i}) for i in range(5))
+        response = client.post("/payments/bulkCreate", content=body, headers={"Content-Type": "application/x-ndjson"})
+        assert [json.loads(line)["id"] for line in response.text.splitlines()] == [1, 2, 3, 4, 5]
+        response = client.post("/payments/create", json={"ccNumber": "1234567890123456", "amount": 150})
+        assert response.json()["payment"]["id"] == 6
+
+    def test_bulk_create_malformed_body(self):
+        """Test that a body that is not an array or NDJSON is rejected"""
+        response = client.post("/payments/bulkCreate", json={"ccNumber": "1234567890123456", "amount": 150})
+        assert response.status_code == 400
+
+class TestAggregatePayments:
+    def addPayments(self):
+        usersDB.extend([
+            User(username="alice", password="x", email="alice@example.com", birthdate="1990-01-01", ccNumber="1111222233334444"),
+            User(username="bob", password="x", email="bob@example.com", birthdate="1990-01-01", ccNumber="1111222233334444"),
+        ])
+        paymentsDB.extend([
+            Payment(id=1, ccNumber="1111222233334444", amount=100, date="2024-01-01T10:00:00"),
+            Payment(id=2, ccNumber="5555666677778888", amount=300, date="2024-01-01T23:59:59.999999"),
+            Payment(id=3, ccNumber="1111222233334444", amount=200, date="2024-01-02T00:00:00"),
+            Payment(id=4, ccNumber="5555666677778888", amount=999, date=None),
+        ])
+
+    def test_group_by_card_and_day(self):
+        """Test count, total and average per card and per day, with undated payments last"""
+        self.addPayments()
+        response = client.get("/payments/aggregate", params={"groupBy": "card"})
+        assert response.status_code == 200
+        assert response.json() == {"groupBy": "card", "groups": [
+            {"key": "1111222233334444", "count": 2, "total": 300, "average": 150.0},
+            {"key": "5555666677778888", "count": 2, "total": 1299, "average": 649.5},
+        ]}
+        groups = client.get("/payments/aggregate", params={"groupBy": "day"}).json()["groups"]
+        assert [(g["key"], g["count"], g["total"]) for g in groups] == [
+            ("2024-01-01", 2, 400), ("2024-01-02", 1, 200), (None, 1, 999)]
+
+    def test_group_by_user_within_range(self):
+        """Test that a shared card counts for each owner and the range bounds are [from, to)"""
+        self.addPayments()
+        paymentsDB.remove(1)
+        response = client.get("/payments/aggregate",
+                              params={"groupBy": "user", "from": "2024-01-01", "to": "2024-01-02T00:00:00.000001"})
+        assert [(g["key"], g["count"], g["total"]) for g in response.json()["groups"]] == [
+            ("alice", 1, 200), ("bob", 1, 200), (None, 1, 300)]
+
+    def test_invalid_parameters(self):
+        """Test that an unknown grouping or an unparseable bound is rejected"""
+        assert client.get("/payments/aggregate", params={"groupBy": "amount"}).status_code == 400
+        response = client.get("/payments/aggregate", params={"from": "yesterday"})
+        assert response.status_code == 400
+        assert client.get("/payments/aggregate", params={"to": "2024-01-01T00:00:00+02:00"}).status_code == 400
+
+class TestPaymentSummaries:
+    def test_summary_follows_creates_and_deletes(self):
+        """Test that a user's running spend tracks new payments and recomputes extremes after deletes"""
+        usersDB.append(User(username="alice", password="x", email="alice@example.com", birthdate="1990-01-01",
+                            ccNumber="1234567890123456"))
+        ids = [client.post("/payments/create", json={"ccNumber": "1234567890123456", "amount": amount}).json()["payment"]["id"]
+               for amount in (300, 100, 999)]
+        summary = client.get("/payments/summaryByUser/alice").json()
+        assert (summary["count"], summary["total"], summary["minAmount"], summary["maxAmount"]) == (3, 1399, 100, 999)
+        assert summary["lastPaymentDate"] == paymentsDB.get(ids[-1]).date
+
+        assert client.delete(f"/payments/delete/{ids[2]}").status_code == 200
+        summary = client.get("/payments/summaryByCard/1234567890123456").json()
+        assert summary == {"ccNumber": "1234567890123456", "count": 2, "total": 400, "average": 200.0,
+                           "minAmount": 100, "maxAmount": 300, "lastPaymentDate": paymentsDB.get(ids[1]).date}
+
+        for paymentId in ids[:2]:
+            client.delete(f"/payments/delete/{paymentId}")
+        summary = client.get("/payments/summaryByUser/alice").json()
+        assert (summary["count"], summary["total"], summary["average"], summary["maxAmount"]) == (0, 0, None, None)
+
+    def test_replaced_payment_counted_once(self):
+        """Test that re-adding a payment id replaces its contribution instead of adding to it"""
+        paymentsDB.add(Payment(id=1, ccNumber="1234567890123456", amount=500, date="2024-01-01T10:00:00"))
+        paymentsDB.add(Payment(id=1, ccNumber="1234567890123456", amount=200, date="2024-01-01T10:00:00"))
+        summary = client.get("/payments/summaryByCard/1234567890123456").json()
+        assert (summary["count"], summary["total"], summary["maxAmount"]) == (1, 200, 200)
+
+    def test_user_without_card_or_unknown(self):
+        """Test the summary of a user with no card, and of a missing user"""
+        usersDB.append(User(username="bob", password="x", email="bob@example.com", birthdate="1990-01-01"))
+        summary = client.get("/payments/summaryByUser/bob").json()
+        assert (summary["ccNumber"], summary["count"], summary["lastPaymentDate"]) == (None, 0, None)
+        assert client.get("/payments/summaryByUser/nobody").status_code == 404
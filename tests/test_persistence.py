@@ -0,0 +1,126 @@
+import sys
+import os
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.persistence import WriteAheadLog
+from app.storage import PaymentStore, UserStore
+from app.models import Payment, User
+
+
+def makeUser(username, ccNumber=None):
+    return User(
+        username=username,
+        password="hashedpass123",
+        email=f"{username}@example.com",
+        birthdate="1990-01-01",
+        ccNumber=ccNumber
+    )
+
+def openStores(directory, snapshotEvery=100_000):
+    users, payments = UserStore(), PaymentStore()
+    wal = WriteAheadLog(str(directory), snapshotEvery=snapshotEvery)
+    wal.open(users, payments)
+    return wal, users, payments
+
+class TestWriteAheadLog:
+    def test_replay_restores_stores(self, tmp_path):
+        """Test that creates and deletes survive a restart"""
+        wal, users, payments = openStores(tmp_path)
+        users.extend([makeUser("alice", "1234567890123456"), makeUser("bob")])
+        users.remove("bob")
+        payments.add(Payment(id=payments.allocateId(), ccNumber="1234567890123456", amount=150, date="2024-01-01T10:00:00"))
+        wal.close()
+
+        wal, users, payments = openStores(tmp_path)
+        assert [u.username for u in users] == ["alice"]
+        assert users.hasCard("1234567890123456")
+        assert payments.get(1).amount == 150
+        wal.close()
+
+    def test_batch_insert_replays(self, tmp_path):
+        """Test that a batch insert is logged as one record and replayed in full"""
+        wal, users, payments = openStores(tmp_path)
+        users.add(makeUser("alice"))
+        users.addManyIfAbsent([makeUser("alice"), makeUser("bob"), makeUser("carol", "1234567890123456")])
+        wal.close()
+
+        wal, users, payments = openStores(tmp_path)
+        assert [u.username for u in users] == ["alice", "bob", "carol"]
+        assert users.hasCard("1234567890123456")
+        wal.close()
+
+    def test_payment_batch_replays(self, tmp_path):
+        """Test that a batch of payments is replayed with its ids and keeps the counter past them"""
+        wal, users, payments = openStores(tmp_path)
+        first = payments.allocateIds(3)
+        payments.addMany([Payment(id=first + n, ccNumber="1234567890123456", amount=100 + n) for n in range(3)])
+        wal.close()
+
+        wal, users, payments = openStores(tmp_path)
+        assert [p.amount for p in payments] == [100, 101, 102]
+        assert payments.allocateId() == 4
+        wal.close()
+
+    def test_ids_not_reused_after_restart(self, tmp_path):
+        """Test that a deleted newest payment id stays retired across restarts"""
+        wal, users, payments = openStores(tmp_path)
+        paymentId = payments.allocateId()
+        payments.add(Payment(id=paymentId, ccNumber="1234567890123456", amount=150))
+        payments.remove(paymentId)
+        wal.close()
+
+        wal, users, payments = openStores(tmp_path)
+        assert len(payments) == 0
+        assert payments.allocateId() == paymentId + 1
+        wal.close()
+
+    def test_snapshot_compacts_segments(self, tmp_path):
+        """Test that snapshots replace old segments and replay to the same state"""
+        wal, users, payments = openStores(tmp_path, snapshotEvery=10)
+        for i in range(50):
+            users.add(makeUser(f"user{i}"))
+        for i in range(0, 50, 2):
+            users.remove(f"user{i}")
+        wal.close()
+
+        assert os.path.exists(tmp_path / WriteAheadLog.SNAPSHOT)
+        assert len([name for name in os.listdir(tmp_path) if name.endswith(".log")]) < 5
+
+        wal, users, payments = openStores(tmp_path, snapshotEvery=10)
+        assert [u.username for u in users] == [f"user{i}" for i in range(1, 50, 2)]
+        wal.close()
+
+    def test_torn_tail_is_ignored(self, tmp_path):
+        """Test that a partially written last record does not stop recovery"""
+        wal, users, payments = openStores(tmp_path)
+        users.add(makeUser("alice"))
+        wal.close()
+        segment = sorted(name for name in os.listdir(tmp_path) if name.endswith(".log"))[-1]
+        with open(tmp_path / segment, "a") as f:
+            f.write('{"op":"addUser","user":{"usern')
+
+        wal, users, payments = openStores(tmp_path)
+        assert [u.username for u in users] == ["alice"]
+        wal.close()
+
+    def test_concurrent_writers_are_all_durable(self, tmp_path):
+        """Test that group-committed writes from many threads are all recovered"""
+        wal, users, payments = openStores(tmp_path)
+
+        def write(worker):
+            for i in range(20):
+                payments.add(Payment(id=payments.allocateId(), ccNumber="1234567890123456", amount=100 + worker))
+
+        threads = [threading.Thread(target=write, args=(n,)) for n in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wal.close()
+
+        wal, users, payments = openStores(tmp_path)
+        assert len(payments) == 160
+        assert sorted(p.id for p in payments) == list(range(1, 161))
+        wal.close()
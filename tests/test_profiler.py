@@ -0,0 +1,92 @@
+import asyncio
+import sys
+import os
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import config
+from app.main import app
+from app.profiler import SWITCH_INTERVAL, ProfileSession, profiler
+from app.storage import paymentsDB, usersDB
+from app.models import User
+
+client = TestClient(app)
+
+CARD = "1234567890123456"
+TOKEN = "admin-secret"
+ADMIN = {"Authorization": f"Bearer {TOKEN}"}
+
+@pytest.fixture(autouse=True)
+def clear_database(monkeypatch):
+    """Clear the database and configure an admin token before each test"""
+    paymentsDB.clear()
+    usersDB.clear()
+    monkeypatch.setattr(config, "ADMIN_TOKEN", TOKEN)
+    yield
+
+def routeFor(path):
+    return next(route for route in app.routes if getattr(route, "path", None) == path)
+
+class TestProfileEndpoint:
+    def test_requires_admin_token(self, monkeypatch):
+        """Test that profiling needs the bearer token, and does not exist without one configured"""
+        assert client.post("/admin/profile?seconds=0.01").status_code == 401
+        assert client.post("/admin/profile?seconds=0.01", headers={"Authorization": "Bearer wrong"}).status_code == 401
+        monkeypatch.setattr(config, "ADMIN_TOKEN", None)
+        assert client.post("/admin/profile?seconds=0.01", headers=ADMIN).status_code == 404
+
+    def test_time_limited_profile(self):
+        """Test that a profile returns a collapsed-stack report and leaves the app unwrapped afterwards"""
+        client.get("/")
+        stack = app.middleware_stack
+        response = client.post("/admin/profile?seconds=0.05", headers=ADMIN)
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        assert float(response.headers["X-Profile-Seconds"]) >= 0.05
+        assert int(response.headers["X-Profile-Samples"]) >= int(response.headers["X-Profile-Idle-Samples"])
+        assert float(response.headers["X-Profile-Switch-Interval"]) == SWITCH_INTERVAL
+        assert app.middleware_stack is stack
+        assert sys.getswitchinterval() == 0.005
+
+    def test_invalid_requests(self):
+        """Test that unknown routes, out of range limits and a second concurrent profile are refused"""
+        assert client.post("/admin/profile?route=/no/such/route", headers=ADMIN).status_code == 400
+        assert client.post("/admin/profile?seconds=0", headers=ADMIN).status_code == 422
+        assert client.post("/admin/profile?seconds=301", headers=ADMIN).status_code == 422
+        profiler.session = object()
+        try:
+            assert client.post("/admin/profile?seconds=0.01", headers=ADMIN).status_code == 409
+        finally:
+            profiler.session = None
+
+class TestProfileSession:
+    def test_route_scoped_request_limit(self):
+        """Test that a route-scoped profile stops after N of that route's requests and samples only them"""
+        usersDB.append(User(username="testuser", password="hashedpass123", email="test@example.com",
+                            birthdate="1990-01-01", ccNumber=CARD))
+        session = ProfileSession(app, seconds=30, requests=200, route=routeFor("/payments/create"), interval=0.001)
+
+        async def run():
+            task = asyncio.create_task(profiler.profile(session))
+            await asyncio.sleep(0)
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+                while not task.done():
+                    await http.post("/payments/create", json={"ccNumber": CARD, "amount": 150})
+                    await http.get("/payments/getAll?limit=10")
+                    # In-process requests never suspend, so give the profile task a turn
+                    await asyncio.sleep(0)
+            return await task
+
+        asyncio.run(run())
+        assert session.completed >= 200 and session.elapsed < 30
+        lines = session.collapsed().splitlines()
+        assert lines
+        for line in lines:
+            stack, count = line.rsplit(" ", 1)
+            assert int(count) > 0
+            assert "Route.handle" in stack and "get_payments" not in stack
+        assert any("_createPayment" in line for line in lines)
@@ -0,0 +1,79 @@
+import sys
+import os
+import pytest
+from fastapi.responses import JSONResponse as StandardJSONResponse
+from fastapi.testclient import TestClient
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.main import app
+from app.storage import paymentsDB, usersDB
+from app.models import Payment, User
+
+client = TestClient(app)
+
+@pytest.fixture(autouse=True)
+def clear_database():
+    """Clear the database before each test"""
+    usersDB.clear()
+    paymentsDB.clear()
+    yield
+
+def standardBody(content):
+    """Render content the way a returned dict or JSONResponse would"""
+    return StandardJSONResponse(content=content).body
+
+class TestCachedJSONResponses:
+    def test_user_lists_match_standard_rendering(self):
+        """Test that joined cached fragments give the same bytes as rendering the dicts"""
+        users = [
+            User(username=f"user{i}", password="hashedpass123", email=f"user{i}@example.com",
+                 birthdate="1990-01-01", ccNumber="1234567890123456" if i % 2 else None)
+            for i in range(5)
+        ] + [User(username="zoë", password="hashedpass123", email="zoe@example.com", birthdate="1990-01-01")]
+        usersDB.extend(users)
+
+        response = client.get("/users/getAll")
+        assert response.headers["content-type"] == "application/json"
+        assert response.content == standardBody({"users": [u.model_dump() for u in users]})
+        response = client.get("/users/getAll?creditcard=yes&limit=2")
+        nextCursor = response.json()["nextCursor"]
+        assert response.content == standardBody({"users": [users[1].model_dump(), users[3].model_dump()],
+                                                 "nextCursor": nextCursor})
+        response = client.get("/users/getByUsername/zoë")
+        assert response.content == standardBody({"user": users[-1].model_dump()})
+
+    def test_payment_responses_match_standard_rendering(self):
+        """Test that payment lists and lookups give the same bytes as rendering the dicts"""
+        payments = [Payment(id=i, ccNumber="1234567890123456", amount=100 + i, date="2024-01-01T10:00:00")
+                    for i in range(1, 6)]
+        paymentsDB.extend(payments)
+        assert client.get("/payments/getAll").content == standardBody({"payments": [p.model_dump() for p in payments]})
+        assert client.get("/payments/getAll?limit=10").content == \
+            standardBody({"payments": [p.model_dump() for p in payments], "nextCursor": None})
+        assert client.get("/payments/getPaymentById/3").content == standardBody({"payment": payments[2].model_dump()})
+
+    def test_updates_and_deletes_invalidate(self):
+        """Test that a replaced or deleted record is never served from the cache"""
+        usersDB.append(User(username="alice", password="hashedpass123", email="old@example.com", birthdate="1990-01-01"))
+        assert client.get("/users/getByUsername/alice").json()["user"]["email"] == "old@example.com"
+        usersDB.update(User(username="alice", password="hashedpass123", email="new@example.com", birthdate="1990-01-01"))
+        assert client.get("/users/getByUsername/alice").json()["user"]["email"] == "new@example.com"
+        assert client.get("/users/getAll").json()["users"][0]["email"] == "new@example.com"
+        usersDB.remove("alice")
+        assert client.get("/users/getByUsername/alice").status_code == 404
+        assert client.get("/users/getAll").json() == {"users": []}
+
+    def test_cache_stats_endpoint(self):
+        """Test that the stats endpoint reports per-store cache counters"""
+        stats = paymentsDB.cacheStats()
+        if stats is None:
+            pytest.skip("storage engine has no record cache")
+        if not stats["maxBytes"]:
+            pytest.skip("record cache disabled by STREAMLY_JSON_CACHE_BYTES=0")
+        paymentsDB.append(Payment(id=1, ccNumber="1234567890123456", amount=150))
+        before = client.get("/stats/cache").json()["payments"]
+        client.get("/payments/getPaymentById/1")
+        after = client.get("/stats/cache").json()["payments"]
+        assert after["hits"] == before["hits"] + 1
+        assert after["entries"] == 1
@@ -0,0 +1,200 @@
+import asyncio
+import sys
+import os
+import threading
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.storage import AsyncUserRepository, PaymentFilter
+from app.storage.base import CLAIM_SECONDS
+from app.storage.sqlite import SqliteDatabase, SqlitePaymentStore, SqliteReplayStore, SqliteUserStore
+from app.models import Payment, User
+
+
+def makeUser(username, ccNumber=None):
+    return User(
+        username=username,
+        password="hashedpass123",
+        email=f"{username}@example.com",
+        birthdate="1990-01-01",
+        ccNumber=ccNumber
+    )
+
+class TestSqliteUserStore:
+    def test_lookup_partitions_and_order(self, tmp_path):
+        """Test indexed lookups, card partitions and signup order"""
+        store = SqliteUserStore(SqliteDatabase(str(tmp_path / "streamly.db")))
+        store.extend([makeUser("carol", "1234567890123456"), makeUser("alice"), makeUser("bob", "1234567890123456")])
+        assert store.get("alice").username == "alice"
+        assert "bob" in store
+        assert store.hasCard("1234567890123456")
+        assert store.countByCard() == (2, 1)
+        assert [u.username for u in store.iterate(True)] == ["carol", "bob"]
+
+        store.remove("carol")
+        assert [u.username for u in store] == ["alice", "bob"]
+        assert store[1].username == "bob"
+
+    def test_page_cursor(self, tmp_path):
+        """Test keyset pagination over signup order"""
+        store = SqliteUserStore(SqliteDatabase(str(tmp_path / "streamly.db")))
+        store.extend([makeUser(f"user{i}") for i in range(5)])
+        users, nextKey = store.page(None, 2)
+        assert [u.username for u in users] == ["user0", "user1"]
+        users, nextKey = store.page(nextKey, 10)
+        assert [u.username for u in users] == ["user2", "user3", "user4"]
+        assert nextKey is None
+
+    def test_shared_between_databases(self, tmp_path):
+        """Test that two handles on the same file (as two workers would have) see each other's writes"""
+        path = str(tmp_path / "streamly.db")
+        first, second = SqliteUserStore(SqliteDatabase(path)), SqliteUserStore(SqliteDatabase(path))
+        first.add(makeUser("alice"))
+        assert second.get("alice") is not None
+
+    def test_async_calls_run_in_worker_threads(self, tmp_path):
+        """Test that the async facade keeps SQLite reads and writes off the event loop thread"""
+        users = AsyncUserRepository(SqliteUserStore(SqliteDatabase(str(tmp_path / "streamly.db"))))
+
+        async def run():
+            assert await users.addIfAbsent(makeUser("alice"))
+            return await users.read(threading.get_ident), await users.write(threading.get_ident), await users.get("alice")
+
+        readThread, writeThread, user = asyncio.run(run())
+        assert threading.get_ident() not in (readThread, writeThread)
+        assert user.username == "alice"
+
+    def test_add_many_skips_taken_usernames(self, tmp_path):
+        """Test that a batch insert only adds free usernames and reports which ones it added"""
+        store = SqliteUserStore(SqliteDatabase(str(tmp_path / "streamly.db")))
+        store.add(makeUser("alice"))
+        assert store.existingUsernames(["alice", "bob", "carol"]) == {"alice"}
+        assert store.addManyIfAbsent([makeUser("alice"), makeUser("bob", "1234567890123456"), makeUser("carol")]) == \
+            [False, True, True]
+        assert [u.username for u in store] == ["alice", "bob", "carol"]
+        assert store.countByCard() == (1, 2)
+
+    def test_owners_by_card(self, tmp_path):
+        """Test that card owners are listed by username and cards nobody has are left out"""
+        store = SqliteUserStore(SqliteDatabase(str(tmp_path / "streamly.db")))
+        store.extend([makeUser("bob", "1111222233334444"), makeUser("alice", "1111222233334444"),
+                      makeUser("carol", "5555666677778888")])
+        assert store.ownersByCard(["1111222233334444", "0000000000000000"]) == {"1111222233334444": ["alice", "bob"]}
+
+class TestSqlitePaymentStore:
+    def test_ids_unique_across_threads(self, tmp_path):
+        """Test that concurrent allocations from many threads never collide"""
+        store = SqlitePaymentStore(SqliteDatabase(str(tmp_path / "streamly.db")))
+        ids = []
+
+        def allocate():
+            ids.extend(store.allocateId() for _ in range(50))
+
+        threads = [threading.Thread(target=allocate) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert sorted(ids) == list(range(1, 201))
+
+    def test_allocate_id_block(self, tmp_path):
+        """Test that a reserved block is consecutive and later ids continue after it"""
+        store = SqlitePaymentStore(SqliteDatabase(str(tmp_path / "streamly.db")))
+        assert store.allocateId() == 1
+        first = store.allocateIds(3)
+        assert first == 2
+        store.addMany([Payment(id=first + n, ccNumber="1234567890123456", amount=100) for n in range(3)])
+        assert [p.id for p in store] == [2, 3, 4]
+        assert store.allocateId() == 5
+
+    def test_delete_does_not_free_id(self, tmp_path):
+        """Test that the counter survives deleting the newest payment"""
+        store = SqlitePaymentStore(SqliteDatabase(str(tmp_path / "streamly.db")))
+        store.add(Payment(id=store.allocateId(), ccNumber="1234567890123456", amount=150))
+        store.remove(1)
+        assert store.get(1) is None
+        assert store.allocateId() == 2
+
+    def test_aggregate_by_day_within_range(self, tmp_path):
+        """Test that grouping and date bounds match the memory engine"""
+        store = SqlitePaymentStore(SqliteDatabase(str(tmp_path / "streamly.db")))
+        store.extend([Payment(id=i, ccNumber=f"{i % 2:016d}", amount=100 * i, date=f"2024-01-0{i}T12:00:00")
+                      for i in range(1, 6)])
+        store.add(Payment(id=6, ccNumber="0000000000000000", amount=999))
+        assert (None, 1, 999) in store.aggregate("day")
+        assert sorted(store.aggregate("card", datetime(2024, 1, 2), datetime(2024, 1, 4, 12))) == [
+            ("0000000000000000", 1, 200), ("0000000000000001", 1, 300)]
+
+    def test_filtered_listing(self, tmp_path):
+        """Test card, date and amount filters on iterate and page"""
+        store = SqlitePaymentStore(SqliteDatabase(str(tmp_path / "streamly.db")))
+        store.extend([Payment(id=i, ccNumber=f"{i % 2:016d}", amount=100 * i, date=f"2024-01-0{i}T12:00:00")
+                      for i in range(1, 10)])
+        store.add(Payment(id=10, ccNumber="0000000000000000", amount=999))
+        filters = PaymentFilter(ccNumber="0000000000000001", start=datetime(2024, 1, 2), maxAmount=700)
+        assert [p.id for p in store.iterate(filters)] == [3, 5, 7]
+        page, nextKey = store.page(None, 2, filters)
+        assert ([p.id for p in page], nextKey) == ([3, 5], 5)
+        assert [p.id for p in store.iterate(PaymentFilter(end=datetime(2024, 1, 3), minAmount=200))] == [2]
+
+class TestSqliteReplayStore:
+    def test_claims_shared_between_databases(self, tmp_path):
+        """Test that a key claimed through one handle makes the other wait, then replays what was kept"""
+        path = str(tmp_path / "streamly.db")
+        first, second = (SqliteReplayStore(SqliteDatabase(path), ttl=60, maxBytes=1 << 20),
+                         SqliteReplayStore(SqliteDatabase(path), ttl=60, maxBytes=1 << 20))
+        outcome, claimId = first.claim("k", ("card", 150))
+        assert outcome == "run"
+        assert second.claim("k", ("card", 150)) == ("wait", None)
+        assert second.claim("k", ("card", 250)) == ("conflict", None)
+        first.finish("k", claimId, (201, b'{"id":1}'))
+        assert second.claim("k", ("card", 150), waited=True) == ("replay", (201, b'{"id":1}'))
+        assert second.stats()["waits"] == 1 and second.stats()["hits"] == 0
+        assert first.stats()["entries"] == 1
+
+    def test_failures_and_dead_claims_free_the_key(self, tmp_path):
+        """Test that a failed request frees its key, and a claim older than CLAIM_SECONDS is given up"""
+        now = [1000.0]
+        store = SqliteReplayStore(SqliteDatabase(str(tmp_path / "streamly.db")), ttl=60, maxBytes=1 << 20,
+                                  clock=lambda: now[0])
+        _, claimId = store.claim("k", 1)
+        store.finish("k", claimId, (404, b"{}"))
+        outcome, staleId = store.claim("k", 1)
+        assert outcome == "run"
+
+        now[0] += CLAIM_SECONDS
+        outcome, claimId = store.claim("k", 1)
+        assert outcome == "run" and claimId != staleId
+        # The request that lost its claim finishing late changes nothing
+        store.finish("k", staleId, (201, b"stale"))
+        assert store.claim("k", 1) == ("wait", None)
+        store.finish("k", claimId, (201, b"fresh"))
+        assert store.claim("k", 1) == ("replay", (201, b"fresh"))
+
+        now[0] += 60
+        assert store.claim("k", 1)[0] == "run"
+        assert store.stats()["expirations"] == 2
+
+    def test_size_bound_shared_between_databases(self, tmp_path):
+        """Test that responses kept through either handle share one byte budget, evicting the oldest first"""
+        path = str(tmp_path / "streamly.db")
+        now = [1000.0]
+        stores = [SqliteReplayStore(SqliteDatabase(path), ttl=60, maxBytes=1000, clock=lambda: now[0])
+                  for _ in range(2)]
+        for n in range(10):
+            now[0] += 1
+            store = stores[n % 2]
+            _, claimId = store.claim(f"key{n}", 1)
+            store.finish(f"key{n}", claimId, (201, b"x" * 196))
+        stats = stores[0].stats()
+        assert stats["bytes"] <= 1000 and stats["entries"] == 5
+        assert stores[0].evictions + stores[1].evictions == 5
+        assert stores[0].claim("key0", 1)[0] == "run"
+        assert stores[1].claim("key9", 1)[0] == "replay"
+
+        _, claimId = stores[0].claim("huge", 1)
+        stores[0].finish("huge", claimId, (201, b"x" * 2000))
+        assert stores[0].claim("huge", 1)[0] == "run"
+        stores[0].clear()
+        assert stores[0].stats()["bytes"] == 0
@@ -0,0 +1,401 @@
+import asyncio
+import sys
+import os
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.persistence import Journal
+from app.storage import memory
+from app.storage import AsyncPaymentRepository, AsyncUserRepository, OrderedIndex, PaymentFilter, PaymentStore, RecordCache, UserStore
+from app.models import Payment, User
+from datetime import datetime, timedelta
+
+
+def makeUser(username, ccNumber=None):
+    return User(
+        username=username,
+        password="hashedpass123",
+        email=f"{username}@example.com",
+        birthdate="1990-01-01",
+        ccNumber=ccNumber
+    )
+
+class TestOrderedIndex:
+    def test_seek_after_key(self):
+        """Test that iteration resumes after the given key, skipping discarded keys"""
+        index = OrderedIndex()
+        for key in range(1, 8):
+            index.add(key)
+        index.discard(4)
+        assert list(index.after(2)) == [3, 5, 6, 7]
+        assert list(index.after(4)) == [5, 6, 7]
+        assert len(index) == 6
+
+    def test_out_of_order_and_readded_keys(self):
+        """Test that late keys are kept sorted and re-added keys are not duplicated"""
+        index = OrderedIndex()
+        for key in (1, 5, 3):
+            index.add(key)
+        index.discard(5)
+        index.add(5)
+        assert list(index) == [1, 3, 5]
+
+    def test_compaction_keeps_live_keys(self):
+        """Test that compacting the log after many discards keeps the remaining keys"""
+        index = OrderedIndex()
+        for key in range(1000):
+            index.add(key)
+        for key in range(0, 1000, 3):
+            index.discard(key)
+        for key in range(1, 1000, 3):
+            index.discard(key)
+        assert list(index) == list(range(2, 1000, 3))
+
+class TestRecordCache:
+    def test_hit_only_for_same_row(self):
+        """Test that a cached entry is only served for a row equal to the one it was made from"""
+        cache = RecordCache()
+        alice = makeUser("alice")
+        assert cache.get("alice", alice) == alice.model_dump_json().encode()
+        assert cache.get("alice", alice) is cache.get("alice", alice)
+        replaced = makeUser("alice", "1234567890123456")
+        assert b"1234567890123456" in cache.get("alice", replaced)
+        stats = cache.stats()
+        assert (stats["hits"], stats["misses"], stats["entries"]) == (2, 2, 1)
+
+    def test_evicts_least_recently_used(self):
+        """Test that the cache stays under its byte budget by dropping cold entries first"""
+        users = [makeUser(f"user{i}") for i in range(4)]
+        size = len(users[0].model_dump_json()) + 200
+        cache = RecordCache(maxBytes=3 * size)
+        for user in users[:3]:
+            cache.put(user.username, user)
+        cache.get("user0", users[0])
+        cache.put("user3", users[3])
+        assert cache.stats()["evictions"] == 1
+        assert cache.stats()["bytes"] <= 3 * size
+        hits = cache.hits
+        cache.get("user0", users[0])
+        assert cache.hits == hits + 1
+        cache.get("user1", users[1])
+        assert cache.misses == 1
+
+    def test_disabled(self):
+        """Test that a zero budget encodes without storing"""
+        cache = RecordCache(maxBytes=0)
+        alice = makeUser("alice")
+        assert cache.put("alice", alice) == alice.model_dump_json().encode()
+        assert len(cache) == 0
+
+class TestUserStore:
+    def test_lookup_by_username(self):
+        """Test that users can be fetched by username"""
+        store = UserStore()
+        store.add(makeUser("alice"))
+        assert store.get("alice").username == "alice"
+        assert store.get("bob") is None
+        assert "alice" in store
+        assert "bob" not in store
+
+    def test_keeps_insertion_order(self):
+        """Test that iteration follows insertion order, even after deletes"""
+        store = UserStore()
+        store.extend([makeUser("carol"), makeUser("alice"), makeUser("bob")])
+        store.remove("alice")
+        store.add(makeUser("dave"))
+        assert [u.username for u in store] == ["carol", "bob", "dave"]
+        assert store[0].username == "carol"
+        assert len(store) == 3
+
+    def test_card_index_follows_deletes(self):
+        """Test that the ccNumber index is kept in sync with removals"""
+        store = UserStore()
+        store.add(makeUser("alice", "1234567890123456"))
+        store.add(makeUser("bob", "1234567890123456"))
+        assert {u.username for u in store.getByCard("1234567890123456")} == {"alice", "bob"}
+
+        store.remove("alice")
+        assert [u.username for u in store.getByCard("1234567890123456")] == ["bob"]
+        store.remove("bob")
+        assert store.getByCard("1234567890123456") == []
+
+    def test_remove_missing_user(self):
+        """Test that removing an unknown username returns None"""
+        store = UserStore()
+        assert store.remove("ghost") is None
+
+    def test_json_follows_writes(self):
+        """Test that serialized reads come from the cache and follow updates and deletes"""
+        store = UserStore()
+        store.add(makeUser("alice"))
+        assert store.getJSON("alice") == makeUser("alice").model_dump_json().encode()
+        assert store.cacheStats()["hits"] == 1
+        store.update(makeUser("alice", "1234567890123456"))
+        assert b"1234567890123456" in store.getJSON("alice")
+        assert [b"1234567890123456" in data for data in store.iterateJSON(True)] == [True]
+        store.remove("alice")
+        assert store.getJSON("alice") is None
+        assert store.cacheStats()["entries"] == 0
+
+    def test_owners_by_card(self):
+        """Test that card owners are listed by username and cards nobody has are left out"""
+        store = UserStore()
+        store.extend([makeUser("bob", "1111222233334444"), makeUser("alice", "1111222233334444"),
+                      makeUser("carol", "5555666677778888")])
+        assert store.ownersByCard(["1111222233334444", "0000000000000000"]) == {"1111222233334444": ["alice", "bob"]}
+
+    def test_add_many_skips_taken_usernames(self):
+        """Test that a batch insert only adds free usernames and reports which ones it added"""
+        store = UserStore()
+        store.add(makeUser("alice"))
+        assert store.existingUsernames(["alice", "bob", "carol"]) == {"alice"}
+        assert store.addManyIfAbsent([makeUser("alice"), makeUser("bob", "1234567890123456"), makeUser("carol")]) == \
+            [False, True, True]
+        assert [u.username for u in store] == ["alice", "bob", "carol"]
+        assert store.countByCard() == (1, 2)
+
+    def test_json_encoded_outside_index_lock(self, monkeypatch):
+        """Test that writers encode a user's JSON before taking the index lock, not while holding it"""
+        store = UserStore()
+        encode = memory.encodeRecord
+
+        def checkedEncode(record):
+            assert not store._indexLock.locked()
+            return encode(record)
+
+        monkeypatch.setattr(memory, "encodeRecord", checkedEncode)
+        store.add(makeUser("alice"))
+        assert store.addIfAbsent(makeUser("bob"))
+        assert store.addManyIfAbsent([makeUser("carol"), makeUser("bob")]) == [True, False]
+        assert store.update(makeUser("alice", "1234567890123456"))
+        assert store.getJSON("alice") == encode(makeUser("alice", "1234567890123456"))
+        assert store.cacheStats()["entries"] == 3
+
+class TestPaymentStore:
+    def test_allocated_ids_are_monotonic(self):
+        """Test that ids keep increasing across deletes"""
+        store = PaymentStore()
+        first = store.allocateId()
+        store.add(Payment(id=first, ccNumber="1234567890123456", amount=100))
+        store.remove(first)
+        assert store.allocateId() == first + 1
+
+    def test_counter_skips_explicit_ids(self):
+        """Test that adding a payment with an explicit id moves the counter past it"""
+        store = PaymentStore()
+        store.add(Payment(id=41, ccNumber="1234567890123456", amount=100))
+        assert store.allocateId() == 42
+
+    def test_allocate_id_block(self):
+        """Test that a reserved block is consecutive and later ids continue after it"""
+        store = PaymentStore()
+        assert store.allocateId() == 1
+        first = store.allocateIds(3)
+        assert first == 2
+        store.addMany([Payment(id=first + n, ccNumber="1234567890123456", amount=100) for n in range(3)])
+        assert [p.id for p in store] == [2, 3, 4]
+        assert store.allocateId() == 5
+
+    def test_lookup_and_delete_by_id(self):
+        """Test O(1) lookup and delete keep the remaining order intact"""
+        store = PaymentStore()
+        store.extend([Payment(id=i, ccNumber="1234567890123456", amount=100 + i) for i in range(1, 4)])
+        assert store.get(2).amount == 102
+        assert store.remove(2).id == 2
+        assert store.get(2) is None
+        assert store.remove(2) is None
+        assert [p.id for p in store] == [1, 3]
+
+    def test_lookups_skip_index_lock(self, monkeypatch):
+        """Test that lookups by id do not wait for the index lock, and writers encode JSON before taking it"""
+        store = PaymentStore()
+        store.add(Payment(id=1, ccNumber="1234567890123456", amount=150))
+        results = []
+        with store._indexLock:
+            lookup = threading.Thread(target=lambda: results.extend(
+                [store.get(1).amount, store.getJSON(1) is not None, 1 in store, store.get(2)]))
+            lookup.start()
+            lookup.join(5)
+        assert results == [150, True, True, None]
+
+        encode = memory.encodeRecord
+
+        def checkedEncode(record):
+            assert not store._indexLock.locked()
+            return encode(record)
+
+        monkeypatch.setattr(memory, "encodeRecord", checkedEncode)
+        store.add(Payment(id=2, ccNumber="1234567890123456", amount=250))
+        store.addMany([Payment(id=3, ccNumber="1234567890123456", amount=350)])
+        assert store.cacheStats()["misses"] == 0 and len(store.page(None, 10)[0]) == 3
+
+    def test_dates_round_trip(self):
+        """Test that compactly stored dates come back exactly as they were given"""
+        store = PaymentStore()
+        dates = [None, "2024-05-01T12:30:00.123456", "2024-05-01T12:30:00", "1969-07-20T20:17:40",
+                 "2024-05-01", "2024-05-01T12:30:00+02:00", "yesterday"]
+        store.extend([Payment(id=i, ccNumber="1234567890123456", amount=100, date=date)
+                      for i, date in enumerate(dates, 1)])
+        assert [p.date for p in store] == dates
+        assert store.getJSON(7) == store.get(7).model_dump_json().encode()
+
+    def test_out_of_order_ids_and_compaction(self):
+        """Test that ids added out of order are kept sorted and survive compacting deleted slots"""
+        store = PaymentStore()
+        for paymentId in [5, 1, 3, 9, 3]:
+            store.add(Payment(id=paymentId, ccNumber=f"{paymentId:016d}", amount=100 + paymentId))
+        assert [p.id for p in store] == [1, 3, 5, 9]
+        store.extend([Payment(id=i, ccNumber="1234567890123456", amount=100) for i in range(10, 300)])
+        for paymentId in range(10, 300):
+            store.remove(paymentId)
+        assert [(p.id, p.ccNumber, p.amount) for p in store] == [
+            (1, "0000000000000001", 101), (3, "0000000000000003", 103),
+            (5, "0000000000000005", 105), (9, "0000000000000009", 109)]
+        assert store.page(1, 2) == ([store.get(3), store.get(5)], 5)
+        store.add(Payment(id=20, ccNumber="1234567890123456", amount=120))
+        assert 20 in store and 150 not in store
+        assert len(store) == 5
+
+    def test_add_many_in_or_out_of_order(self):
+        """Test that batches append in one step when ids are new and fall back to single puts otherwise"""
+        store = PaymentStore()
+        store.addMany([Payment(id=i, ccNumber="1234567890123456", amount=100 + i, date="odd") for i in (4, 5, 6)])
+        store.addMany([Payment(id=i, ccNumber="6543210987654321", amount=200 + i) for i in (7, 2, 5)])
+        assert [(p.id, p.amount, p.date) for p in store] == [
+            (2, 202, None), (4, 104, "odd"), (5, 205, None), (6, 106, "odd"), (7, 207, None)]
+
+    def test_aggregate_skips_deleted_payments(self):
+        """Test that per-card and per-day groups only count live payments"""
+        store = PaymentStore()
+        store.extend([Payment(id=i, ccNumber=f"{i % 2:016d}", amount=100 * i, date=f"2024-01-0{i}T12:00:00")
+                      for i in range(1, 6)])
+        store.remove(3)
+        assert sorted(store.aggregate("card")) == [("0000000000000000", 2, 600), ("0000000000000001", 2, 600)]
+        assert store.aggregate("day") == [("2024-01-01", 1, 100), ("2024-01-02", 1, 200),
+                                          ("2024-01-04", 1, 400), ("2024-01-05", 1, 500)]
+
+    def test_aggregate_range_with_and_without_ordered_dates(self):
+        """Test that range bounds give the same groups whether the date column is bisected or scanned"""
+        payments = [Payment(id=i, ccNumber=f"{i % 3:016d}", amount=100 + i,
+                            date=(datetime(2024, 1, 1) + timedelta(hours=5 * i)).isoformat()) for i in range(1, 60)]
+        # Undated payments sort first in the date column
+        payments[:0] = [Payment(id=i, ccNumber="0000000000000000", amount=500 + i) for i in (-2, -1)]
+        ordered, shuffled = PaymentStore(), PaymentStore()
+        ordered.extend(payments)
+        shuffled.extend(reversed(payments))
+        for store in (ordered, shuffled):
+            store.remove(7)
+            store.remove(-1)
+        for start, end in [(datetime(2024, 1, 3), datetime(2024, 1, 6, 12)), (None, datetime(2024, 1, 2)),
+                           (datetime(2024, 1, 12), None), (None, None)]:
+            for groupBy in ("card", "day"):
+                expected = sorted(shuffled.aggregate(groupBy, start, end), key=repr)
+                assert sorted(ordered.aggregate(groupBy, start, end), key=repr) == expected
+        assert ordered.aggregate("day", None, datetime(2024, 1, 2)) == [("2024-01-01", 4, 410)]
+        assert ordered.aggregate("day")[-1] == (None, 1, 498)
+
+    def test_filtered_listing_with_and_without_ordered_dates(self):
+        """Test card, date and amount filters over the posting lists and both date indexes"""
+        payments = [Payment(id=i, ccNumber=f"{i % 3:016d}", amount=100 + i,
+                            date=(datetime(2024, 1, 1) + timedelta(hours=5 * i)).isoformat()) for i in range(1, 60)]
+        # Undated payments sort first in the date column
+        payments.insert(0, Payment(id=0, ccNumber="0000000000000001", amount=160))
+        ordered, shuffled = PaymentStore(), PaymentStore()
+        ordered.extend(payments)
+        shuffled.extend(reversed(payments))
+        # The first date query builds the shuffled store's date index; later writes must still be found
+        for store in (ordered, shuffled):
+            list(store.iterate(PaymentFilter(start=datetime(2024, 1, 1))))
+            store.remove(7)
+        # Moving payment 10 to another card (and, out of order, to another date) leaves stale index entries behind
+        orderedMove = Payment(id=10, ccNumber="0000000000000002", amount=110, date=payments[10].date)
+        shuffledMove = orderedMove.model_copy(update={"date": "2024-01-10T00:00:00"})
+        ordered.add(orderedMove)
+        shuffled.add(shuffledMove)
+
+        for store, moved in ((ordered, orderedMove), (shuffled, shuffledMove)):
+            current = [moved if p.id == 10 else p for p in payments if p.id != 7]
+            for filters in [
+                PaymentFilter(ccNumber="0000000000000001"),
+                PaymentFilter(ccNumber="0000000000000002", start=datetime(2024, 1, 2), end=datetime(2024, 1, 11)),
+                PaymentFilter(start=datetime(2024, 1, 3), end=datetime(2024, 1, 10, 12), minAmount=110, maxAmount=140),
+                PaymentFilter(end=datetime(2024, 1, 2)),
+                PaymentFilter(ccNumber="9999999999999999"),
+            ]:
+                expected = [p for p in current if
+                            (filters.ccNumber is None or p.ccNumber == filters.ccNumber) and
+                            (filters.start is None or (p.date and p.date >= filters.start.isoformat())) and
+                            (filters.end is None or (p.date and p.date < filters.end.isoformat())) and
+                            (filters.minAmount is None or p.amount >= filters.minAmount) and
+                            (filters.maxAmount is None or p.amount <= filters.maxAmount)]
+                assert list(store.iterate(filters)) == expected
+
+    def test_filtered_pages(self):
+        """Test that cursor pages over a filter cover every match exactly once"""
+        store = PaymentStore()
+        store.extend(Payment(id=i, ccNumber=f"{i % 4:016d}", amount=i, date=f"2024-01-01T00:00:{i:02d}")
+                     for i in range(1, 41))
+        filters = PaymentFilter(ccNumber="0000000000000001", minAmount=10)
+        page, nextKey = store.page(None, 3, filters)
+        assert [p.id for p in page] == [13, 17, 21]
+        seen = [p.id for p in page]
+        while nextKey is not None:
+            page, nextKey = store.page(nextKey, 3, filters)
+            seen += [p.id for p in page]
+        assert seen == [13, 17, 21, 25, 29, 33, 37]
+
+
+class DurableJournal(Journal):
+    """Stands in for the write-ahead log: writes wait for it, so async writes must leave the event loop"""
+    enabled = True
+
+class TestAsyncRepository:
+    def test_memory_user_reads_run_inline(self):
+        """Test that in-memory user reads run on the event loop thread, writes in a worker, and both see the same data"""
+        store = UserStore()
+        users = AsyncUserRepository(store)
+
+        async def run():
+            assert await users.addIfAbsent(makeUser("alice", "1234567890123456"))
+            assert not await users.addIfAbsent(makeUser("alice"))
+            threads = await asyncio.gather(users.read(threading.get_ident), users.write(threading.get_ident))
+            return threads, await users.get("alice"), await users.listJSON(True), await users.scan(threading.get_ident)
+
+        (readThread, writeThread), user, listed, scanThread = asyncio.run(run())
+        assert readThread == threading.get_ident()
+        assert writeThread != threading.get_ident() and scanThread != threading.get_ident()
+        assert user.ccNumber == "1234567890123456" and len(listed) == 1
+        assert store.getJSON("alice") == listed[0]
+
+    def test_payment_calls_leave_the_loop(self):
+        """Test that payment reads and writes, which can wait on the index lock, go to a worker thread"""
+        store = PaymentStore()
+        store.attachJournal(DurableJournal())
+        payments = AsyncPaymentRepository(store)
+
+        async def run():
+            paymentId = await payments.allocateId()
+            await payments.add(Payment(id=paymentId, ccNumber="1234567890123456", amount=150))
+            return (await payments.read(threading.get_ident), await payments.write(threading.get_ident),
+                    await payments.cardSummary("1234567890123456"), await payments.remove(paymentId))
+
+        readThread, writeThread, summary, removed = asyncio.run(run())
+        assert readThread != threading.get_ident() and writeThread != threading.get_ident()
+        assert summary.count == 1 and removed.amount == 150
+        assert len(store) == 0
+
+    def test_index_lock_wait_keeps_loop_running(self):
+        """Test that a payment read waiting on a held index lock waits in a worker, not on the event loop"""
+        store = PaymentStore()
+        store.add(Payment(id=1, ccNumber="1234567890123456", amount=150))
+        payments = AsyncPaymentRepository(store)
+
+        async def run():
+            with store._indexLock:
+                pending = asyncio.ensure_future(payments.cardSummary("1234567890123456"))
+                await asyncio.sleep(0.05)
+                assert not pending.done()
+            return await pending
+
+        assert asyncio.run(run()).count == 1
@@ -0,0 +1,180 @@
+import asyncio
+import sys
+import os
+import shutil
+import tempfile
+import threading
+from multiprocessing import AuthenticationError
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.storage import AsyncPaymentRepository, AsyncUserRepository, PaymentFilter, PaymentStore, UserStore
+from app.storage.remote import RemotePaymentStore, RemoteReplayStore, RemoteUserStore, StorageClient, USERS
+from app.storage.server import StorageServer
+from app.idempotency import IdempotencyCache, SharedIdempotencyCache
+from app.models import Payment, User
+from app.responses import JSONResponse
+
+
+def makeUser(username, ccNumber=None):
+    return User(
+        username=username,
+        password="hashedpass123",
+        email=f"{username}@example.com",
+        birthdate="1990-01-01",
+        ccNumber=ccNumber
+    )
+
+@pytest.fixture
+def server():
+    """Serve fresh memory stores on a socket in a short temporary directory (socket paths are length-limited)"""
+    directory = tempfile.mkdtemp(prefix="streamly-")
+    server = StorageServer(UserStore(), PaymentStore(), os.path.join(directory, "storage.sock"),
+                           replays=IdempotencyCache(ttl=60, maxBytes=1 << 20))
+    server.start()
+    threading.Thread(target=server.serve, daemon=True).start()
+    clients = []
+
+    def connect(authkey=None):
+        client = StorageClient(server.address, authkey, connectTimeout=1)
+        clients.append(client)
+        return client
+
+    server.connect = connect
+    yield server
+    for client in clients:
+        client.close()
+    server.close()
+    shutil.rmtree(directory, ignore_errors=True)
+
+def runThreads(target, count):
+    threads = [threading.Thread(target=target) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+class TestStorageServer:
+    def test_round_trip(self, server):
+        """Test that remote stores read and write the server's stores like local ones"""
+        client = server.connect()
+        users, payments = RemoteUserStore(client), RemotePaymentStore(client)
+        users.extend([makeUser("alice", "1234567890123456"), makeUser("bob")])
+        assert users.get("alice").ccNumber == "1234567890123456"
+        assert "bob" in users and len(users) == 2
+        assert users.countByCard() == (1, 1)
+
+        paymentId = payments.allocateId()
+        payments.add(Payment(id=paymentId, ccNumber="1234567890123456", amount=150))
+        assert payments.get(paymentId).amount == 150
+        assert payments.cardSummary("1234567890123456").total == 150
+        assert b'"amount":150' in payments.getJSON(paymentId)
+
+    def test_usernames_unique_across_workers(self, server):
+        """Test that racing signups from several worker connections admit each username once"""
+        stores = [RemoteUserStore(server.connect()) for _ in range(4)]
+        admitted = []
+
+        def signup():
+            for store in stores:
+                admitted.extend(n for n in range(20) if store.addIfAbsent(makeUser(f"user{n}")))
+
+        runThreads(signup, 4)
+        assert sorted(admitted) == list(range(20))
+        assert len(stores[0]) == 20
+
+    def test_payment_ids_unique_across_workers(self, server):
+        """Test that every worker connection draws payment ids from the server's single counter"""
+        stores = [RemotePaymentStore(server.connect()) for _ in range(4)]
+        ids = []
+
+        def allocate():
+            for store in stores:
+                ids.extend(store.allocateId() for _ in range(25))
+
+        runThreads(allocate, 4)
+        assert sorted(ids) == list(range(1, 401))
+
+    def test_concurrent_calls_share_batches(self, server):
+        """Test that calls made from many threads at once travel in fewer messages than calls"""
+        client = server.connect()
+        users = RemoteUserStore(client)
+        users.add(makeUser("alice"))
+        sent = client.batches
+
+        runThreads(lambda: [users.get("alice") for _ in range(50)], 8)
+        assert client.batches - sent < 400
+
+    def test_async_calls_await_the_reply(self, server):
+        """Test that the async facade awaits remote calls directly, keeping ids unique and errors intact"""
+        client = server.connect()
+        users, payments = AsyncUserRepository(RemoteUserStore(client)), AsyncPaymentRepository(RemotePaymentStore(client))
+
+        async def run():
+            ids = await asyncio.gather(*(payments.allocateId() for _ in range(100)))
+            assert sorted(ids) == list(range(1, 101))
+            assert await users.addIfAbsent(makeUser("alice"))
+            assert not await users.addIfAbsent(makeUser("alice"))
+            assert await users.contains("alice")
+            with pytest.raises(ValueError):
+                await payments.aggregate("week")
+
+        asyncio.run(run())
+
+    def test_iterate_pages_through_the_socket(self, server, monkeypatch):
+        """Test that whole-table iteration is fetched page by page and keeps filters"""
+        monkeypatch.setattr("app.storage.remote.ITERATE_BATCH_SIZE", 3)
+        payments = RemotePaymentStore(server.connect())
+        payments.extend([Payment(id=i, ccNumber=f"12345678901234{50 + i % 2}", amount=100 + i) for i in range(1, 11)])
+        assert [p.id for p in payments.iterate()] == list(range(1, 11))
+        assert [p.id for p in payments.iterate(PaymentFilter(ccNumber="1234567890123450"))] == [2, 4, 6, 8, 10]
+        assert len(list(payments.iterateJSON())) == 10
+
+    def test_errors_reach_the_caller(self, server):
+        """Test that a store's exception is re-raised in the worker and unknown methods are refused"""
+        client = server.connect()
+        payments = RemotePaymentStore(client)
+        with pytest.raises(ValueError):
+            payments.aggregate("week")
+        with pytest.raises(AttributeError):
+            client.call(USERS, "_encode", makeUser("alice"))
+        # The connection is still usable afterwards
+        assert payments.allocateId() == 1
+
+    def test_wrong_key_is_refused(self, server):
+        """Test that a client without the server's key cannot connect, and one reading the key file can"""
+        with pytest.raises(AuthenticationError):
+            server.connect(b"not the key").call(USERS, "__len__")
+        assert server.connect().call(USERS, "__len__") == 0
+        assert os.stat(server.address + ".key").st_mode & 0o777 == 0o600
+
+    def test_idempotency_keys_shared_across_workers(self, server):
+        """Test that a retry reaching another worker waits for the first request and replays its response"""
+        first, second = RemoteReplayStore(server.connect()), RemoteReplayStore(server.connect())
+        outcome, claimId = first.claim("k", ("card", 150))
+        assert outcome == "run"
+        assert second.claim("k", ("card", 150)) == ("wait", None)
+        assert second.claim("k", ("card", 250)) == ("conflict", None)
+        first.finish("k", claimId, (201, b'{"id":1}'))
+        assert second.claim("k", ("card", 150)) == ("replay", (201, b'{"id":1}'))
+        assert first.stats()["entries"] == 1
+
+    def test_concurrent_retries_on_two_workers_run_once(self, server):
+        """Test that the same key sent to two workers at once creates one payment"""
+        workers = [SharedIdempotencyCache(RemoteReplayStore(server.connect())) for _ in range(2)]
+        executions = 0
+
+        async def execute():
+            nonlocal executions
+            executions += 1
+            await asyncio.sleep(0.05)
+            return JSONResponse(status_code=201, content={"id": executions})
+
+        async def run():
+            return await asyncio.gather(*(workers[n % 2].run("k", ("card", 150), execute) for n in range(6)))
+
+        responses = asyncio.run(run())
+        assert executions == 1
+        assert {response.body for response in responses} == {b'{"id":1}'}
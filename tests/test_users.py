@@ -1,5 +1,7 @@
 import sys
 import os
+import json
+import hashlib
 import pytest
 from httpx import AsyncClient
 from fastapi.testclient import TestClient
@@ -9,6 +11,7 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from app.main import app
 from app.storage import usersDB, paymentsDB
 from app.models import User, Payment
+from app.utils import verifyPassword
 
 client = TestClient(app)
 
@@ -258,6 +261,19 @@ class TestCreateUser:
         assert response.status_code == 400
         assert response.json()["message"] == "Birthdate must be in YYYY-MM-DD format"
 
+    def test_create_user_impossible_date(self):
+        """Test that a well-shaped birthdate that is not a real date is a format error, not an age error"""
+        for birthdate in ("1990-02-30", "2001-13-01"):
+            response = client.post("/users/users/create", json={
+                "username": "impossibledate",
+                "password": "MyPassword123",
+                "email": "date@example.com",
+                "birthdate": birthdate
+            })
+            assert response.status_code == 400
+            assert response.json()["message"] == "Birthdate must be in YYYY-MM-DD format"
+        assert len(usersDB) == 0
+
     def test_create_user_underage(self):
         """Test creating user under 18 years old"""
         user_data = {
@@ -299,6 +315,48 @@ class TestCreateUser:
         assert response.status_code == 400
         assert response.json()["message"] == "Invalid credit card number format"
 
+    def test_create_user_reports_all_errors(self):
+        """Test that every failing field is listed, with the first failure's status and message on top"""
+        user_data = {
+            "username": "bad_name",
+            "password": "short",
+            "email": "not-an-email",
+            "birthdate": "2020-01-01",
+            "ccNumber": "1234"
+        }
+
+        response = client.post("/users/users/create", json=user_data)
+        assert response.status_code == 400
+        assert response.json()["message"] == "Username must be alphanumeric"
+        assert response.json()["errors"] == [
+            {"field": "username", "message": "Username must be alphanumeric"},
+            {"field": "password", "message": "Password must be at least 8 characters long"},
+            {"field": "email", "message": "Invalid email format"},
+            {"field": "birthdate", "message": "User must be at least 18 years old to register"},
+            {"field": "ccNumber", "message": "Invalid credit card number format"}
+        ]
+        assert len(usersDB) == 0
+
+    def test_create_user_duplicate_listed_with_field_errors(self):
+        """Test that a taken username is reported alongside other failing fields with the 409 status"""
+        usersDB.append(User(username="taken", password="hashedpass123", email="taken@example.com", birthdate="1990-01-01"))
+        user_data = {
+            "username": "taken",
+            "password": "MyPassword123",
+            "email": "taken@example.com",
+            "birthdate": "2020-01-01"
+        }
+
+        response = client.post("/users/users/create", json=user_data)
+        assert response.status_code == 409
+        assert [error["field"] for error in response.json()["errors"]] == ["username", "birthdate"]
+
+    def test_create_user_missing_field_keeps_default_error(self):
+        """Test that a structurally invalid body still gets FastAPI's 422 response"""
+        response = client.post("/users/users/create", json={"username": "nofields"})
+        assert response.status_code == 422
+        assert "detail" in response.json()
+
 class TestDeleteUser:
     def test_delete_user_exists(self):
         """Test deleting a user that exists"""
@@ -334,8 +392,228 @@ class TestPasswordHashing:
         response = client.post("/users/users/create", json=user_data)
         assert response.status_code == 201
         
-        # Check that password in database is hashed (not plain text)
-        assert usersDB[0].password != "MyPassword123"
-        assert len(usersDB[0].password) == 64  # SHA-256 hash length
+        # Check that password in database is hashed (not plain text) with a salted KDF
+        stored = usersDB[0].password
+        assert stored != "MyPassword123"
+        assert stored.startswith("scrypt$")
+        assert verifyPassword("MyPassword123", stored)
+
+    def test_same_password_gets_different_salts(self):
+        """Test that two users with the same password get different hashes"""
+        for username in ("saltone", "salttwo"):
+            client.post("/users/users/create", json={
+                "username": username,
+                "password": "MyPassword123",
+                "email": f"{username}@example.com",
+                "birthdate": "1990-01-01"
+            })
+        assert usersDB.get("saltone").password != usersDB.get("salttwo").password
+
+class TestLogin:
+    def create(self):
+        client.post("/users/users/create", json={
+            "username": "loginuser",
+            "password": "MyPassword123",
+            "email": "login@example.com",
+            "birthdate": "1990-01-01"
+        })
+
+    def test_login_success(self):
+        """Test logging in with the right password"""
+        self.create()
+        response = client.post("/users/login", json={"username": "loginuser", "password": "MyPassword123"})
+        assert response.status_code == 200
+        assert response.json()["message"] == "Login successful"
+
+    def test_login_wrong_password(self):
+        """Test that a wrong password or unknown user is rejected with the same message"""
+        self.create()
+        for credentials in ({"username": "loginuser", "password": "WrongPassword1"},
+                            {"username": "nobody", "password": "MyPassword123"}):
+            response = client.post("/users/login", json=credentials)
+            assert response.status_code == 401
+            assert response.json()["message"] == "Invalid username or password"
+
+    def test_login_rehashes_legacy_hash(self):
+        """Test that an old unsalted SHA-256 hash is upgraded on successful login"""
+        legacy = hashlib.sha256("MyPassword123".encode()).hexdigest()
+        usersDB.extend([
+            User(username="first", password="hashedpass123", email="first@example.com", birthdate="1990-01-01"),
+            User(username="legacy", password=legacy, email="legacy@example.com", birthdate="1990-01-01"),
+        ])
+        response = client.post("/users/login", json={"username": "legacy", "password": "MyPassword123"})
+        assert response.status_code == 200
 
+        stored = usersDB.get("legacy").password
+        assert stored.startswith("scrypt$")
+        assert verifyPassword("MyPassword123", stored)
+        # The upgrade does not move the user in signup order
+        assert [u.username for u in usersDB] == ["first", "legacy"]
 
+
+
+class TestGetUsersPagination:
+    def add_users(self, count):
+        for i in range(count):
+            usersDB.append(User(
+                username=f"pageuser{i}",
+                password="hashedpass123",
+                email=f"page{i}@example.com",
+                birthdate="1990-01-01",
+                ccNumber="1234567890123456" if i % 2 == 0 else None
+            ))
+
+    def test_pages_cover_all_users_in_order(self):
+        """Test walking every page returns each user once in insertion order"""
+        self.add_users(5)
+        seen = []
+        response = client.get("/users/getAll?limit=2")
+        while True:
+            assert response.status_code == 200
+            body = response.json()
+            seen.extend(user["username"] for user in body["users"])
+            if body["nextCursor"] is None:
+                break
+            response = client.get(f"/users/getAll?limit=2&cursor={body['nextCursor']}")
+        assert seen == [f"pageuser{i}" for i in range(5)]
+
+    def test_pagination_with_creditcard_filter(self):
+        """Test that the creditcard filter applies within pages"""
+        self.add_users(6)
+        first = client.get("/users/getAll?creditcard=yes&limit=2").json()
+        assert [u["username"] for u in first["users"]] == ["pageuser0", "pageuser2"]
+        second = client.get(f"/users/getAll?creditcard=yes&limit=2&cursor={first['nextCursor']}").json()
+        assert [u["username"] for u in second["users"]] == ["pageuser4"]
+        assert second["nextCursor"] is None
+
+    def test_cursor_stable_across_writes(self):
+        """Test that deletes and inserts do not shift the next page"""
+        self.add_users(4)
+        first = client.get("/users/getAll?limit=2").json()
+        client.delete("/users/delete/pageuser0")
+        client.delete("/users/delete/pageuser2")
+        usersDB.append(User(username="latecomer", password="hashedpass123", email="late@example.com", birthdate="1990-01-01"))
+        second = client.get(f"/users/getAll?limit=2&cursor={first['nextCursor']}").json()
+        assert [u["username"] for u in second["users"]] == ["pageuser3", "latecomer"]
+
+    def test_invalid_cursor(self):
+        """Test that a malformed cursor is rejected"""
+        response = client.get("/users/getAll?limit=2&cursor=notacursor")
+        assert response.status_code == 400
+        assert response.json()["message"] == "Invalid cursor"
+
+class TestExportUsers:
+    def test_export_ndjson(self):
+        """Test that export streams one JSON object per line"""
+        usersDB.extend([
+            User(username="exportone", password="hashedpass123", email="one@example.com", birthdate="1990-01-01"),
+            User(username="exporttwo", password="hashedpass123", email="two@example.com", birthdate="1990-01-01", ccNumber="1234567890123456")
+        ])
+        response = client.get("/users/export")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        assert [line["username"] for line in lines] == ["exportone", "exporttwo"]
+
+    def test_export_creditcard_filter(self):
+        """Test that export accepts the same creditcard filter as getAll"""
+        usersDB.extend([
+            User(username="exportone", password="hashedpass123", email="one@example.com", birthdate="1990-01-01"),
+            User(username="exporttwo", password="hashedpass123", email="two@example.com", birthdate="1990-01-01", ccNumber="1234567890123456")
+        ])
+        response = client.get("/users/export?creditcard=no")
+        assert [json.loads(line)["username"] for line in response.text.splitlines()] == ["exportone"]
+        assert client.get("/users/export?creditcard=maybe").status_code == 400
+
+    def test_export_empty(self):
+        """Test that exporting an empty table returns an empty body"""
+        response = client.get("/users/export")
+        assert response.status_code == 200
+        assert response.text == ""
+
+class TestCountUsers:
+    def test_count_by_credit_card(self):
+        """Test that counts follow creates and deletes"""
+        usersDB.extend([
+            User(username="nocard", password="hashedpass123", email="nocard@example.com", birthdate="1990-01-01"),
+            User(username="blankcard", password="hashedpass123", email="blank@example.com", birthdate="1990-01-01", ccNumber=" "),
+            User(username="withcard", password="hashedpass123", email="card@example.com", birthdate="1990-01-01", ccNumber="1234567890123456")
+        ])
+        response = client.get("/users/count")
+        assert response.status_code == 200
+        assert response.json() == {"total": 3, "withCreditCard": 1, "withoutCreditCard": 2}
+
+        client.delete("/users/delete/withcard")
+        client.delete("/users/delete/nocard")
+        assert client.get("/users/count").json() == {"total": 1, "withCreditCard": 0, "withoutCreditCard": 1}
+        assert [u["username"] for u in client.get("/users/getAll?creditcard=no").json()["users"]] == ["blankcard"]
+
+class TestBulkCreateUsers:
+    def signup(self, username, **overrides):
+        row = {"username": username, "password": "MyPassword123", "email": f"{username}@example.com",
+               "birthdate": "1990-01-01", "ccNumber": None}
+        row.update(overrides)
+        return row
+
+    def test_bulk_create_json_array(self):
+        """Test that a JSON array batch creates every valid user in order"""
+        rows = [self.signup("bulk1"), self.signup("bulk2", ccNumber="1234567890123456")]
+        response = client.post("/users/users/bulkCreate", json=rows)
+        assert response.status_code == 200
+        data = response.json()
+        assert data["created"] == 2 and data["failed"] == 0
+        assert [r["status"] for r in data["results"]] == [201, 201]
+        assert [u.username for u in usersDB] == ["bulk1", "bulk2"]
+        assert verifyPassword("MyPassword123", usersDB.get("bulk1").password)
+        assert usersDB.hasCard("1234567890123456")
+
+    def test_bulk_create_ndjson(self):
+        """Test that an NDJSON body is accepted"""
+        body = "\n".join(json.dumps(self.signup(f"nd{i}")) for i in range(3)) + "\n"
+        response = client.post("/users/users/bulkCreate", content=body,
+                               headers={"Content-Type": "application/x-ndjson"})
+        assert response.status_code == 200
+        assert response.json()["created"] == 3
+        assert len(usersDB) == 3
+
+    def test_bulk_create_per_row_errors(self):
+        """Test that each failing row reports the same error as the single create endpoint"""
+        usersDB.append(User(username="taken", password="hashedpass123", email="taken@example.com", birthdate="1990-01-01"))
+        rows = [
+            self.signup("good"),
+            self.signup("bad_name"),
+            self.signup("taken"),
+            self.signup("weak", password="short"),
+            self.signup("young", birthdate="2020-01-01"),
+            self.signup("good"),
+            {"username": "incomplete"},
+        ]
+        response = client.post("/users/users/bulkCreate", json=rows)
+        data = response.json()
+        assert data["created"] == 1 and data["failed"] == 6
+        assert [(r["index"], r["status"]) for r in data["results"]] == \
+            [(0, 201), (1, 400), (2, 409), (3, 400), (4, 403), (5, 409), (6, 400)]
+        assert data["results"][1]["message"] == "Username must be alphanumeric"
+        assert data["results"][4]["message"] == "User must be at least 18 years old to register"
+        assert data["results"][5]["message"] == "Duplicate username in batch"
+        assert data["results"][6]["username"] == "incomplete"
+        assert sorted(u.username for u in usersDB) == ["good", "taken"]
+
+    def test_trailing_newline_rejected_like_single_create(self):
+        """Test that the bulk and single endpoints both refuse a value with a trailing newline"""
+        rows = [self.signup("nlmail", email="a@b.co\n"), self.signup("nlcard", ccNumber="1234567890123456\n"),
+                self.signup("nldate", birthdate="1990-01-01\n")]
+        results = client.post("/users/users/bulkCreate", json=rows).json()["results"]
+        for row, result in zip(rows, results):
+            single = client.post("/users/users/create", json=row)
+            assert result["status"] == single.status_code == 400
+            assert result["message"] == single.json()["message"]
+        assert len(usersDB) == 0
+
+    def test_bulk_create_malformed_body(self):
+        """Test that a body that is not an array or NDJSON is rejected"""
+        response = client.post("/users/users/bulkCreate", json={"username": "single"})
+        assert response.status_code == 400
+        response = client.post("/users/users/bulkCreate", content="not json",
+                               headers={"Content-Type": "application/x-ndjson"})
+        assert response.status_code == 400
@@ -0,0 +1,123 @@
+import sys
+import os
+import re
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import validation
+from app.validation import *
+from pydantic import ValidationError
+
+from app.models import Payment, User, UserCreate
+from app.utils import validateNewPayment, validateNewPayments, validateNewUser, validateNewUsers
+from app.storage import paymentsDB, usersDB
+
+
+def legacyAgeEligibility(birthdate):
+    """The strptime-based check the validation module replaced"""
+    if re.match(r'^\d{4}-\d{2}-\d{2}$', birthdate) is None:
+        return False
+    return (datetime.now() - datetime.strptime(birthdate, "%Y-%m-%d")).days // 365 >= 18
+
+class TestValidators:
+    def test_patterns(self):
+        """Test the precompiled patterns accept and reject the same values as before"""
+        assert validateEmail("alice.smith@streamly.com")
+        assert not validateEmail("alice@streamly")
+        assert not validateEmail("alice@streamly.com\n")
+        assert not validateCreditCard("1234567890123456\n")
+        assert validateDateFormat("1990-01-01")
+        assert not validateDateFormat("01-01-1990")
+        assert not validateDateFormat("1990-02-30")
+        assert validateCreditCard("1234567890123456")
+        assert not validateCreditCard("123456789012345a")
+
+    def test_parse_date(self):
+        """Test the date parser rejects malformed and impossible dates"""
+        assert parseDate("2024-02-29") == date(2024, 2, 29)
+        assert parseDate("2023-02-29") is None
+        assert parseDate("2023-13-01") is None
+        assert parseDate("20230101") is None
+
+    def test_age_cutoff_matches_legacy_check(self):
+        """Test the cached cutoff gives the same answer as the strptime check around the 18th birthday"""
+        today = date.today()
+        for offset in range(MIN_AGE_DAYS - 3, MIN_AGE_DAYS + 4):
+            birthdate = (today - timedelta(days=offset)).isoformat()
+            assert checkAgeEligibility(birthdate) == legacyAgeEligibility(birthdate)
+        assert not checkAgeEligibility("1990-02-30")
+        assert not checkAgeEligibility("bad")
+
+    def test_age_cutoff_recomputed_after_midnight(self):
+        """Test that a stale cached cutoff is replaced once its day is over"""
+        validation._ageCutoff = (0.0, date.min)
+        assert ageCutoff() == date.today() - timedelta(days=MIN_AGE_DAYS)
+        assert validation._ageCutoff[0] > datetime.now().timestamp()
+
+    def test_batch_forms_match_single(self):
+        """Test every batch validator returns the single validator's result for each value"""
+        cases = [
+            (validateUsernameAlphanumeric, validateUsernameAlphanumericBatch, ["alice", "bob_1", ""]),
+            (validatePasswordChars, validatePasswordCharsBatch, ["MyPassword123", "mypassword", "PASSWORD1"]),
+            (validatePasswordLength, validatePasswordLengthBatch, ["short", "longenough"]),
+            (validateEmail, validateEmailBatch, ["a@b.co", "a@b", "@b.co"]),
+            (validateDateFormat, validateDateFormatBatch, ["1990-01-01", "1990-1-1", "1990-02-30"]),
+            (checkAgeEligibility, checkAgeEligibilityBatch, ["1990-01-01", "2020-01-01", "bad"]),
+            (validateCreditCard, validateCreditCardBatch, ["1234567890123456", "1234"]),
+            (validateAmount, validateAmountBatch, [99, 100, 999, 1000]),
+        ]
+        for single, batch, values in cases:
+            assert batch(values) == [single(value) for value in values]
+
+class TestBatchRules:
+    def test_new_users_batch_matches_single(self):
+        """Test the column-wise user checks report the same first failure as the if/elif chain"""
+        usersDB.clear()
+        usersDB.append(User(username="taken", password="hashedpass123", email="taken@example.com", birthdate="1990-01-01"))
+        users = [
+            User(username=name, password=password, email=email, birthdate=birthdate, ccNumber=card)
+            for name in ["alice", "bad_name", "taken"]
+            for password in ["MyPassword123", "short"]
+            for email in ["alice@example.com", "bad"]
+            for birthdate in ["1990-01-01", "2020-01-01", "1990/01/01"]
+            for card in [None, "1234567890123456", "1234"]
+        ]
+        try:
+            assert validateNewUsers(users, usersDB.existingUsernames(u.username for u in users)) == \
+                [validateNewUser(user) for user in users]
+        finally:
+            usersDB.clear()
+
+    def test_user_create_matches_batch(self):
+        """Test that UserCreate (single signups) and validateNewUsers (bulk) report the same first failure"""
+        bodies = [
+            {"username": name, "password": password, "email": email, "birthdate": birthdate, "ccNumber": card}
+            for name in ["alice", "bad_name"]
+            for password in ["MyPassword123", "short", "longenough"]
+            for email in ["alice@example.com", "bad", "alice@example.com\n"]
+            for birthdate in ["1990-01-01", "2020-01-01", "1990-02-30", "1990-01-01\n"]
+            for card in [None, "", "1234567890123456", "1234", "1234567890123456\n"]
+        ]
+        batch = validateNewUsers([User(**body) for body in bodies], set())
+        for body, expected in zip(bodies, batch):
+            try:
+                UserCreate(**body)
+                single = None
+            except ValidationError as e:
+                failed = {(error["loc"][-1], error["type"]) for error in e.errors()}
+                single = next(error for key, error in SIGNUP_ERRORS.items() if key in failed)
+            assert single == expected, body
+
+    def test_new_payments_batch_matches_single(self):
+        """Test the column-wise payment checks report the same first failure as the if/elif chain"""
+        usersDB.clear()
+        usersDB.append(User(username="payer", password="hashedpass123", email="payer@example.com",
+                            birthdate="1990-01-01", ccNumber="1234567890123456"))
+        payments = [Payment(ccNumber=card, amount=amount)
+                    for card in ["1234567890123456", "9999999999999999", "1234"] for amount in [50, 150]]
+        try:
+            assert validateNewPayments(payments) == [validateNewPayment(payment) for payment in payments]
+        finally:
+            usersDB.clear()
+            paymentsDB.clear()